@@ -2,19 +2,43 @@
 NovaLinq API - Plataforma educativa con IA
 Arquitectura limpia con separación de responsabilidades
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.utils.database import engine, Base
+from fastapi.responses import JSONResponse, ORJSONResponse
+from app.utils.database import engine, ES_SQLITE
+from app.utils.database_async import engine_async
+from app.utils import sqlite_rendimiento, replicas
+from app.utils.migraciones import aplicar_migraciones, verificar_indices
 from app.routes import auth_router, cursos_router, lecciones_router, examenes_router
+from app.services.trabajos_service import iniciar_workers, detener_workers
+from app.services import ai_cache, ai_resiliencia, cache_contenido, pdf_service
+from app.services.upload_service import TAMANO_MAXIMO
 
-# Crear las tablas en la BD al iniciar
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Aplica las migraciones pendientes, avisa de los índices que falten y
+    arranca/detiene el pool de extracción de PDFs y los workers de trabajos en segundo plano
+    """
+    aplicar_migraciones(engine)
+    app.state.indices_faltantes = verificar_indices(engine)
+    pdf_service.iniciar_pool()
+    await iniciar_workers()
+    yield
+    await detener_workers()
+    pdf_service.detener_pool()
+    await cache_contenido.cerrar()
+    await engine_async.dispose()
 
 # Crear aplicación FastAPI
 app = FastAPI(
     title="NovaLinq API",
     description="Plataforma educativa multiplataforma con IA generativa",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    # orjson serializa listas grandes de lecciones y preguntas mucho más rápido que json
+    default_response_class=ORJSONResponse
 )
 
 # Configurar CORS
@@ -24,8 +48,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Siguiente-Cursor", "ETag", "X-Ultima-Escritura"],  # Paginación, revalidación y réplicas
 )
 
+# Margen para los campos del formulario multipart además del PDF
+MARGEN_MULTIPART = 64 * 1024
+
+@app.middleware("http")
+async def limitar_tamano_subidas(request: Request, call_next):
+    """Rechaza subidas que superan el tamaño máximo antes de leer el cuerpo"""
+    longitud = request.headers.get("content-length")
+    if request.method == "POST" and longitud and longitud.isdigit():
+        if int(longitud) > TAMANO_MAXIMO + MARGEN_MULTIPART:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"El PDF supera el tamaño máximo de {TAMANO_MAXIMO // (1024 * 1024)} MB"}
+            )
+    return await call_next(request)
+
 # Registrar routers
 app.include_router(auth_router)
 app.include_router(cursos_router)
@@ -46,3 +86,16 @@ def root():
 def health_check():
     """Verificar estado de la API"""
     return {"status": "healthy", "version": "2.0.0"}
+
+@app.get("/metricas")
+def metricas():
+    """Contadores internos del proceso (cachés y resiliencia de IA) e índices que faltan en la BD"""
+    return {
+        "indices_faltantes": getattr(app.state, "indices_faltantes", None),
+        "ai_cache": ai_cache.estadisticas(),
+        "cache_contenido": cache_contenido.estadisticas(),
+        "ai_resiliencia": ai_resiliencia.estadisticas(),
+        "sqlite_escritura": sqlite_rendimiento.cola_escritura.estadisticas()
+        if ES_SQLITE and sqlite_rendimiento.ALTO_RENDIMIENTO else None,
+        "replicas_lectura": replicas.estadisticas()
+    }
@@ -1,6 +1,14 @@
 """
 Modelos de base de datos SQLAlchemy
 """
-from .database import Usuario, Curso, Leccion, Pregunta, ProgresoLeccion, Progreso
+from .database import (
+    Usuario, Curso, Leccion, Pregunta, ProgresoLeccion, Progreso, TrabajoCurso, CacheGeneracion,
+    CursoContenido, ResumenProgresoCurso, IntentoExamenGuardado,
+    BandaFeedback, MigracionEsquema
+)
 
-__all__ = ["Usuario", "Curso", "Leccion", "Pregunta", "ProgresoLeccion", "Progreso"]
+__all__ = [
+    "Usuario", "Curso", "Leccion", "Pregunta", "ProgresoLeccion", "Progreso", "TrabajoCurso", "CacheGeneracion",
+    "CursoContenido", "ResumenProgresoCurso", "IntentoExamenGuardado",
+    "BandaFeedback", "MigracionEsquema"
+]
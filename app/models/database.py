@@ -1,11 +1,16 @@
 """
 Modelos de base de datos con SQLAlchemy
 """
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, Float, DateTime
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, Float, DateTime, LargeBinary, UniqueConstraint, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.utils.database import Base
 
+# Listas y objetos JSON: JSONB en PostgreSQL, JSON (texto) en SQLite
+JSONCompatible = JSON().with_variant(JSONB(), "postgresql")
+
 # --- 1. TABLA USUARIOS (Compatible con múltiples clientes: móvil, web) ---
 class Usuario(Base):
     __tablename__ = "usuarios"
@@ -30,7 +35,7 @@ class Curso(Base):
     id = Column(Integer, primary_key=True, index=True)
     nombre = Column(String, index=True)
     proveedor = Column(String)
-    contenido_texto = Column(Text)
+    hash_pdf = Column(String(64), index=True, nullable=True)  # SHA-256 del PDF de origen
     
     # Relaciones
     lecciones = relationship("Leccion", back_populates="curso", cascade="all, delete-orphan")
@@ -40,12 +45,12 @@ class Curso(Base):
 class Leccion(Base):
     __tablename__ = "lecciones"
     id = Column(Integer, primary_key=True, index=True)
-    curso_id = Column(Integer, ForeignKey("cursos.id"))
+    curso_id = Column(Integer, ForeignKey("cursos.id"), index=True)
     titulo = Column(String, index=True)
     orden = Column(Integer)
     contenido_markdown = Column(Text)
-    ejemplos_codigo = Column(Text, nullable=True)
-    puntos_clave = Column(Text)
+    ejemplos_codigo = Column(JSONCompatible, nullable=True)
+    puntos_clave = Column(JSONCompatible)
     duracion_estimada = Column(Integer, default=5)
     
     curso = relationship("Curso", back_populates="lecciones")
@@ -55,13 +60,14 @@ class Leccion(Base):
 class Pregunta(Base):
     __tablename__ = "preguntas"
     id = Column(Integer, primary_key=True, index=True)
-    curso_id = Column(Integer, ForeignKey("cursos.id"))
-    leccion_id = Column(Integer, ForeignKey("lecciones.id"), nullable=True)
+    curso_id = Column(Integer, ForeignKey("cursos.id"), index=True)
+    leccion_id = Column(Integer, ForeignKey("lecciones.id"), nullable=True, index=True)
     tipo = Column(String, default="multiple")
     texto_pregunta = Column(Text)
-    opciones_json = Column(Text)
+    opciones_json = Column(JSONCompatible)
     respuesta_correcta = Column(String)
     explicacion_feedback = Column(Text)
+    consejo_estudio = Column(Text, nullable=True)  # Qué repasar si se falla (generado con el examen)
     dificultad = Column(String, default="media")
     
     curso = relationship("Curso", back_populates="preguntas")
@@ -70,9 +76,11 @@ class Pregunta(Base):
 # 5. TABLA PROGRESO DE LECCIONES
 class ProgresoLeccion(Base):
     __tablename__ = "progreso_lecciones"
+    # Una fila por (usuario, lección)
+    __table_args__ = (Index("uq_progreso_lecciones_usuario_leccion", "usuario_id", "leccion_id", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"))
-    leccion_id = Column(Integer, ForeignKey("lecciones.id"))
+    leccion_id = Column(Integer, ForeignKey("lecciones.id"), index=True)
     completada = Column(Boolean, default=False)
     tiempo_dedicado = Column(Integer, default=0)
     fecha_inicio = Column(DateTime(timezone=True), server_default=func.now())
@@ -84,9 +92,11 @@ class ProgresoLeccion(Base):
 # 6. TABLA PROGRESO DE PREGUNTAS (Resultados de pruebas)
 class Progreso(Base):
     __tablename__ = "progreso"
+    # Una fila por (usuario, pregunta): la calificación hace upsert sobre este índice
+    __table_args__ = (Index("uq_progreso_usuario_pregunta", "usuario_id", "pregunta_id", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id")) 
-    pregunta_id = Column(Integer, ForeignKey("preguntas.id"))
+    pregunta_id = Column(Integer, ForeignKey("preguntas.id"), index=True)
     respuesta_elegida = Column(String)
     es_correcto = Column(Boolean)
     intentos = Column(Integer, default=1)
@@ -94,3 +104,88 @@ class Progreso(Base):
     
     estudiante = relationship("Usuario", back_populates="progreso")
     pregunta = relationship("Pregunta", back_populates="intentos")
+
+# 7. TABLA TRABAJOS DE CREACIÓN DE CURSOS (Pipeline PDF -> curso en segundo plano)
+class TrabajoCurso(Base):
+    __tablename__ = "trabajos_cursos"
+    id = Column(String, primary_key=True, index=True)  # UUID en hex
+    nombre = Column(String)
+    proveedor = Column(String)
+    ruta_pdf = Column(String)
+    hash_pdf = Column(String(64), nullable=True)
+    num_lecciones = Column(Integer, default=5)
+    num_preguntas = Column(Integer, default=10)
+    estado = Column(String, default="pendiente", index=True)  # pendiente, en_proceso, completado, fallido
+    etapa = Column(String, default="recibido")  # Última etapa completada: recibido, extraccion, generacion, completado
+    progreso = Column(Integer, default=0)  # 0-100
+    error = Column(Text, nullable=True)
+    intentos = Column(Integer, default=0)
+    curso_id = Column(Integer, ForeignKey("cursos.id"), nullable=True)
+    lecciones_generadas = Column(Integer, nullable=True)  # None = etapa de lecciones pendiente
+    preguntas_generadas = Column(Integer, nullable=True)  # None = etapa de preguntas pendiente
+    bloqueado_hasta = Column(DateTime, nullable=True)  # Lease del worker que lo procesa
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+    fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# 8. TABLA CACHÉ DE GENERACIONES DE IA (Direccionada por contenido)
+class CacheGeneracion(Base):
+    __tablename__ = "cache_generaciones"
+    clave = Column(String(64), primary_key=True)  # SHA-256 de modelo + versión de prompt + texto + parámetros
+    funcion = Column(String)  # lecciones, examen, feedback
+    modelo = Column(String)
+    resultado = Column(JSONCompatible)
+    tamano = Column(Integer, default=0)
+    aciertos = Column(Integer, default=0)
+    fecha_creacion = Column(DateTime, default=datetime.now)
+    ultimo_acceso = Column(DateTime, default=datetime.now, index=True)
+
+# 9. TABLA TEXTO DE ORIGEN DE LOS CURSOS (Comprimido, fuera de la fila de cursos)
+class CursoContenido(Base):
+    __tablename__ = "cursos_contenido"
+    curso_id = Column(Integer, ForeignKey("cursos.id"), primary_key=True)
+    compresion = Column(String(10), default="zlib")
+    texto_comprimido = Column(LargeBinary)
+    tamano_original = Column(Integer, default=0)  # Caracteres del texto sin comprimir
+
+# 10. TABLA RESUMEN DE PROGRESO POR (USUARIO, CURSO) (Se actualiza al completar lecciones)
+class ResumenProgresoCurso(Base):
+    __tablename__ = "resumen_progreso_cursos"
+    __table_args__ = (UniqueConstraint("usuario_id", "curso_id", name="uq_resumen_usuario_curso"),)
+    id = Column(Integer, primary_key=True, index=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), index=True)
+    curso_id = Column(Integer, ForeignKey("cursos.id"), index=True)
+    lecciones_completadas = Column(Integer, default=0)
+    tiempo_total = Column(Integer, default=0)  # Segundos dedicados a las lecciones del curso
+    ultima_actividad = Column(DateTime, nullable=True)
+
+# 11. TABLA INTENTOS DE EXAMEN (Nota inmediata; el feedback de IA se completa después)
+class IntentoExamenGuardado(Base):
+    __tablename__ = "intentos_examen"
+    id = Column(String, primary_key=True, index=True)  # UUID en hex
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), index=True)
+    curso_id = Column(Integer, ForeignKey("cursos.id"), nullable=True, index=True)
+    nota = Column(Integer)
+    correctas = Column(Integer)
+    incorrectas = Column(Integer)
+    temas_fallados = Column(JSONCompatible)
+    detalles = Column(JSONCompatible)
+    estado_feedback = Column(String, default="pendiente")  # pendiente, completado
+    feedback = Column(Text, nullable=True)
+    fecha_creacion = Column(DateTime, default=datetime.now)
+    fecha_feedback = Column(DateTime, nullable=True)
+
+# 12. TABLA MENSAJES DE FEEDBACK POR RANGO DE NOTA (Generados junto con las preguntas del curso)
+class BandaFeedback(Base):
+    __tablename__ = "bandas_feedback"
+    id = Column(Integer, primary_key=True, index=True)
+    curso_id = Column(Integer, ForeignKey("cursos.id"), index=True)
+    nota_minima = Column(Integer)  # El mensaje aplica a notas >= nota_minima (hasta la banda siguiente)
+    mensaje = Column(Text)
+
+# 13. TABLA MIGRACIONES DE ESQUEMA APLICADAS (Ver app/utils/migraciones.py)
+class MigracionEsquema(Base):
+    __tablename__ = "schema_migraciones"
+    version = Column(String(20), primary_key=True)
+    descripcion = Column(String)
+    duracion_ms = Column(Integer, default=0)
+    fecha_aplicada = Column(DateTime, default=datetime.now)
@@ -1,239 +1,186 @@
 """
 Endpoints de gestión de cursos
 """
-import os
-import shutil
-import json
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Response, Header
+from sqlalchemy import select, func, delete, update
 from sqlalchemy.orm import Session
-from app.models.database import Curso, Leccion, Pregunta
-from app.schemas.curso import CursoResponse, CursoDetalle, LeccionSimple
-from app.services.pdf_service import extraer_texto_pdf
-from app.services.ai_service import generar_lecciones_interactivas, generar_examen_dinamico
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import (
+    Curso, Leccion, Pregunta, TrabajoCurso, CursoContenido, ResumenProgresoCurso,
+    IntentoExamenGuardado, BandaFeedback, ProgresoLeccion, Progreso
+)
+from app.schemas.curso import CursoResponse, CursoDetalle, LeccionSimple, EstadisticasCurso
+from app.services.trabajos_service import crear_trabajo, serializar_trabajo
+from app.services.upload_service import guardar_pdf
+from app.services.cache_contenido import obtener_o_cargar_async, responder, invalidar_curso
 from app.utils.database import get_db
+from app.utils.database_async import get_db_async
+from app.utils.replicas import get_db_lectura_async, fijar_contenido, marcar_escritura
 
 router = APIRouter(prefix="/cursos", tags=["Cursos"])
 
-@router.post("/", response_model=dict)
+@router.post("/", response_model=dict, status_code=202)
 async def crear_curso(
     nombre: str = Form(...), 
     proveedor: str = Form(...), 
     archivo: UploadFile = File(...),
     num_lecciones: int = Form(5),
     num_preguntas: int = Form(10),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db_async)
 ):
     """
-    🎯 Crea un curso completo a partir de un PDF.
-    ✅ Extrae texto del PDF
-    ✅ Genera lecciones interactivas con IA
-    ✅ Crea preguntas de evaluación automáticas
+    🎯 Crea un curso completo a partir de un PDF (en segundo plano).
+    ✅ Guarda el PDF y responde de inmediato con el ID del trabajo
+    ✅ Un worker extrae el texto, genera lecciones y preguntas con IA
+    ✅ Consulta el avance en GET /cursos/trabajos/{trabajo_id}
     """
+    # 1. Validar archivo PDF
+    if not archivo.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Solo se aceptan archivos PDF")
+    
+    # 2. Guardar PDF por su hash (valida firma %PDF- y tamaño máximo)
+    guardado = await guardar_pdf(archivo)
+    ruta_pdf = guardado["ruta"]
+    print(f"✅ PDF guardado en: {ruta_pdf}" + (" (ya existía)" if guardado["duplicado"] else ""))
     
     try:
-        # 1. Validar archivo PDF
-        if not archivo.filename.endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Solo se aceptan archivos PDF")
-        
-        # 2. Guardar PDF
-        upload_dir = os.getenv("UPLOAD_DIR", "files")
-        os.makedirs(upload_dir, exist_ok=True)
-        ruta_pdf = f"{upload_dir}/{archivo.filename}"
-        
-        with open(ruta_pdf, "wb") as buffer:
-            shutil.copyfileobj(archivo.file, buffer)
-        
-        print(f"✅ PDF guardado en: {ruta_pdf}")
-        
-        # 3. Extraer texto del PDF
-        try:
-            texto = extraer_texto_pdf(ruta_pdf)
-            if not texto or len(texto) < 100:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="El PDF no contiene texto suficiente o no se pudo extraer"
-                )
-            print(f"✅ Texto extraído: {len(texto)} caracteres")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error extrayendo texto del PDF: {str(e)}")
-        
-        # 4. Crear curso en BD
-        nuevo_curso = Curso(
-            nombre=nombre, 
-            proveedor=proveedor, 
-            contenido_texto=texto  # Guardar texto completo para regenerar exámenes
+        # 3. Registrar el trabajo; extracción, generación y guardado corren en los workers
+        trabajo = await crear_trabajo(
+            db,
+            nombre=nombre,
+            proveedor=proveedor,
+            ruta_pdf=ruta_pdf,
+            num_lecciones=num_lecciones,
+            num_preguntas=num_preguntas,
+            hash_pdf=guardado["sha256"]
         )
-        db.add(nuevo_curso)
-        db.commit()
-        db.refresh(nuevo_curso)
-        print(f"✅ Curso creado con ID: {nuevo_curso.id}")
-        
-        lecciones_creadas = []
-        preguntas_creadas = []
         
-        # 5. Generar lecciones interactivas con IA
-        try:
-            print(f"🤖 Generando {num_lecciones} lecciones con IA...")
-            lecciones_generadas = generar_lecciones_interactivas(texto, num_lecciones=num_lecciones)
-            
-            if not lecciones_generadas or len(lecciones_generadas) == 0:
-                print("⚠️ No se generaron lecciones")
-            else:
-                for lec in lecciones_generadas:
-                    nueva_leccion = Leccion(
-                        curso_id=nuevo_curso.id,
-                        titulo=lec.get("titulo", "Sin título"),
-                        orden=lec.get("orden", 1),
-                        contenido_markdown=lec.get("contenido_markdown", ""),
-                        ejemplos_codigo=json.dumps(lec.get("ejemplos_codigo", [])),
-                        puntos_clave=json.dumps(lec.get("puntos_clave", [])),
-                        duracion_estimada=lec.get("duracion_estimada", 5)
-                    )
-                    db.add(nueva_leccion)
-                    lecciones_creadas.append(nueva_leccion)
-                
-                db.commit()
-                print(f"✅ {len(lecciones_creadas)} lecciones guardadas")
-        
-        except Exception as e:
-            print(f"⚠️ Error generando lecciones: {str(e)}")
-            # Continuar aunque falle la generación de lecciones
-        
-        # 6. Generar preguntas de evaluación con IA
-        try:
-            print(f"🤖 Generando {num_preguntas} preguntas con IA...")
-            preguntas_generadas = generar_examen_dinamico(texto, cantidad=num_preguntas)
-            
-            if not preguntas_generadas or len(preguntas_generadas) == 0:
-                print("⚠️ No se generaron preguntas")
-            else:
-                for p in preguntas_generadas:
-                    nueva_pregunta = Pregunta(
-                        curso_id=nuevo_curso.id,
-                        tipo=p.get("tipo", "multiple"),
-                        texto_pregunta=p.get("pregunta", ""),
-                        opciones_json=json.dumps(p.get("opciones", [])),
-                        respuesta_correcta=p.get("correcta", ""),
-                        explicacion_feedback=p.get("explicacion", ""),
-                        dificultad=p.get("dificultad", "media")
-                    )
-                    db.add(nueva_pregunta)
-                    preguntas_creadas.append(nueva_pregunta)
-                
-                db.commit()
-                print(f"✅ {len(preguntas_creadas)} preguntas guardadas")
-        
-        except Exception as e:
-            print(f"⚠️ Error generando preguntas: {str(e)}")
-            # Continuar aunque falle la generación de preguntas
-        
-        # 7. Respuesta final
         return {
-            "mensaje": "✅ Curso creado exitosamente con IA",
-            "curso": {
-                "id": nuevo_curso.id,
-                "nombre": nuevo_curso.nombre,
-                "proveedor": nuevo_curso.proveedor
-            },
-            "estadisticas": {
-                "lecciones_generadas": len(lecciones_creadas),
-                "preguntas_generadas": len(preguntas_creadas),
-                "caracteres_extraidos": len(texto)
-            },
-            "lecciones": [
-                {
-                    "id": l.id,
-                    "titulo": l.titulo,
-                    "orden": l.orden,
-                    "duracion_estimada": l.duracion_estimada
-                } for l in lecciones_creadas
-            ],
-            "archivo_pdf": ruta_pdf
+            "mensaje": "⏳ Curso en proceso de creación",
+            "trabajo_id": trabajo.id,
+            "estado": trabajo.estado,
+            "url_estado": f"/cursos/trabajos/{trabajo.id}",
+            "archivo_pdf": ruta_pdf,
+            "sha256": guardado["sha256"],
+            "pdf_duplicado": guardado["duplicado"]
         }
     
-    except HTTPException:
-        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, 
             detail=f"Error creando curso: {str(e)}"
         )
 
-@router.get("/", response_model=list)
-def listar_cursos(db: Session = Depends(get_db)):
-    """Lista todos los cursos disponibles"""
-    cursos = db.query(Curso).all()
+@router.get("/trabajos/{trabajo_id}", response_model=dict)
+def obtener_trabajo(trabajo_id: str, db: Session = Depends(get_db)):
+    """Consulta la etapa, el progreso y los errores de un trabajo de creación de curso"""
+    trabajo = db.query(TrabajoCurso).filter(TrabajoCurso.id == trabajo_id).first()
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
     
-    resultado = []
-    for curso in cursos:
-        num_lecciones = db.query(Leccion).filter(Leccion.curso_id == curso.id).count()
-        num_preguntas = db.query(Pregunta).filter(Pregunta.curso_id == curso.id).count()
-        
-        resultado.append({
-            "id": curso.id,
-            "nombre": curso.nombre,
-            "proveedor": curso.proveedor,
-            "num_lecciones": num_lecciones,
-            "num_preguntas": num_preguntas
-        })
-    
-    return resultado
+    return serializar_trabajo(trabajo)
 
-@router.get("/{curso_id}", response_model=dict)
-def obtener_curso(curso_id: int, db: Session = Depends(get_db)):
-    """Obtiene información detallada de un curso"""
-    curso = db.query(Curso).filter(Curso.id == curso_id).first()
-    if not curso:
-        raise HTTPException(status_code=404, detail="Curso no encontrado")
+@router.get("/", response_model=List[CursoResponse])
+async def listar_cursos(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="ID del último curso de la página anterior"),
+    limite: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db_lectura_async)
+):
+    """
+    Lista los cursos disponibles por páginas (paginación por clave, ordenada por ID).
+    Si hay más resultados, la cabecera X-Siguiente-Cursor trae el valor de `cursor`
+    para pedir la página siguiente.
+    """
+    # Una sola consulta: la página de cursos unida a los conteos
+    # agrupados de lecciones y preguntas de esos cursos
+    pagina = select(Curso.id, Curso.nombre, Curso.proveedor).order_by(Curso.id).limit(limite + 1)
+    if cursor is not None:
+        pagina = pagina.where(Curso.id > cursor)
+    pagina = pagina.subquery()
     
-    lecciones = db.query(Leccion).filter(Leccion.curso_id == curso.id).order_by(Leccion.orden).all()
-    num_preguntas = db.query(Pregunta).filter(Pregunta.curso_id == curso.id).count()
+    ids_pagina = select(pagina.c.id)
+    lecciones = (
+        select(Leccion.curso_id, func.count(Leccion.id).label("total"))
+        .where(Leccion.curso_id.in_(ids_pagina)).group_by(Leccion.curso_id).subquery()
+    )
+    preguntas = (
+        select(Pregunta.curso_id, func.count(Pregunta.id).label("total"))
+        .where(Pregunta.curso_id.in_(ids_pagina)).group_by(Pregunta.curso_id).subquery()
+    )
+    consulta = (
+        select(
+            pagina.c.id, pagina.c.nombre, pagina.c.proveedor,
+            func.coalesce(lecciones.c.total, 0).label("num_lecciones"),
+            func.coalesce(preguntas.c.total, 0).label("num_preguntas")
+        )
+        .outerjoin(lecciones, lecciones.c.curso_id == pagina.c.id)
+        .outerjoin(preguntas, preguntas.c.curso_id == pagina.c.id)
+        .order_by(pagina.c.id)
+    )
+    
+    filas = (await db.execute(consulta)).all()
+    if len(filas) > limite:
+        filas = filas[:limite]
+        response.headers["X-Siguiente-Cursor"] = str(filas[-1].id)
     
-    lecciones_data = [
+    return [
         {
-            "id": lec.id,
-            "titulo": lec.titulo,
-            "orden": lec.orden,
-            "duracion_estimada": lec.duracion_estimada
+            "id": fila.id,
+            "nombre": fila.nombre,
+            "proveedor": fila.proveedor,
+            "num_lecciones": fila.num_lecciones,
+            "num_preguntas": fila.num_preguntas
         }
-        for lec in lecciones
+        for fila in filas
     ]
+
+@router.get("/{curso_id}", response_model=CursoDetalle)
+async def obtener_curso(curso_id: int, db: AsyncSession = Depends(get_db_lectura_async),
+                        if_none_match: Optional[str] = Header(None)):
+    """Obtiene información detallada de un curso (servida desde la caché de contenido)"""
+    async def cargar():
+        curso = await db.get(Curso, curso_id)
+        if not curso:
+            raise HTTPException(status_code=404, detail="Curso no encontrado")
+        
+        # Solo las columnas del listado: el contenido de las lecciones no hace falta aquí
+        lecciones = (await db.execute(
+            select(Leccion.id, Leccion.titulo, Leccion.orden, Leccion.duracion_estimada)
+            .where(Leccion.curso_id == curso.id).order_by(Leccion.orden)
+        )).all()
+        num_preguntas = await db.scalar(select(func.count(Pregunta.id)).where(Pregunta.curso_id == curso.id))
+        
+        return CursoDetalle(
+            id=curso.id,
+            nombre=curso.nombre,
+            proveedor=curso.proveedor,
+            lecciones=[LeccionSimple.model_validate(lec) for lec in lecciones],
+            estadisticas=EstadisticasCurso(total_lecciones=len(lecciones), total_preguntas=num_preguntas)
+        ).model_dump()
     
-    return {
-        "id": curso.id,
-        "nombre": curso.nombre,
-        "proveedor": curso.proveedor,
-        "lecciones": lecciones_data,
-        "estadisticas": {
-            "total_lecciones": len(lecciones),
-            "total_preguntas": num_preguntas
-        }
-    }
+    return responder(await obtener_o_cargar_async(curso_id, "curso", cargar), if_none_match)
 
 @router.delete("/{curso_id}", response_model=dict)
-def eliminar_curso(curso_id: int, db: Session = Depends(get_db)):
+async def eliminar_curso(curso_id: int, response: Response, db: AsyncSession = Depends(get_db_async)):
     """
     🗑️ Elimina un curso y TODOS sus datos relacionados en cascada:
     - Lecciones del curso
     - Preguntas del examen
-    - Progreso de lecciones de estudiantes
+    - Progreso de lecciones de estudiantes (y sus resúmenes por curso)
     - Progreso de exámenes de estudiantes
     """
-    from app.models.database import ProgresoLeccion, Progreso
-    
     # Verificar que el curso existe
-    curso = db.query(Curso).filter(Curso.id == curso_id).first()
+    curso = await db.get(Curso, curso_id)
     if not curso:
         raise HTTPException(status_code=404, detail="Curso no encontrado")
     
     try:
         # Obtener IDs de lecciones y preguntas antes de eliminar
-        lecciones = db.query(Leccion).filter(Leccion.curso_id == curso_id).all()
-        preguntas = db.query(Pregunta).filter(Pregunta.curso_id == curso_id).all()
-        
-        lecciones_ids = [lec.id for lec in lecciones]
-        preguntas_ids = [preg.id for preg in preguntas]
+        lecciones_ids = list(await db.scalars(select(Leccion.id).where(Leccion.curso_id == curso_id)))
+        preguntas_ids = list(await db.scalars(select(Pregunta.id).where(Pregunta.curso_id == curso_id)))
         
         num_lecciones = len(lecciones_ids)
         num_preguntas = len(preguntas_ids)
@@ -241,31 +188,45 @@ def eliminar_curso(curso_id: int, db: Session = Depends(get_db)):
         # 1. Eliminar progreso de lecciones (usando leccion_id)
         num_progreso_lecciones = 0
         if lecciones_ids:
-            num_progreso_lecciones = db.query(ProgresoLeccion).filter(
-                ProgresoLeccion.leccion_id.in_(lecciones_ids)
-            ).delete(synchronize_session=False)
+            num_progreso_lecciones = (await db.execute(
+                delete(ProgresoLeccion).where(ProgresoLeccion.leccion_id.in_(lecciones_ids))
+            )).rowcount
         print(f"🗑️ Eliminados {num_progreso_lecciones} registros de progreso de lecciones")
+        await db.execute(delete(ResumenProgresoCurso).where(ResumenProgresoCurso.curso_id == curso_id))
         
         # 2. Eliminar progreso de exámenes (usando pregunta_id)
         num_progreso_examenes = 0
         if preguntas_ids:
-            num_progreso_examenes = db.query(Progreso).filter(
-                Progreso.pregunta_id.in_(preguntas_ids)
-            ).delete(synchronize_session=False)
+            num_progreso_examenes = (await db.execute(
+                delete(Progreso).where(Progreso.pregunta_id.in_(preguntas_ids))
+            )).rowcount
         print(f"🗑️ Eliminados {num_progreso_examenes} registros de progreso de exámenes")
         
         # 3. Eliminar lecciones
-        db.query(Leccion).filter(Leccion.curso_id == curso_id).delete()
+        await db.execute(delete(Leccion).where(Leccion.curso_id == curso_id))
         print(f"🗑️ Eliminadas {num_lecciones} lecciones")
         
-        # 4. Eliminar preguntas
-        db.query(Pregunta).filter(Pregunta.curso_id == curso_id).delete()
+        # 4. Eliminar preguntas y mensajes de feedback por rango de nota
+        await db.execute(delete(Pregunta).where(Pregunta.curso_id == curso_id))
+        await db.execute(delete(BandaFeedback).where(BandaFeedback.curso_id == curso_id))
         print(f"🗑️ Eliminadas {num_preguntas} preguntas")
         
-        # 5. Eliminar el curso
+        # 5. Desvincular los trabajos de creación y los intentos de examen que apuntan al curso
+        await db.execute(update(TrabajoCurso).where(TrabajoCurso.curso_id == curso_id).values(curso_id=None))
+        await db.execute(
+            update(IntentoExamenGuardado).where(IntentoExamenGuardado.curso_id == curso_id).values(curso_id=None)
+        )
+        
+        # 6. Eliminar el texto de origen
+        await db.execute(delete(CursoContenido).where(CursoContenido.curso_id == curso_id))
+        
+        # 7. Eliminar el curso
         nombre_curso = curso.nombre
-        db.delete(curso)
-        db.commit()
+        await db.delete(curso)
+        await db.commit()
+        await invalidar_curso(curso_id)
+        fijar_contenido()
+        marcar_escritura(response)
         print(f"✅ Curso '{nombre_curso}' eliminado completamente")
         
         return {
@@ -280,7 +241,7 @@ def eliminar_curso(curso_id: int, db: Session = Depends(get_db)):
         }
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Error eliminando curso: {str(e)}"
@@ -1,153 +1,207 @@
 """
 Endpoints de exámenes y evaluaciones
 """
-import json
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.models.database import Pregunta, Progreso, Usuario, Curso, Leccion
+import os
+import time
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import Pregunta, Usuario, Curso, Leccion, IntentoExamenGuardado
 from app.schemas.leccion import QuizResponse, IntentoExamen, ResultadoExamen, PreguntaQuiz
-from app.services.ai_service import generar_feedback_final, generar_examen_dinamico
-from app.utils.database import get_db
+from app.services.generacion_fragmentada import generar_examen_fragmentado
+from app.services.ai_service import generar_mensajes_bandas
+from app.services.curso_service import obtener_texto_curso_async, pregunta_desde_ia, reemplazar_bandas_async
+from app.services.calificacion_service import calificar_respuestas_async, guardar_progreso_async
+from app.services.feedback_service import (
+    crear_intento_async, programar_feedback, rescatar_si_huerfano, esperar_feedback, serializar_intento,
+    obtener_bandas_async, componer_feedback, FEEDBACK_IA
+)
+from app.services.cache_contenido import (
+    obtener_o_cargar_async, obtener_o_cargar_leccion_async, responder, invalidar_curso
+)
+from app.utils.database_async import get_db_async, AsyncSessionLocal
+from app.utils.replicas import get_db_lectura_async, fijar_contenido, marcar_escritura
+from app.utils.sse import evento_sse, CABECERAS_SSE
 
 router = APIRouter(prefix="/examenes", tags=["Exámenes"])
 
-@router.get("/leccion/{leccion_id}/quiz", response_model=dict)
-def obtener_quiz_leccion(leccion_id: int, db: Session = Depends(get_db)):
+# Tiempo máximo que el stream de feedback espera antes de cerrarse
+ESPERA_MAXIMA_FEEDBACK = float(os.getenv("FEEDBACK_ESPERA_MAXIMA", "60"))
+
+def _pregunta_quiz(p: Pregunta) -> PreguntaQuiz:
+    """Pregunta tal como se envía al estudiante (sin la respuesta correcta)"""
+    return PreguntaQuiz(
+        id=p.id,
+        tipo=p.tipo,
+        pregunta=p.texto_pregunta,
+        opciones=p.opciones_json or [],
+        dificultad=p.dificultad
+    )
+
+@router.get("/leccion/{leccion_id}/quiz", response_model=QuizResponse)
+async def obtener_quiz_leccion(leccion_id: int, db: AsyncSession = Depends(get_db_lectura_async),
+                               if_none_match: Optional[str] = Header(None)):
     """
     Devuelve las preguntas asociadas a una lección específica.
     """
-    leccion = db.query(Leccion).filter(Leccion.id == leccion_id).first()
-    if not leccion:
-        raise HTTPException(status_code=404, detail="Lección no encontrada")
-    
-    preguntas = db.query(Pregunta).filter(Pregunta.leccion_id == leccion_id).all()
-    
-    # Si no hay preguntas asociadas a la lección, buscar del curso
-    if not preguntas:
-        preguntas = db.query(Pregunta).filter(Pregunta.curso_id == leccion.curso_id).all()
-    
-    resultado = []
-    for p in preguntas:
-        resultado.append({
-            "id": p.id,
-            "tipo": p.tipo,
-            "pregunta": p.texto_pregunta,
-            "opciones": json.loads(p.opciones_json),
-            "dificultad": p.dificultad
-        })
+    async def cargar():
+        leccion = await db.get(Leccion, leccion_id)
+        if not leccion:
+            raise HTTPException(status_code=404, detail="Lección no encontrada")
+        
+        preguntas = (await db.scalars(select(Pregunta).where(Pregunta.leccion_id == leccion_id))).all()
+        
+        # Si no hay preguntas asociadas a la lección, buscar del curso
+        if not preguntas:
+            preguntas = (await db.scalars(select(Pregunta).where(Pregunta.curso_id == leccion.curso_id))).all()
+        
+        return leccion.curso_id, QuizResponse(
+            leccion_id=leccion_id,
+            titulo_leccion=leccion.titulo,
+            preguntas=[_pregunta_quiz(p) for p in preguntas]
+        ).model_dump()
     
-    return {
-        "leccion_id": leccion_id,
-        "titulo_leccion": leccion.titulo,
-        "preguntas": resultado
-    }
+    contenido = await obtener_o_cargar_leccion_async(leccion_id, f"quiz_leccion:{leccion_id}", cargar)
+    return responder(contenido, if_none_match)
 
-@router.get("/curso/{curso_id}/quiz", response_model=list)
-def obtener_quiz_curso(curso_id: int, db: Session = Depends(get_db)):
+@router.get("/curso/{curso_id}/quiz", response_model=List[PreguntaQuiz])
+async def obtener_quiz_curso(curso_id: int, db: AsyncSession = Depends(get_db_lectura_async),
+                             if_none_match: Optional[str] = Header(None)):
     """
     Devuelve todas las preguntas del curso para realizar la prueba.
     """
-    preguntas = db.query(Pregunta).filter(Pregunta.curso_id == curso_id).all()
+    async def cargar():
+        preguntas = await db.scalars(select(Pregunta).where(Pregunta.curso_id == curso_id))
+        return [_pregunta_quiz(p).model_dump() for p in preguntas]
     
-    resultado = []
-    for p in preguntas:
-        resultado.append({
-            "id": p.id,
-            "tipo": p.tipo,
-            "pregunta": p.texto_pregunta,
-            "opciones": json.loads(p.opciones_json),
-            "dificultad": p.dificultad
-        })
-    return resultado
+    return responder(await obtener_o_cargar_async(curso_id, "quiz", cargar), if_none_match)
 
 @router.post("/calificar", response_model=dict)
-def calificar_examen(intento: IntentoExamen, db: Session = Depends(get_db)):
+async def calificar_examen(intento: IntentoExamen, response: Response, feedback_ia: Optional[bool] = None,
+                           db: AsyncSession = Depends(get_db_async)):
     """
-    Califica todas las respuestas del examen y da feedback con IA.
-    Guarda el progreso del estudiante.
+    Califica todas las respuestas del examen y guarda el progreso del estudiante.
+    El feedback se compone al instante con los consejos generados junto al examen.
+    Con feedback_ia=true (o FEEDBACK_IA=true) lo escribe el modelo en segundo plano:
+    consúltalo en url_feedback (o en url_feedback_stream por SSE).
     """
     # Extraer usuario_id de las respuestas si está presente
     # El schema debe incluir usuario_id
     if not hasattr(intento, 'usuario_id'):
         raise HTTPException(status_code=400, detail="Falta usuario_id en el intento")
     
-    usuario = db.query(Usuario).filter(Usuario.id == intento.usuario_id).first()
-    if not usuario:
+    usuario_existe = await db.scalar(select(Usuario.id).where(Usuario.id == intento.usuario_id))
+    if usuario_existe is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    puntaje = 0
-    total = 0
-    temas_fallados = []
-    detalles = []
+    # Una consulta para todas las preguntas y un upsert para todo el progreso
+    calificacion = await calificar_respuestas_async(db, intento.respuestas)
+    await guardar_progreso_async(db, intento.usuario_id, calificacion["resultados"])
     
-    for preg_id, resp_usuario in intento.respuestas.items():
-        pregunta = db.query(Pregunta).filter(Pregunta.id == preg_id).first()
-        
-        if pregunta:
-            total += 1
-            correcta = pregunta.respuesta_correcta.lower().strip()
-            respuesta_normalizada = resp_usuario.lower().strip()
-            
-            es_correcto = (correcta == respuesta_normalizada)
-            
-            if es_correcto:
-                puntaje += 1
-            else:
-                temas_fallados.append(pregunta.texto_pregunta)
-            
-            detalles.append({
-                "pregunta": pregunta.texto_pregunta,
-                "respuesta_usuario": resp_usuario,
-                "respuesta_correcta": pregunta.respuesta_correcta,
-                "correcto": es_correcto,
-                "explicacion": pregunta.explicacion_feedback
-            })
-            
-            # Guardar progreso
-            progreso_existente = db.query(Progreso).filter(
-                Progreso.usuario_id == intento.usuario_id,
-                Progreso.pregunta_id == preg_id
-            ).first()
-            
-            if progreso_existente:
-                progreso_existente.intentos += 1
-                progreso_existente.respuesta_elegida = resp_usuario
-                progreso_existente.es_correcto = es_correcto
-            else:
-                nuevo_progreso = Progreso(
-                    usuario_id=intento.usuario_id,
-                    pregunta_id=preg_id,
-                    respuesta_elegida=resp_usuario,
-                    es_correcto=es_correcto
-                )
-                db.add(nuevo_progreso)
+    puntaje = calificacion["puntaje"]
+    total = calificacion["total"]
+    nota_final = int((puntaje / total) * 100) if total > 0 else 0
     
-    db.commit()
+    usar_ia = FEEDBACK_IA if feedback_ia is None else feedback_ia
+    feedback = None
+    if not usar_ia:
+        bandas = await obtener_bandas_async(db, calificacion["curso_id"])
+        feedback = componer_feedback(nota_final, calificacion["consejos"], bandas)
     
-    nota_final = int((puntaje / total) * 100) if total > 0 else 0
-    feedback_ia = generar_feedback_final(nota_final, temas_fallados)
+    # El intento se guarda con la nota en la misma transacción que el progreso
+    registro = await crear_intento_async(db, intento.usuario_id, calificacion, nota_final, feedback=feedback)
+    await db.commit()
+    marcar_escritura(response)
+    if usar_ia:
+        programar_feedback(registro.id, nota_final, calificacion["temas_fallados"])
     
     return {
+        "intento_id": registro.id,
         "nota": nota_final,
         "correctas": puntaje,
         "incorrectas": total - puntaje,
-        "feedback": feedback_ia,
-        "detalles": detalles
+        "feedback": feedback,
+        "estado_feedback": registro.estado_feedback,
+        "url_feedback": f"/examenes/intentos/{registro.id}",
+        "url_feedback_stream": f"/examenes/intentos/{registro.id}/feedback/stream",
+        "detalles": calificacion["detalles"]
     }
 
+async def _obtener_intento(db: AsyncSession, intento_id: str) -> IntentoExamenGuardado:
+    registro = await db.get(IntentoExamenGuardado, intento_id)
+    if not registro:
+        raise HTTPException(status_code=404, detail="Intento no encontrado")
+    return registro
+
+@router.get("/intentos/{intento_id}", response_model=dict)
+async def obtener_intento(intento_id: str, db: AsyncSession = Depends(get_db_async)):
+    """
+    Resultado guardado de un intento, con su feedback cuando esté listo
+    (estado_feedback: pendiente o completado). Pensado para sondeo.
+    """
+    # En el event loop: rescatar_si_huerfano puede lanzar la tarea de feedback
+    registro = await _obtener_intento(db, intento_id)
+    rescatar_si_huerfano(registro)
+    return serializar_intento(registro)
+
+async def _stream_feedback(intento_id: str):
+    """Envía el feedback en cuanto esté guardado; mientras tanto, eventos de espera"""
+    limite = time.monotonic() + ESPERA_MAXIMA_FEEDBACK
+    while True:
+        async with AsyncSessionLocal() as db:
+            registro = await db.get(IntentoExamenGuardado, intento_id)
+            estado = registro.estado_feedback if registro else None
+            feedback = registro.feedback if registro else None
+            nota = registro.nota if registro else None
+        
+        if registro is None:
+            yield evento_sse("error", {"detalle": "Intento no encontrado"})
+            return
+        if estado == "completado":
+            yield evento_sse("feedback", {"intento_id": intento_id, "nota": nota, "feedback": feedback})
+            return
+        if time.monotonic() >= limite:
+            yield evento_sse("error", {"detalle": "El feedback sigue en preparación, consulta más tarde",
+                                       "url_feedback": f"/examenes/intentos/{intento_id}"})
+            return
+        
+        yield evento_sse("pendiente", {"intento_id": intento_id})
+        await esperar_feedback(intento_id, timeout=min(5, max(limite - time.monotonic(), 0)))
+
+@router.get("/intentos/{intento_id}/feedback/stream")
+async def feedback_en_vivo(intento_id: str, db: AsyncSession = Depends(get_db_async)):
+    """
+    📡 Envía por Server-Sent Events el feedback del intento en cuanto se genera.
+    Eventos: pendiente, feedback, error.
+    """
+    registro = await _obtener_intento(db, intento_id)
+    rescatar_si_huerfano(registro)
+    
+    return StreamingResponse(
+        _stream_feedback(intento_id),
+        media_type="text/event-stream",
+        headers=CABECERAS_SSE
+    )
+
 @router.post("/curso/{curso_id}/regenerar", response_model=dict)
-def generar_reintento(curso_id: int, cantidad: int = 10, db: Session = Depends(get_db)):
+async def generar_reintento(curso_id: int, response: Response, cantidad: int = 10, nuevas: bool = False,
+                            db: AsyncSession = Depends(get_db_async)):
     """
     🔄 Regenera nuevas preguntas para el curso.
     Útil cuando el estudiante quiere volver a practicar con preguntas diferentes.
+    Con nuevas=true se ignora la caché de IA y se pide un examen distinto al modelo.
     """
     # Verificar que el curso existe
-    curso = db.query(Curso).filter(Curso.id == curso_id).first()
+    curso = await db.get(Curso, curso_id)
     if not curso:
         raise HTTPException(status_code=404, detail="Curso no encontrado")
     
     # Verificar que hay contenido
-    if not curso.contenido_texto:
+    texto = await obtener_texto_curso_async(db, curso_id)
+    if not texto:
         raise HTTPException(
             status_code=400, 
             detail="El curso no tiene contenido. Sube un PDF primero."
@@ -155,17 +209,20 @@ def generar_reintento(curso_id: int, cantidad: int = 10, db: Session = Depends(g
     
     try:
         # Eliminar preguntas antiguas
-        preguntas_viejas = db.query(Pregunta).filter(Pregunta.curso_id == curso_id).all()
+        preguntas_viejas = (await db.scalars(select(Pregunta).where(Pregunta.curso_id == curso_id))).all()
         num_eliminadas = len(preguntas_viejas)
         
         for p in preguntas_viejas:
-            db.delete(p)
+            await db.delete(p)
         
         print(f"🗑️ Eliminadas {num_eliminadas} preguntas antiguas")
         
-        # Generar nuevas preguntas con IA
+        # Generar nuevas preguntas con IA (y los mensajes por rango de nota del curso)
         print(f"🤖 Generando {cantidad} nuevas preguntas...")
-        nuevas_preguntas = generar_examen_dinamico(curso.contenido_texto, cantidad=cantidad)
+        nuevas_preguntas, bandas = await asyncio.gather(
+            generar_examen_fragmentado(texto, cantidad=cantidad, usar_cache=not nuevas),
+            generar_mensajes_bandas(texto, usar_cache=not nuevas)
+        )
         
         if not nuevas_preguntas:
             raise HTTPException(
@@ -176,47 +233,31 @@ def generar_reintento(curso_id: int, cantidad: int = 10, db: Session = Depends(g
         # Guardar nuevas preguntas
         preguntas_creadas = []
         for p in nuevas_preguntas:
-            nueva = Pregunta(
-                curso_id=curso_id,
-                tipo=p.get("tipo", "multiple"),
-                texto_pregunta=p.get("pregunta", ""),
-                opciones_json=json.dumps(p.get("opciones", [])),
-                respuesta_correcta=p.get("correcta", ""),
-                explicacion_feedback=p.get("explicacion", ""),
-                dificultad=p.get("dificultad", "media")
-            )
+            nueva = pregunta_desde_ia(curso_id, p)
             db.add(nueva)
             preguntas_creadas.append(nueva)
+        await reemplazar_bandas_async(db, curso_id, bandas)
         
-        db.commit()
+        # Sin expire_on_commit los IDs asignados en el flush siguen cargados: no hace falta refresh
+        await db.commit()
+        await invalidar_curso(curso_id)
+        fijar_contenido()
+        marcar_escritura(response)
         print(f"✅ {len(preguntas_creadas)} nuevas preguntas guardadas")
         
-        # Refrescar para obtener IDs
-        for p in preguntas_creadas:
-            db.refresh(p)
-        
         return {
             "mensaje": "✅ Examen regenerado exitosamente",
             "curso_id": curso_id,
             "curso_nombre": curso.nombre,
             "preguntas_eliminadas": num_eliminadas,
             "preguntas_generadas": len(preguntas_creadas),
-            "preguntas": [
-                {
-                    "id": p.id,
-                    "tipo": p.tipo,
-                    "pregunta": p.texto_pregunta,
-                    "opciones": json.loads(p.opciones_json),
-                    "dificultad": p.dificultad
-                }
-                for p in preguntas_creadas
-            ]
+            "preguntas": [_pregunta_quiz(p).model_dump() for p in preguntas_creadas]
         }
     
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error regenerando examen: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -1,111 +1,152 @@
 """
 Endpoints de lecciones y progreso
 """
-import json
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, and_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from app.models.database import Leccion, ProgresoLeccion, Curso
+from app.models.database import Leccion, ProgresoLeccion, Curso, ResumenProgresoCurso
 from app.schemas.leccion import LeccionDetalle, MarcarLeccionCompletada, ProgresoResponse
-from app.utils.database import get_db
+from app.services.ai_service import generar_lecciones_stream
+from app.services.curso_service import leccion_desde_ia, obtener_texto_curso_async
+from app.services.progreso_service import registrar_actividad_async
+from app.services.cache_contenido import (
+    obtener_o_cargar_async, obtener_o_cargar_leccion_async, responder, invalidar_curso
+)
+from app.utils.database_async import get_db_async, AsyncSessionLocal
+from app.utils.replicas import get_db_lectura_async, fijar_contenido, marcar_escritura
+from app.utils.sse import evento_sse, CABECERAS_SSE
 
 router = APIRouter(prefix="/lecciones", tags=["Lecciones"])
 
-@router.get("/{leccion_id}", response_model=dict)
-def obtener_leccion(leccion_id: int, db: Session = Depends(get_db)):
+def _leccion_detalle(lec: Leccion) -> LeccionDetalle:
+    return LeccionDetalle(
+        id=lec.id,
+        titulo=lec.titulo,
+        orden=lec.orden,
+        contenido=lec.contenido_markdown,
+        ejemplos=lec.ejemplos_codigo or [],
+        puntos_clave=lec.puntos_clave or [],
+        duracion_minutos=lec.duracion_estimada
+    )
+
+@router.get("/{leccion_id}", response_model=LeccionDetalle)
+async def obtener_leccion(leccion_id: int, db: AsyncSession = Depends(get_db_lectura_async),
+                          if_none_match: Optional[str] = Header(None)):
     """
     Devuelve el contenido detallado de una lección.
     Incluye contenido markdown, ejemplos de código y puntos clave.
     """
-    leccion = db.query(Leccion).filter(Leccion.id == leccion_id).first()
-    
-    if not leccion:
-        raise HTTPException(status_code=404, detail="Lección no encontrada")
+    async def cargar():
+        leccion = await db.get(Leccion, leccion_id)
+        
+        if not leccion:
+            raise HTTPException(status_code=404, detail="Lección no encontrada")
+        
+        return leccion.curso_id, _leccion_detalle(leccion).model_dump()
     
-    return {
-        "id": leccion.id,
-        "titulo": leccion.titulo,
-        "contenido": leccion.contenido_markdown,
-        "ejemplos": json.loads(leccion.ejemplos_codigo) if leccion.ejemplos_codigo else [],
-        "puntos_clave": json.loads(leccion.puntos_clave) if leccion.puntos_clave else [],
-        "duracion_minutos": leccion.duracion_estimada,
-        "orden": leccion.orden
-    }
+    contenido = await obtener_o_cargar_leccion_async(leccion_id, f"leccion:{leccion_id}", cargar)
+    return responder(contenido, if_none_match)
 
 @router.post("/completar", response_model=dict)
-def marcar_leccion_completada(datos: MarcarLeccionCompletada, db: Session = Depends(get_db)):
+async def marcar_leccion_completada(datos: MarcarLeccionCompletada, response: Response,
+                                    db: AsyncSession = Depends(get_db_async)):
     """
     Registra que un usuario completó una lección.
     Útil para hacer seguimiento del progreso de aprendizaje.
+    tiempo_dedicado (opcional, en segundos) se suma al tiempo de la lección.
     """
-    # Verificar si ya existe un registro
-    progreso_existente = db.query(ProgresoLeccion).filter(
-        ProgresoLeccion.usuario_id == datos.usuario_id,
-        ProgresoLeccion.leccion_id == datos.leccion_id
-    ).first()
-    
-    if progreso_existente:
-        if not progreso_existente.completada:
-            progreso_existente.completada = True
-            progreso_existente.fecha_completada = datetime.now()
-            db.commit()
-    else:
-        nuevo_progreso = ProgresoLeccion(
-            usuario_id=datos.usuario_id,
-            leccion_id=datos.leccion_id,
-            completada=True,
-            fecha_completada=datetime.now()
-        )
-        db.add(nuevo_progreso)
-        db.commit()
+    curso_id = await db.scalar(select(Leccion.curso_id).where(Leccion.id == datos.leccion_id))
+    if curso_id is None:
+        raise HTTPException(status_code=404, detail="Lección no encontrada")
+    
+    tiempo = max(datos.tiempo_dedicado or 0, 0)
+    del_usuario = and_(ProgresoLeccion.usuario_id == datos.usuario_id,
+                       ProgresoLeccion.leccion_id == datos.leccion_id)
+    
+    # Sentencias atómicas en la BD: dos peticiones a la vez no pierden tiempo ni
+    # cuentan dos veces la lección (solo la que cambia completada la cuenta)
+    marcada = await db.execute(update(ProgresoLeccion).where(
+        del_usuario, ProgresoLeccion.completada.isnot(True)
+    ).values(completada=True, fecha_completada=datetime.now()))
+    sumada = await db.execute(update(ProgresoLeccion).where(del_usuario).values(
+        tiempo_dedicado=func.coalesce(ProgresoLeccion.tiempo_dedicado, 0) + tiempo
+    ))
+    nueva_completada = marcada.rowcount > 0
+    
+    if sumada.rowcount == 0:
+        try:
+            async with db.begin_nested():
+                db.add(ProgresoLeccion(
+                    usuario_id=datos.usuario_id,
+                    leccion_id=datos.leccion_id,
+                    completada=True,
+                    tiempo_dedicado=tiempo,
+                    fecha_completada=datetime.now()
+                ))
+            nueva_completada = True
+        except IntegrityError:
+            # Otra petición registró la lección a la vez (índice único): ya está completada, solo sumar el tiempo
+            await db.execute(update(ProgresoLeccion).where(del_usuario).values(
+                tiempo_dedicado=func.coalesce(ProgresoLeccion.tiempo_dedicado, 0) + tiempo
+            ))
+    
+    # Resumen del curso: incremento en la misma transacción
+    await registrar_actividad_async(db, datos.usuario_id, curso_id,
+                                    completadas=1 if nueva_completada else 0, tiempo=tiempo)
+    await db.commit()
+    marcar_escritura(response)
     
     return {"mensaje": "Lección completada", "progreso_registrado": True}
 
-@router.get("/curso/{curso_id}/lecciones", response_model=list)
-def obtener_lecciones_curso(curso_id: int, db: Session = Depends(get_db)):
+@router.get("/curso/{curso_id}/lecciones", response_model=List[LeccionDetalle])
+async def obtener_lecciones_curso(curso_id: int, db: AsyncSession = Depends(get_db_lectura_async),
+                                  if_none_match: Optional[str] = Header(None)):
     """
     Devuelve todas las lecciones de un curso, ordenadas secuencialmente.
     """
-    lecciones = db.query(Leccion).filter(Leccion.curso_id == curso_id).order_by(Leccion.orden).all()
-    
-    resultado = []
-    for lec in lecciones:
-        resultado.append({
-            "id": lec.id,
-            "titulo": lec.titulo,
-            "orden": lec.orden,
-            "contenido": lec.contenido_markdown,
-            "ejemplos": json.loads(lec.ejemplos_codigo) if lec.ejemplos_codigo else [],
-            "puntos_clave": json.loads(lec.puntos_clave) if lec.puntos_clave else [],
-            "duracion_minutos": lec.duracion_estimada
-        })
-    
-    return resultado
+    async def cargar():
+        lecciones = await db.scalars(select(Leccion).where(Leccion.curso_id == curso_id).order_by(Leccion.orden))
+        return [_leccion_detalle(lec).model_dump() for lec in lecciones]
+    
+    return responder(await obtener_o_cargar_async(curso_id, "lecciones", cargar), if_none_match)
 
 @router.get("/curso/{curso_id}/progreso/{usuario_id}", response_model=dict)
-def obtener_progreso_curso(curso_id: int, usuario_id: int, db: Session = Depends(get_db)):
+async def obtener_progreso_curso(curso_id: int, usuario_id: int, db: AsyncSession = Depends(get_db_lectura_async)):
     """
     Devuelve el progreso del usuario en un curso específico.
     Muestra qué lecciones ha completado.
     """
-    lecciones = db.query(Leccion).filter(Leccion.curso_id == curso_id).all()
-    
-    progreso_info = []
-    for leccion in lecciones:
-        progreso = db.query(ProgresoLeccion).filter(
-            ProgresoLeccion.leccion_id == leccion.id,
-            ProgresoLeccion.usuario_id == usuario_id
-        ).first()
-        
-        progreso_info.append({
-            "leccion_id": leccion.id,
-            "titulo": leccion.titulo,
-            "orden": leccion.orden,
-            "completada": progreso.completada if progreso else False,
-            "tiempo_dedicado": progreso.tiempo_dedicado if progreso else 0
-        })
-    
-    total_lecciones = len(lecciones)
+    # Una sola consulta: lecciones del curso con el progreso del usuario (si lo hay)
+    filas = (await db.execute(select(
+        Leccion.id, Leccion.titulo, Leccion.orden,
+        ProgresoLeccion.completada, ProgresoLeccion.tiempo_dedicado
+    ).outerjoin(
+        ProgresoLeccion,
+        and_(ProgresoLeccion.leccion_id == Leccion.id, ProgresoLeccion.usuario_id == usuario_id)
+    ).where(Leccion.curso_id == curso_id).order_by(Leccion.orden, Leccion.id))).all()
+    
+    progreso_por_leccion = {}
+    for fila in filas:
+        info = progreso_por_leccion.get(fila.id)
+        if info is None:
+            progreso_por_leccion[fila.id] = {
+                "leccion_id": fila.id,
+                "titulo": fila.titulo,
+                "orden": fila.orden,
+                "completada": bool(fila.completada),
+                "tiempo_dedicado": fila.tiempo_dedicado or 0
+            }
+        else:
+            # Registros de progreso duplicados para la misma lección
+            info["completada"] = info["completada"] or bool(fila.completada)
+            info["tiempo_dedicado"] += fila.tiempo_dedicado or 0
+    
+    progreso_info = list(progreso_por_leccion.values())
+    total_lecciones = len(progreso_info)
     completadas = sum(1 for p in progreso_info if p["completada"])
     porcentaje = int((completadas / total_lecciones) * 100) if total_lecciones > 0 else 0
     
@@ -117,3 +158,121 @@ def obtener_progreso_curso(curso_id: int, usuario_id: int, db: Session = Depends
             "porcentaje_completado": porcentaje
         }
     }
+
+@router.get("/curso/{curso_id}/resumen/{usuario_id}", response_model=dict)
+async def obtener_resumen_progreso(curso_id: int, usuario_id: int, db: AsyncSession = Depends(get_db_lectura_async)):
+    """
+    Resumen del progreso del usuario en el curso (sin detalle por lección).
+    Lee el resumen que mantiene /lecciones/completar: pensado para sondeos frecuentes.
+    """
+    total_lecciones = (
+        select(func.count(Leccion.id)).where(Leccion.curso_id == curso_id).scalar_subquery()
+    )
+    fila = (await db.execute(
+        select(
+            total_lecciones.label("total_lecciones"),
+            ResumenProgresoCurso.lecciones_completadas,
+            ResumenProgresoCurso.tiempo_total,
+            ResumenProgresoCurso.ultima_actividad
+        ).select_from(ResumenProgresoCurso).where(
+            ResumenProgresoCurso.usuario_id == usuario_id,
+            ResumenProgresoCurso.curso_id == curso_id
+        )
+    )).first()
+    
+    if fila is None:
+        total = (await db.scalar(select(total_lecciones))) or 0
+        completadas, tiempo, ultima = 0, 0, None
+    else:
+        total, completadas, tiempo, ultima = (
+            fila.total_lecciones, fila.lecciones_completadas or 0, fila.tiempo_total or 0, fila.ultima_actividad
+        )
+    
+    return {
+        "curso_id": curso_id,
+        "usuario_id": usuario_id,
+        "total_lecciones": total,
+        "completadas": completadas,
+        "porcentaje_completado": int((completadas / total) * 100) if total > 0 else 0,
+        "tiempo_total": tiempo,
+        "ultima_actividad": ultima
+    }
+
+# Cursos con una generación en streaming en curso en este proceso
+_generando = set()
+
+def _titulo_normalizado(titulo) -> str:
+    return " ".join((titulo or "").lower().split())
+
+async def _stream_lecciones(curso_id: int, texto: str, num_lecciones: int):
+    """Guarda cada lección en cuanto llega del modelo y la envía como evento SSE"""
+    if curso_id in _generando:
+        yield evento_sse("error", {"detalle": "Ya se están generando lecciones para este curso",
+                                   "lecciones_generadas": 0})
+        return
+    _generando.add(curso_id)
+    total = 0
+    omitidas = 0
+    try:
+        async for lec in generar_lecciones_stream(texto, num_lecciones=num_lecciones):
+            async with AsyncSessionLocal() as db:
+                # Idempotente: una lección con el mismo título que otra del curso no se repite
+                # (p. ej. una respuesta de la caché de IA al repetir la petición)
+                titulos = await db.scalars(select(Leccion.titulo).where(Leccion.curso_id == curso_id))
+                if _titulo_normalizado(lec.get("titulo")) in {_titulo_normalizado(t) for t in titulos}:
+                    omitidas += 1
+                    continue
+                orden = (await db.scalar(select(func.max(Leccion.orden)).where(Leccion.curso_id == curso_id))) or 0
+                nueva_leccion = leccion_desde_ia(curso_id, lec, orden=orden + 1)
+                db.add(nueva_leccion)
+                await db.commit()
+            await invalidar_curso(curso_id)
+            fijar_contenido()
+            total += 1
+            
+            yield evento_sse("leccion", {
+                "id": nueva_leccion.id,
+                "titulo": nueva_leccion.titulo,
+                "orden": nueva_leccion.orden,
+                "contenido": nueva_leccion.contenido_markdown,
+                "puntos_clave": lec.get("puntos_clave", []),
+                "duracion_minutos": nueva_leccion.duracion_estimada
+            })
+        
+        yield evento_sse("fin", {"curso_id": curso_id, "lecciones_generadas": total, "lecciones_omitidas": omitidas})
+    
+    except Exception as e:
+        print(f"❌ Error generando lecciones en streaming: {str(e)}")
+        yield evento_sse("error", {"detalle": str(e), "lecciones_generadas": total})
+    finally:
+        _generando.discard(curso_id)
+
+@router.post("/curso/{curso_id}/generar/stream")
+async def generar_lecciones_en_vivo(curso_id: int, num_lecciones: int = 5, db: AsyncSession = Depends(get_db_async)):
+    """
+    📡 Genera lecciones para un curso y las envía por Server-Sent Events
+    a medida que el modelo las produce.
+    Cada lección se guarda en la BD antes de enviarse (se añaden al final del curso);
+    las que repiten el título de una lección del curso se omiten.
+    Es POST para que una reconexión de EventSource no lance otra generación:
+    léelo con fetch. Eventos: leccion, fin, error.
+    """
+    curso = await db.get(Curso, curso_id)
+    if not curso:
+        raise HTTPException(status_code=404, detail="Curso no encontrado")
+    
+    texto = await obtener_texto_curso_async(db, curso_id)
+    if not texto:
+        raise HTTPException(
+            status_code=400, 
+            detail="El curso no tiene contenido. Sube un PDF primero."
+        )
+    
+    if curso_id in _generando:
+        raise HTTPException(status_code=409, detail="Ya se están generando lecciones para este curso")
+    
+    return StreamingResponse(
+        _stream_lecciones(curso_id, texto, num_lecciones),
+        media_type="text/event-stream",
+        headers=CABECERAS_SSE
+    )
@@ -11,26 +11,26 @@ class CursoBase(BaseModel):
 class CursoResponse(BaseModel):
     id: int
     nombre: str
-    proveedor: str
-    total_lecciones: int
-    
-    class Config:
-        from_attributes = True
+    proveedor: Optional[str] = None
+    num_lecciones: int
+    num_preguntas: int
 
 class LeccionSimple(BaseModel):
     id: int
     titulo: str
-    orden: int
-    duracion_estimada: int
+    orden: Optional[int] = None
+    duracion_estimada: Optional[int] = None
     
     class Config:
         from_attributes = True
 
+class EstadisticasCurso(BaseModel):
+    total_lecciones: int
+    total_preguntas: int
+
 class CursoDetalle(BaseModel):
     id: int
     nombre: str
-    proveedor: str
+    proveedor: Optional[str] = None
     lecciones: List[LeccionSimple]
-    
-    class Config:
-        from_attributes = True
+    estadisticas: EstadisticasCurso
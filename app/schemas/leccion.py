@@ -7,17 +7,16 @@ from typing import List, Dict, Any, Optional
 class LeccionDetalle(BaseModel):
     id: int
     titulo: str
-    contenido_markdown: str
-    ejemplos_codigo: Optional[str]
-    puntos_clave: str
-    duracion_estimada: int
-    
-    class Config:
-        from_attributes = True
+    orden: Optional[int] = None
+    contenido: Optional[str] = None
+    ejemplos: List[Any] = []
+    puntos_clave: List[Any] = []
+    duracion_minutos: Optional[int] = None
 
 class MarcarLeccionCompletada(BaseModel):
     usuario_id: int
     leccion_id: int
+    tiempo_dedicado: Optional[int] = None  # Segundos dedicados en esta sesión
 
 class ProgresoResponse(BaseModel):
     lecciones_completadas: int
@@ -28,10 +27,11 @@ class ProgresoResponse(BaseModel):
 
 class PreguntaQuiz(BaseModel):
     id: int
-    texto_pregunta: str
-    tipo: str
-    opciones: List[str]
-    
+    tipo: Optional[str] = None
+    pregunta: str
+    opciones: List[Any] = []
+    dificultad: Optional[str] = None
+
 class QuizResponse(BaseModel):
     leccion_id: int
     titulo_leccion: str
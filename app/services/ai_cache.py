@@ -0,0 +1,173 @@
+"""
+Caché persistente de generaciones de IA direccionada por contenido
+La clave es un SHA-256 del modelo, la versión del prompt, el texto de entrada
+y los parámetros. Se desaloja por antigüedad (TTL) y por número de entradas (LRU).
+"""
+import os
+import json
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from app.models.database import CacheGeneracion
+from app.utils.database import SessionLocal
+
+CACHE_ACTIVO = os.getenv("AI_CACHE_ACTIVO", "true").lower() == "true"
+MAX_ENTRADAS = int(os.getenv("AI_CACHE_MAX_ENTRADAS", "1000"))
+TTL_HORAS = int(os.getenv("AI_CACHE_TTL_HORAS", "720"))
+
+_contadores = {"aciertos": 0, "fallos": 0, "escrituras": 0, "desalojos": 0}
+
+# Generaciones en curso por clave: peticiones idénticas simultáneas esperan a la misma
+_en_curso = {}
+
+def calcular_clave(funcion: str, version_prompt: str, modelo: str, texto: str, parametros: dict) -> str:
+    """SHA-256 de todo lo que determina el resultado de una generación"""
+    cabecera = json.dumps({
+        "funcion": funcion,
+        "version": version_prompt,
+        "modelo": modelo,
+        "parametros": parametros
+    }, sort_keys=True, ensure_ascii=False)
+    h = hashlib.sha256(cabecera.encode("utf-8"))
+    h.update(b"\0")
+    h.update(texto.encode("utf-8"))
+    return h.hexdigest()
+
+def _leer(clave: str):
+    """Devuelve el resultado guardado o None si no existe o ya expiró"""
+    db = SessionLocal()
+    try:
+        entrada = db.query(CacheGeneracion).filter(CacheGeneracion.clave == clave).first()
+        if not entrada:
+            return None
+
+        ahora = datetime.now()
+        if entrada.fecha_creacion < ahora - timedelta(hours=TTL_HORAS):
+            db.delete(entrada)
+            db.commit()
+            _contadores["desalojos"] += 1
+            return None
+
+        entrada.aciertos += 1
+        entrada.ultimo_acceso = ahora
+        resultado = entrada.resultado
+        db.commit()
+        return resultado
+    finally:
+        db.close()
+
+def _guardar(clave: str, funcion: str, modelo: str, resultado):
+    """Guarda el resultado y aplica la política de desalojo"""
+    db = SessionLocal()
+    try:
+        db.merge(CacheGeneracion(
+            clave=clave,
+            funcion=funcion,
+            modelo=modelo,
+            resultado=resultado,
+            tamano=len(json.dumps(resultado, ensure_ascii=False)),
+            aciertos=0,
+            fecha_creacion=datetime.now(),
+            ultimo_acceso=datetime.now()
+        ))
+        db.commit()
+        _contadores["escrituras"] += 1
+        _desalojar(db)
+    finally:
+        db.close()
+
+def _desalojar(db):
+    """Elimina entradas expiradas y las menos usadas recientemente si se supera el máximo"""
+    limite = datetime.now() - timedelta(hours=TTL_HORAS)
+    eliminadas = db.query(CacheGeneracion).filter(
+        CacheGeneracion.fecha_creacion < limite
+    ).delete(synchronize_session=False)
+
+    exceso = db.query(CacheGeneracion).count() - MAX_ENTRADAS
+    if exceso > 0:
+        claves_viejas = [clave for (clave,) in db.query(CacheGeneracion.clave).order_by(
+            CacheGeneracion.ultimo_acceso
+        ).limit(exceso).all()]
+        eliminadas += db.query(CacheGeneracion).filter(
+            CacheGeneracion.clave.in_(claves_viejas)
+        ).delete(synchronize_session=False)
+
+    db.commit()
+    _contadores["desalojos"] += eliminadas
+
+async def obtener(clave: str, funcion: str = ""):
+    """Lee una entrada de la caché (None si no existe); cuenta el acierto"""
+    if not CACHE_ACTIVO:
+        return None
+    try:
+        resultado = await asyncio.to_thread(_leer, clave)
+    except Exception as e:
+        print(f"⚠️ Error leyendo caché de IA: {e}")
+        return None
+    if resultado is not None:
+        _contadores["aciertos"] += 1
+        print(f"⚡ Caché de IA: acierto para {funcion}")
+    return resultado
+
+async def guardar(clave: str, funcion: str, modelo: str, resultado):
+    """Guarda una entrada en la caché; los errores solo se registran"""
+    if not CACHE_ACTIVO:
+        return
+    try:
+        await asyncio.to_thread(_guardar, clave, funcion, modelo, resultado)
+    except Exception as e:
+        print(f"⚠️ Error guardando en caché de IA: {e}")
+
+async def con_cache(funcion: str, version_prompt: str, modelo: str, texto: str,
+                    parametros: dict, generar, usar_cache: bool = True):
+    """
+    Devuelve el resultado de `generar()` pasando por la caché.
+    Solo se guardan resultados no vacíos y completos (un resultado con
+    atributo completo=False, p. ej. JSON truncado, no se guarda). Con usar_cache=False se
+    fuerza una generación nueva que reemplaza a la entrada guardada.
+    """
+    if not CACHE_ACTIVO:
+        return await generar()
+
+    clave = calcular_clave(funcion, version_prompt, modelo, texto, parametros)
+
+    if usar_cache:
+        resultado = await obtener(clave, funcion)
+        if resultado is not None:
+            return resultado
+
+        # Si otra petición ya está generando lo mismo, esperar su resultado
+        pendiente = _en_curso.get(clave)
+        if pendiente is not None:
+            _contadores["aciertos"] += 1
+            return await asyncio.shield(pendiente)
+
+    _contadores["fallos"] += 1
+    futuro = asyncio.get_running_loop().create_future()
+    _en_curso[clave] = futuro
+    try:
+        resultado = await generar()
+        if resultado and getattr(resultado, "completo", True):
+            await guardar(clave, funcion, modelo, resultado)
+        futuro.set_result(resultado)
+        return resultado
+    except asyncio.CancelledError:
+        futuro.cancel()
+        raise
+    except Exception as e:
+        futuro.set_exception(e)
+        # Evitar el aviso de "excepción nunca recuperada" si nadie esperaba
+        futuro.exception()
+        raise
+    finally:
+        if _en_curso.get(clave) is futuro:
+            del _en_curso[clave]
+
+def estadisticas() -> dict:
+    """Contadores de aciertos/fallos de la caché en este proceso"""
+    consultas = _contadores["aciertos"] + _contadores["fallos"]
+    return {
+        "activa": CACHE_ACTIVO,
+        **_contadores,
+        "tasa_aciertos": round(_contadores["aciertos"] / consultas, 3) if consultas else 0.0
+    }
@@ -0,0 +1,55 @@
+"""
+Cliente asíncrono compartido para el modelo de IA
+Delega en el proveedor configurado (AI_PROVEEDOR) y limita la concurrencia global
+"""
+import os
+import asyncio
+from app.services import ai_resiliencia
+from app.services.ai_proveedores import crear_proveedor
+
+MODELO_POR_DEFECTO = os.getenv("GEMINI_MODELO", "gemini-2.5-flash")
+MAX_CONCURRENCIA = int(os.getenv("GEMINI_MAX_CONCURRENCIA", "4"))
+
+proveedor = crear_proveedor()
+
+# Nombre del modelo en las claves de caché (las respuestas sintéticas no se mezclan con las reales)
+MODELO_CACHE = proveedor.identificador(MODELO_POR_DEFECTO)
+
+_semaforo = None
+
+def _obtener_semaforo() -> asyncio.Semaphore:
+    """Semáforo global que limita las llamadas simultáneas al modelo"""
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(MAX_CONCURRENCIA)
+    return _semaforo
+
+async def generar_contenido(prompt: str, modelo: str = MODELO_POR_DEFECTO, timeout: float = None,
+                            tarea: str = "texto", cantidad: int = 1) -> str:
+    """
+    Envía el prompt al modelo sin bloquear el event loop.
+    Pasa por la capa de resiliencia (timeout, reintentos, hedging, circuit breaker).
+    Devuelve el texto de la respuesta ("" si el modelo no respondió).
+    """
+    # El semáforo se toma por intento fuera del timeout: esperar hueco no es lentitud del proveedor
+    return await ai_resiliencia.ejecutar(
+        lambda: proveedor.generar(prompt, modelo, tarea=tarea, cantidad=cantidad),
+        timeout=timeout, limitador=_obtener_semaforo()
+    )
+
+async def generar_contenido_stream(prompt: str, modelo: str = MODELO_POR_DEFECTO,
+                                   tarea: str = "texto", cantidad: int = 1):
+    """
+    Igual que generar_contenido pero va entregando el texto por fragmentos
+    a medida que el modelo lo produce. Respeta el circuit breaker, pero no
+    reintenta: parte de la respuesta ya se entregó.
+    """
+    ai_resiliencia.verificar_circuito()
+    try:
+        async with _obtener_semaforo():
+            async for fragmento in proveedor.generar_stream(prompt, modelo, tarea=tarea, cantidad=cantidad):
+                yield fragmento
+    except Exception as e:
+        ai_resiliencia.registrar_resultado(e)
+        raise
+    ai_resiliencia.registrar_resultado()
@@ -0,0 +1,241 @@
+"""
+Proveedores de modelos de lenguaje
+gemini     -> Google Gemini (por defecto)
+local      -> respuestas sintéticas deterministas, sin red ni API key
+grabar     -> llama a Gemini y guarda cada respuesta en disco
+reproducir -> sirve las respuestas grabadas sin llamar a Gemini
+"""
+import os
+import json
+import random
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+PROVEEDOR = os.getenv("AI_PROVEEDOR", "gemini").lower()
+
+# Proveedor local: latencia simulada por llamada y tamaño del texto de cada elemento
+LOCAL_LATENCIA_MS = float(os.getenv("AI_LOCAL_LATENCIA_MS", "0"))
+LOCAL_JITTER_MS = float(os.getenv("AI_LOCAL_JITTER_MS", "0"))
+LOCAL_TAMANO = int(os.getenv("AI_LOCAL_TAMANO", "400"))
+LOCAL_FRAGMENTOS_STREAM = int(os.getenv("AI_LOCAL_FRAGMENTOS_STREAM", "8"))
+
+GRABACIONES_DIR = os.getenv("AI_GRABACIONES_DIR", "grabaciones_ia")
+# Si una respuesta no está grabada: "error" o "local" (responder con el proveedor local)
+REPRODUCIR_RESPALDO = os.getenv("AI_REPRODUCIR_RESPALDO", "error").lower()
+
+class GrabacionNoEncontrada(ValueError):
+    """No hay respuesta grabada para el prompt (no se reintenta)"""
+
+class ProveedorIA(ABC):
+    """
+    Interfaz común: `generar` devuelve el texto completo y `generar_stream`
+    lo entrega por fragmentos. `tarea` ("lecciones", "examen", "bandas", "feedback")
+    y `cantidad` solo los usan los proveedores que no llaman a un modelo real.
+    """
+    nombre = "base"
+
+    def identificador(self, modelo: str) -> str:
+        """Nombre del modelo para la clave de caché"""
+        return modelo
+
+    @abstractmethod
+    async def generar(self, prompt: str, modelo: str, tarea: str = "texto", cantidad: int = 1) -> str:
+        """Texto completo de la respuesta del modelo"""
+
+    async def generar_stream(self, prompt: str, modelo: str, tarea: str = "texto",
+                             cantidad: int = 1) -> AsyncIterator[str]:
+        yield await self.generar(prompt, modelo, tarea, cantidad)
+
+class ProveedorGemini(ProveedorIA):
+    """Google Gemini; el SDK se configura la primera vez que se usa"""
+    nombre = "gemini"
+
+    def __init__(self):
+        self._genai = None
+        # Una instancia de GenerativeModel por nombre de modelo
+        self._modelos = {}
+
+    def obtener_modelo(self, nombre: str):
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            self._genai = genai
+        modelo = self._modelos.get(nombre)
+        if modelo is None:
+            modelo = self._genai.GenerativeModel(nombre)
+            self._modelos[nombre] = modelo
+        return modelo
+
+    async def generar(self, prompt, modelo, tarea="texto", cantidad=1):
+        response = await self.obtener_modelo(modelo).generate_content_async(prompt)
+        if not response:
+            return ""
+        return response.text or ""
+
+    async def generar_stream(self, prompt, modelo, tarea="texto", cantidad=1):
+        response = await self.obtener_modelo(modelo).generate_content_async(prompt, stream=True)
+        async for fragmento in response:
+            if fragmento.text:
+                yield fragmento.text
+
+class ProveedorLocal(ProveedorIA):
+    """
+    Respuestas sintéticas con el mismo formato que pide cada prompt.
+    Misma entrada -> misma salida, para que las pruebas de carga sean repetibles.
+    """
+    nombre = "local"
+
+    def __init__(self, latencia_ms: float = LOCAL_LATENCIA_MS, jitter_ms: float = LOCAL_JITTER_MS,
+                 tamano: int = LOCAL_TAMANO):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tamano = tamano
+
+    def identificador(self, modelo):
+        # Las respuestas sintéticas no deben mezclarse en la caché con las reales
+        return f"local:{modelo}"
+
+    def _semilla(self, prompt: str) -> int:
+        return int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16)
+
+    async def _esperar(self, aleatorio: random.Random, fraccion: float = 1.0):
+        espera = self.latencia_ms + aleatorio.uniform(0, self.jitter_ms)
+        if espera > 0:
+            await asyncio.sleep(espera * fraccion / 1000)
+
+    def _texto(self, aleatorio: random.Random, tamano: int) -> str:
+        palabras = ["datos", "red", "sistema", "proceso", "modelo", "servidor", "cliente",
+                    "protocolo", "memoria", "algoritmo", "seguridad", "nube", "sensor"]
+        texto = []
+        longitud = 0
+        while longitud < tamano:
+            palabra = aleatorio.choice(palabras)
+            texto.append(palabra)
+            longitud += len(palabra) + 1
+        return " ".join(texto)[:tamano].capitalize() + "."
+
+    def _respuesta(self, prompt: str, tarea: str, cantidad: int, aleatorio: random.Random) -> str:
+        if tarea == "lecciones":
+            return json.dumps([
+                {
+                    "titulo": f"Lección {i}: {self._texto(aleatorio, 30)}",
+                    "orden": i,
+                    "contenido_markdown": self._texto(aleatorio, self.tamano),
+                    "puntos_clave": [self._texto(aleatorio, 40) for _ in range(3)],
+                    "duracion_estimada": 5 + i % 5
+                }
+                for i in range(1, cantidad + 1)
+            ], ensure_ascii=False, indent=2)
+
+        if tarea == "examen":
+            preguntas = []
+            for i in range(1, cantidad + 1):
+                opciones = [self._texto(aleatorio, 15) for _ in range(4)]
+                preguntas.append({
+                    "tipo": "multiple",
+                    "pregunta": f"Pregunta {i}: {self._texto(aleatorio, max(20, self.tamano // 4))}?",
+                    "opciones": opciones,
+                    "correcta": opciones[aleatorio.randrange(4)],
+                    "explicacion": self._texto(aleatorio, max(20, self.tamano // 4)),
+                    "consejo": f"Repasa {self._texto(aleatorio, 40).lower()}"
+                })
+            return json.dumps(preguntas, ensure_ascii=False, indent=2)
+
+        if tarea == "bandas":
+            return json.dumps([
+                {"nota_minima": nota, "mensaje": self._texto(aleatorio, 80)} for nota in (90, 70, 40, 0)
+            ], ensure_ascii=False)
+
+        return self._texto(aleatorio, min(self.tamano, 200))
+
+    async def generar(self, prompt, modelo, tarea="texto", cantidad=1):
+        aleatorio = random.Random(self._semilla(prompt))
+        await self._esperar(aleatorio)
+        return self._respuesta(prompt, tarea, cantidad, aleatorio)
+
+    async def generar_stream(self, prompt, modelo, tarea="texto", cantidad=1):
+        aleatorio = random.Random(self._semilla(prompt))
+        texto = self._respuesta(prompt, tarea, cantidad, aleatorio)
+        partes = max(1, LOCAL_FRAGMENTOS_STREAM)
+        tamano = -(-len(texto) // partes) or 1
+        for inicio in range(0, len(texto), tamano):
+            await self._esperar(aleatorio, 1 / partes)
+            yield texto[inicio:inicio + tamano]
+
+class ProveedorGrabacion(ProveedorIA):
+    """
+    Graba (modo "grabar") o reproduce (modo "reproducir") las respuestas de
+    otro proveedor: un fichero JSON por (modelo, prompt) en GRABACIONES_DIR.
+    """
+
+    def __init__(self, modo: str, real: ProveedorIA, directorio: str = GRABACIONES_DIR,
+                 respaldo: ProveedorIA = None):
+        self.nombre = modo
+        self.modo = modo
+        self.real = real
+        self.directorio = directorio
+        self.respaldo = respaldo
+
+    def identificador(self, modelo):
+        return self.real.identificador(modelo)
+
+    def _ruta(self, prompt: str, modelo: str) -> str:
+        clave = hashlib.sha256(f"{modelo}\n{prompt}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directorio, clave[:2], f"{clave}.json")
+
+    def _leer(self, prompt: str, modelo: str):
+        try:
+            with open(self._ruta(prompt, modelo), encoding="utf-8") as f:
+                return json.load(f)["respuesta"]
+        except FileNotFoundError:
+            return None
+
+    def _escribir(self, prompt: str, modelo: str, tarea: str, respuesta: str):
+        ruta = self._ruta(prompt, modelo)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"modelo": modelo, "tarea": tarea, "prompt": prompt, "respuesta": respuesta},
+                      f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    async def generar(self, prompt, modelo, tarea="texto", cantidad=1):
+        if self.modo == "reproducir":
+            respuesta = await asyncio.to_thread(self._leer, prompt, modelo)
+            if respuesta is not None:
+                return respuesta
+            if self.respaldo is not None:
+                return await self.respaldo.generar(prompt, modelo, tarea, cantidad)
+            raise GrabacionNoEncontrada(f"No hay respuesta grabada para este prompt ({tarea})")
+
+        respuesta = await self.real.generar(prompt, modelo, tarea, cantidad)
+        if respuesta:
+            await asyncio.to_thread(self._escribir, prompt, modelo, tarea, respuesta)
+        return respuesta
+
+    async def generar_stream(self, prompt, modelo, tarea="texto", cantidad=1):
+        if self.modo == "reproducir":
+            yield await self.generar(prompt, modelo, tarea, cantidad)
+            return
+
+        partes = []
+        async for fragmento in self.real.generar_stream(prompt, modelo, tarea, cantidad):
+            partes.append(fragmento)
+            yield fragmento
+        if partes:
+            await asyncio.to_thread(self._escribir, prompt, modelo, tarea, "".join(partes))
+
+def crear_proveedor(nombre: str = PROVEEDOR) -> ProveedorIA:
+    """Instancia el proveedor configurado en AI_PROVEEDOR"""
+    if nombre == "gemini":
+        return ProveedorGemini()
+    if nombre == "local":
+        return ProveedorLocal()
+    if nombre == "grabar":
+        return ProveedorGrabacion("grabar", ProveedorGemini())
+    if nombre == "reproducir":
+        respaldo = ProveedorLocal() if REPRODUCIR_RESPALDO == "local" else None
+        return ProveedorGrabacion("reproducir", ProveedorGemini(), respaldo=respaldo)
+    raise ValueError(f"AI_PROVEEDOR desconocido: {nombre}")
@@ -0,0 +1,235 @@
+"""
+Capa de resiliencia para las llamadas al modelo de IA
+Presupuesto de latencia por llamada, reintentos con backoff exponencial y
+jitter, peticiones de cobertura (hedging) opcionales cuando la latencia supera
+un percentil alto, y un circuit breaker que falla rápido si el proveedor está degradado.
+"""
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from contextlib import nullcontext
+from typing import Awaitable, Callable
+
+TIMEOUT_SEGUNDOS = float(os.getenv("AI_TIMEOUT_SEGUNDOS", "90"))
+MAX_REINTENTOS = int(os.getenv("AI_MAX_REINTENTOS", "2"))
+BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAXIMO = float(os.getenv("AI_BACKOFF_MAXIMO", "8"))
+
+HEDGING_ACTIVO = os.getenv("AI_HEDGING", "false").lower() == "true"
+HEDGING_PERCENTIL = float(os.getenv("AI_HEDGING_PERCENTIL", "0.95"))
+HEDGING_MIN_MUESTRAS = int(os.getenv("AI_HEDGING_MIN_MUESTRAS", "20"))
+
+BREAKER_UMBRAL = int(os.getenv("AI_BREAKER_UMBRAL", "5"))
+BREAKER_ENFRIAMIENTO = float(os.getenv("AI_BREAKER_ENFRIAMIENTO", "30"))
+
+# Códigos HTTP que indican un fallo transitorio del proveedor
+CODIGOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+
+class CircuitoAbierto(Exception):
+    """El proveedor de IA está degradado: se rechaza la llamada sin intentarla"""
+
+_contadores = {
+    "llamadas": 0,
+    "exitos": 0,
+    "fallos": 0,
+    "reintentos": 0,
+    "timeouts": 0,
+    "hedges": 0,
+    "hedges_ganadores": 0,
+    "rechazos_circuito": 0
+}
+
+class CircuitBreaker:
+    """
+    cerrado -> tras BREAKER_UMBRAL fallos seguidos pasa a abierto
+    abierto -> rechaza todo durante BREAKER_ENFRIAMIENTO segundos
+    semiabierto -> deja pasar una llamada de prueba; si va bien se cierra
+    """
+
+    def __init__(self, umbral: int, enfriamiento: float):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+
+    @property
+    def estado(self) -> str:
+        if self.abierto_desde is None:
+            return "cerrado"
+        if time.monotonic() - self.abierto_desde >= self.enfriamiento:
+            return "semiabierto"
+        return "abierto"
+
+    def permitir(self) -> bool:
+        estado = self.estado
+        if estado == "cerrado":
+            return True
+        if estado == "semiabierto" and not self._prueba_en_curso:
+            self._prueba_en_curso = True
+            return True
+        return False
+
+    def registrar_exito(self):
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        self.fallos_seguidos += 1
+        if self._prueba_en_curso or self.fallos_seguidos >= self.umbral:
+            if self.estado != "abierto":
+                print(f"🔌 Circuit breaker de IA abierto ({self.fallos_seguidos} fallos seguidos)")
+            self.abierto_desde = time.monotonic()
+        self._prueba_en_curso = False
+
+class VentanaLatencias:
+    """Últimas latencias observadas para calcular percentiles"""
+
+    def __init__(self, tamano: int = 200):
+        self._muestras = deque(maxlen=tamano)
+
+    def registrar(self, segundos: float):
+        self._muestras.append(segundos)
+
+    def __len__(self):
+        return len(self._muestras)
+
+    def percentil(self, p: float) -> float:
+        ordenadas = sorted(self._muestras)
+        indice = min(len(ordenadas) - 1, int(p * len(ordenadas)))
+        return ordenadas[indice]
+
+breaker = CircuitBreaker(BREAKER_UMBRAL, BREAKER_ENFRIAMIENTO)
+latencias = VentanaLatencias()
+
+def es_reintentable(error: Exception) -> bool:
+    """Timeouts, errores de red y 408/429/5xx se reintentan; errores de la petición no"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    codigo = getattr(error, "code", None)
+    if isinstance(codigo, int):
+        return codigo in CODIGOS_REINTENTABLES
+    return not isinstance(error, (ValueError, TypeError, KeyError))
+
+def calcular_espera(intento: int) -> float:
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * (2 ** intento)))
+
+async def _intento_medido(operacion: Callable[[], Awaitable], timeout: float, limitador=None,
+                          en_curso: asyncio.Event = None):
+    """
+    Un intento con su timeout. La espera por un hueco del `limitador` (semáforo
+    de concurrencia) queda fuera: el timeout y la latencia miden solo al proveedor.
+    """
+    async with limitador or nullcontext():
+        if en_curso is not None:
+            en_curso.set()
+        inicio = time.monotonic()
+        try:
+            resultado = await asyncio.wait_for(operacion(), timeout)
+        except asyncio.TimeoutError:
+            _contadores["timeouts"] += 1
+            raise
+        latencias.registrar(time.monotonic() - inicio)
+        return resultado
+
+async def _con_hedging(operacion: Callable[[], Awaitable], timeout: float, limitador=None):
+    """
+    Lanza la llamada; si tarda más que el percentil configurado lanza una
+    segunda igual y se queda con la primera que responda bien.
+    """
+    if not HEDGING_ACTIVO or len(latencias) < HEDGING_MIN_MUESTRAS:
+        return await _intento_medido(operacion, timeout, limitador)
+
+    umbral = latencias.percentil(HEDGING_PERCENTIL)
+    if umbral >= timeout:
+        return await _intento_medido(operacion, timeout, limitador)
+
+    en_curso = asyncio.Event()
+    primera = asyncio.create_task(_intento_medido(operacion, timeout, limitador, en_curso))
+    try:
+        # El umbral cuenta desde que la llamada tiene hueco, no desde que entra en cola
+        await en_curso.wait()
+    except asyncio.CancelledError:
+        primera.cancel()
+        raise
+    hecho, _ = await asyncio.wait({primera}, timeout=umbral)
+    if hecho:
+        return primera.result()
+
+    _contadores["hedges"] += 1
+    segunda = asyncio.create_task(_intento_medido(operacion, timeout - umbral, limitador))
+    pendientes = {primera, segunda}
+    error = None
+    try:
+        while pendientes:
+            hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in hechas:
+                if tarea.exception() is None:
+                    if tarea is segunda:
+                        _contadores["hedges_ganadores"] += 1
+                    return tarea.result()
+                error = tarea.exception()
+        raise error
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+
+def verificar_circuito():
+    """Lanza CircuitoAbierto si el breaker no deja pasar la llamada"""
+    if not breaker.permitir():
+        _contadores["rechazos_circuito"] += 1
+        raise CircuitoAbierto("El servicio de IA no está disponible temporalmente")
+
+def registrar_resultado(error: Exception = None):
+    """Registra en el breaker el resultado de una llamada hecha fuera de ejecutar()"""
+    if error is not None and es_reintentable(error):
+        breaker.registrar_fallo()
+    else:
+        breaker.registrar_exito()
+
+async def ejecutar(operacion: Callable[[], Awaitable], timeout: float = None, limitador=None):
+    """
+    Ejecuta `operacion()` (una corrutina nueva por intento) con presupuesto
+    de latencia, reintentos, hedging y circuit breaker. `limitador` (p. ej. un
+    semáforo) se adquiere por intento antes de empezar a medir.
+    """
+    timeout = timeout or TIMEOUT_SEGUNDOS
+    _contadores["llamadas"] += 1
+
+    for intento in range(MAX_REINTENTOS + 1):
+        verificar_circuito()
+
+        try:
+            resultado = await _con_hedging(operacion, timeout, limitador)
+        except Exception as e:
+            if not es_reintentable(e):
+                # Error de la petición, no del proveedor: no cuenta para el breaker
+                breaker.registrar_exito()
+                _contadores["fallos"] += 1
+                raise
+            breaker.registrar_fallo()
+            if intento == MAX_REINTENTOS:
+                _contadores["fallos"] += 1
+                raise
+            espera = calcular_espera(intento)
+            _contadores["reintentos"] += 1
+            print(f"🔁 Reintentando llamada a IA en {espera:.1f}s ({type(e).__name__}: {e})")
+            await asyncio.sleep(espera)
+            continue
+
+        breaker.registrar_exito()
+        _contadores["exitos"] += 1
+        return resultado
+
+def estadisticas() -> dict:
+    """Contadores de resiliencia del proceso y estado del circuit breaker"""
+    return {
+        **_contadores,
+        "circuito": breaker.estado,
+        "latencia_p50": round(latencias.percentil(0.5), 3) if len(latencias) else None,
+        "latencia_p95": round(latencias.percentil(0.95), 3) if len(latencias) else None
+    }
@@ -1,21 +1,40 @@
 """
-Servicio de integración con IA (Google Gemini)
+Servicio de integración con IA (Google Gemini u otro proveedor, ver ai_proveedores)
 """
 import os
-import google.generativeai as genai
 import json
+from app.services.ai_client import generar_contenido, generar_contenido_stream, MODELO_CACHE
+from app.services import ai_cache
+from app.services.ai_cache import con_cache, calcular_clave
+from app.utils.json_modelo import ExtractorObjetosJSON, ObjetosRecuperados, extraer_objetos_json
 
-# Configurar API de Google
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# Versiones de las plantillas de prompt: cambiarlas invalida la caché de generaciones
+VERSION_PROMPT_LECCIONES = "lecciones-v1"
+VERSION_PROMPT_EXAMEN = "examen-v2"
+VERSION_PROMPT_BANDAS = "bandas-v1"
+VERSION_PROMPT_FEEDBACK = "feedback-v1"
 
-def generar_lecciones_interactivas(texto_curso: str, num_lecciones: int = 5):
+# Si no se recupera ningún objeto de la respuesta, se reintenta una vez
+MAX_INTENTOS_PARSEO = 2
+
+# Presupuesto de latencia del feedback: es un mensaje corto y el alumno lo espera
+TIMEOUT_FEEDBACK = float(os.getenv("AI_TIMEOUT_FEEDBACK", "20"))
+
+async def generar_lecciones_interactivas(texto_curso: str, num_lecciones: int = 5, usar_cache: bool = True):
     """
     Genera lecciones interactivas y fáciles de aprender basadas en el contenido del curso.
     Cada lección incluye: título, contenido explicativo, ejemplos prácticos y puntos clave.
     """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    prompt = f"""
+    contenido = texto_curso[:8000]
+    return await con_cache(
+        "lecciones", VERSION_PROMPT_LECCIONES, MODELO_CACHE, contenido,
+        {"num_lecciones": num_lecciones},
+        lambda: _generar_lecciones(contenido, num_lecciones),
+        usar_cache=usar_cache
+    )
+
+def _prompt_lecciones(contenido: str, num_lecciones: int) -> str:
+    return f"""
     Genera {num_lecciones} lecciones educativas en formato JSON.
     
     REGLAS ESTRICTAS:
@@ -37,53 +56,95 @@ def generar_lecciones_interactivas(texto_curso: str, num_lecciones: int = 5):
     ]
     
     CONTENIDO:
-    {texto_curso[:8000]}
+    {contenido}
     """
-    
-    try:
-        print(f"🤖 Llamando a Gemini para generar {num_lecciones} lecciones...")
-        response = model.generate_content(prompt)
+
+async def _generar_lista_json(prompt: str, descripcion: str, tarea: str, cantidad: int) -> ObjetosRecuperados:
+    """
+    Llama al modelo y recupera los objetos del array JSON de la respuesta.
+    Un resultado parcial se acepta tal cual; solo si no se recupera ningún
+    objeto se reintenta una vez.
+    """
+    for intento in range(1, MAX_INTENTOS_PARSEO + 1):
+        print(f"🤖 Llamando a Gemini para generar {descripcion}...")
+        texto = await generar_contenido(prompt, tarea=tarea, cantidad=cantidad)
         
-        if not response or not response.text:
+        if not texto:
             print("❌ Gemini no devolvió respuesta")
-            return []
-        
-        print(f"✅ Respuesta recibida de Gemini ({len(response.text)} caracteres)")
-        
-        # Limpieza agresiva del JSON
-        texto = response.text
-        texto = texto.replace("```json", "").replace("```", "")
-        texto = texto.strip()
+            continue
         
-        # Remover caracteres de control problemáticos
-        import re
-        texto = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', texto)  # Quitar control chars
-        texto = texto.replace('\\n', ' ')  # Convertir \n a espacios
-        texto = texto.replace('\n', ' ')   # Convertir saltos reales a espacios
-        texto = re.sub(r'\s+', ' ', texto)  # Normalizar espacios
+        print(f"✅ Respuesta recibida de Gemini ({len(texto)} caracteres)")
+        objetos = extraer_objetos_json(texto)
         
-        print(f"🧹 JSON limpiado: {len(texto)} caracteres")
+        if objetos:
+            if not objetos.completo:
+                print(f"⚠️ Respuesta incompleta: {objetos.recuperados} objetos recuperados, "
+                      f"{objetos.descartados} descartados")
+            else:
+                print(f"✅ {objetos.recuperados} objetos parseados correctamente")
+            return objetos
         
-        lecciones = json.loads(texto)
-        print(f"✅ {len(lecciones)} lecciones parseadas correctamente")
-        return lecciones
-        
-    except json.JSONDecodeError as e:
-        print(f"❌ Error parseando JSON de lecciones: {e}")
-        print(f"Texto limpio (primeros 500): {texto[:500]}...")
-        # Intentar parsear manualmente o retornar vacío
-        return []
+        print(f"❌ No se pudo recuperar ningún objeto JSON (intento {intento}). "
+              f"Respuesta (primeros 500): {texto[:500]}...")
+    
+    return ObjetosRecuperados(completo=False)
+
+async def _generar_lecciones(contenido: str, num_lecciones: int):
+    try:
+        return await _generar_lista_json(
+            _prompt_lecciones(contenido, num_lecciones), f"{num_lecciones} lecciones", "lecciones", num_lecciones
+        )
     except Exception as e:
         print(f"❌ Error generando lecciones: {e}")
         return []
 
-def generar_examen_dinamico(texto_curso: str, cantidad: int = 10, enfoque: str = "general"):
+async def generar_lecciones_stream(texto_curso: str, num_lecciones: int = 5):
+    """
+    Variante en streaming de generar_lecciones_interactivas: entrega cada lección
+    en cuanto el modelo termina de escribir su objeto JSON.
+    Comparte la caché con la versión normal (mismo prompt, misma clave).
+    """
+    contenido = texto_curso[:8000]
+    clave = calcular_clave(
+        "lecciones", VERSION_PROMPT_LECCIONES, MODELO_CACHE, contenido,
+        {"num_lecciones": num_lecciones}
+    )
+
+    guardadas = await ai_cache.obtener(clave, "lecciones")
+    if guardadas:
+        for lec in guardadas:
+            yield lec
+        return
+
+    print(f"🤖 Llamando a Gemini (streaming) para generar {num_lecciones} lecciones...")
+    extractor = ExtractorObjetosJSON()
+    lecciones = []
+    async for fragmento in generar_contenido_stream(
+        _prompt_lecciones(contenido, num_lecciones), tarea="lecciones", cantidad=num_lecciones
+    ):
+        for lec in extractor.feed(fragmento):
+            lecciones.append(lec)
+            yield lec
+
+    print(f"✅ {len(lecciones)} lecciones recibidas en streaming ({extractor.descartados} descartadas)")
+    if lecciones and not extractor.descartados and not extractor.incompleto:
+        await ai_cache.guardar(clave, "lecciones", MODELO_CACHE, lecciones)
+
+async def generar_examen_dinamico(texto_curso: str, cantidad: int = 10, enfoque: str = "general",
+                                  usar_cache: bool = True):
     """
     Genera preguntas variadas para evaluar el aprendizaje.
     enfoque: 'general' (todo el texto) o un tema específico si falló antes.
     """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
+    contenido = texto_curso[:20000]
+    return await con_cache(
+        "examen", VERSION_PROMPT_EXAMEN, MODELO_CACHE, contenido,
+        {"cantidad": cantidad, "enfoque": enfoque},
+        lambda: _generar_examen(contenido, cantidad, enfoque),
+        usar_cache=usar_cache
+    )
+
+async def _generar_examen(contenido: str, cantidad: int, enfoque: str):
     prompt = f"""
     Eres un experto pedagogo en tecnología. Genera un examen de {cantidad} preguntas basado en el texto proporcionado.
     
@@ -93,7 +154,8 @@ def generar_examen_dinamico(texto_curso: str, cantidad: int = 10, enfoque: str =
        - "completar" (Frase con un espacio en blanco ____ )
        - "verdadero_falso" (Indicar si una afirmación es cierta)
     2. Si es "completar", en 'opciones' pon la respuesta correcta y 3 palabras falsas para que el usuario elija.
-    3. La salida debe ser EXCLUSIVAMENTE un JSON Array válido.
+    3. En "consejo" escribe un consejo de estudio breve (1 línea) para quien falle la pregunta: qué repasar.
+    4. La salida debe ser EXCLUSIVAMENTE un JSON Array válido.
 
     FORMATO JSON ESPERADO:
     [
@@ -102,50 +164,96 @@ def generar_examen_dinamico(texto_curso: str, cantidad: int = 10, enfoque: str =
             "pregunta": "¿Qué protocolo es ligero?",
             "opciones": ["HTTP", "MQTT", "FTP"],
             "correcta": "MQTT",
-            "explicacion": "MQTT está diseñado para bajo ancho de banda."
+            "explicacion": "MQTT está diseñado para bajo ancho de banda.",
+            "consejo": "Repasa los protocolos de mensajería para IoT y su consumo de ancho de banda."
         }},
         {{
             "tipo": "completar",
             "pregunta": "El ____ Computing procesa datos cerca de la fuente.",
             "opciones": ["Edge", "Cloud", "Fog", "Mist"], 
             "correcta": "Edge",
-            "explicacion": "Edge Computing reduce la latencia."
+            "explicacion": "Edge Computing reduce la latencia.",
+            "consejo": "Repasa las diferencias entre Edge, Fog y Cloud Computing."
         }}
     ]
 
     TEXTO DE ESTUDIO ({enfoque}):
-    {texto_curso[:20000]}
+    {contenido}
     """
     
     try:
-        print(f"🤖 Llamando a Gemini para generar {cantidad} preguntas...")
-        response = model.generate_content(prompt)
-        
-        if not response or not response.text:
-            print("❌ Gemini no devolvió respuesta")
-            return []
-        
-        print(f"✅ Respuesta recibida de Gemini ({len(response.text)} caracteres)")
-        texto_limpio = response.text.replace("```json", "").replace("```", "").strip()
-        
-        preguntas = json.loads(texto_limpio)
-        print(f"✅ {len(preguntas)} preguntas parseadas correctamente")
-        return preguntas
-        
-    except json.JSONDecodeError as e:
-        print(f"❌ Error parseando JSON de preguntas: {e}")
-        print(f"Respuesta de IA: {response.text[:500]}...")
-        return []
+        return await _generar_lista_json(prompt, f"{cantidad} preguntas", "examen", cantidad)
     except Exception as e:
         print(f"❌ Error generando preguntas: {e}")
         return []
 
-def generar_feedback_final(puntaje: int, temas_fallados: list):
+# Mensajes por rango de nota cuando el curso no tiene los suyos (nota_minima descendente)
+BANDAS_POR_DEFECTO = [
+    {"nota_minima": 90, "mensaje": "¡Excelente trabajo! Dominas los contenidos de este curso."},
+    {"nota_minima": 70, "mensaje": "¡Buen trabajo! Repasa las preguntas que fallaste para afianzar lo aprendido."},
+    {"nota_minima": 40, "mensaje": "Vas por buen camino. Repasa los temas de las preguntas que fallaste y vuelve a intentarlo."},
+    {"nota_minima": 0, "mensaje": "No te desanimes: vuelve a las lecciones del curso y inténtalo de nuevo, ¡tú puedes!"}
+]
+
+async def generar_mensajes_bandas(texto_curso: str, usar_cache: bool = True):
+    """
+    Genera una vez por curso los mensajes de feedback por rango de nota,
+    para componer el feedback de cada intento sin llamar al modelo.
+    """
+    contenido = texto_curso[:3000]
+    return await con_cache(
+        "bandas", VERSION_PROMPT_BANDAS, MODELO_CACHE, contenido, {},
+        lambda: _generar_bandas(contenido),
+        usar_cache=usar_cache
+    )
+
+async def _generar_bandas(contenido: str):
+    prompt = f"""
+    Escribe mensajes de feedback para estudiantes que acaban de hacer el examen de un curso
+    sobre el tema del texto, uno por rango de nota (sobre 100).
+    Cada mensaje: máximo 2 líneas, constructivo y motivador, en español.
+    La salida debe ser EXCLUSIVAMENTE un JSON Array válido:
+    [
+        {{"nota_minima": 90, "mensaje": "..."}},
+        {{"nota_minima": 70, "mensaje": "..."}},
+        {{"nota_minima": 40, "mensaje": "..."}},
+        {{"nota_minima": 0, "mensaje": "..."}}
+    ]
+
+    TEXTO DEL CURSO:
+    {contenido}
+    """
+    try:
+        return await _generar_lista_json(prompt, "mensajes por rango de nota", "bandas", 4)
+    except Exception as e:
+        print(f"❌ Error generando mensajes por rango de nota: {e}")
+        return []
+
+async def generar_feedback_final(puntaje: int, temas_fallados: list, usar_cache: bool = True):
     """Genera un consejo motivacional basado en la nota"""
-    model = genai.GenerativeModel('gemini-2.5-flash')
+    feedback = await con_cache(
+        "feedback", VERSION_PROMPT_FEEDBACK, MODELO_CACHE,
+        json.dumps(sorted(temas_fallados), ensure_ascii=False),
+        {"puntaje": puntaje},
+        lambda: _generar_feedback(puntaje, temas_fallados),
+        usar_cache=usar_cache
+    )
+    # Si la IA falla, la nota ya está guardada: devolver un mensaje genérico en vez de un 500
+    return feedback or feedback_generico(puntaje)
+
+def feedback_generico(puntaje: int) -> str:
+    """Mensaje de respaldo cuando la IA no está disponible"""
+    if puntaje >= 70:
+        return f"¡Buen trabajo! Obtuviste {puntaje}/100. Repasa las preguntas que fallaste para afianzar lo aprendido."
+    return f"Obtuviste {puntaje}/100. Repasa los temas de las preguntas que fallaste y vuelve a intentarlo, ¡tú puedes!"
+
+async def _generar_feedback(puntaje: int, temas_fallados: list) -> str:
     prompt = f"""
     Un estudiante obtuvo {puntaje}/100 en su examen. Falló en preguntas sobre: {temas_fallados}.
     Dame un feedback corto (max 2 lineas), constructivo y motivador. Dile qué debe repasar.
     """
-    response = model.generate_content(prompt)
-    return response.text
+    try:
+        return await generar_contenido(prompt, timeout=TIMEOUT_FEEDBACK, tarea="feedback")
+    except Exception as e:
+        print(f"❌ Error generando feedback: {e}")
+        return ""
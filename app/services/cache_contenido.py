@@ -0,0 +1,302 @@
+"""
+Caché de lectura del contenido de los cursos (detalle, lecciones y quizzes)
+Guarda las respuestas ya serializadas por (curso_id, versión, clave). Crear,
+regenerar o eliminar contenido incrementa la versión del curso: las entradas
+anteriores dejan de leerse y el LRU (o el TTL) las desaloja.
+Backend en memoria por proceso o Redis compartido (CACHE_CONTENIDO_REDIS_URL).
+La interfaz de los backends es asíncrona: el cliente de Redis es redis.asyncio
+y no bloquea el event loop; el de memoria responde sin esperar.
+El de memoria solo sirve con un proceso: las versiones son locales y una
+invalidación no llega a los demás workers, que seguirían sirviendo el contenido
+anterior hasta el TTL. Con varios workers hay que usar Redis.
+Cada entrada lleva su ETag (hash del payload), así un If-None-Match que
+coincide se responde con 304 sin consultar la BD ni serializar nada.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple, Optional, Tuple
+import orjson
+from fastapi import Response
+
+CACHE_ACTIVO = os.getenv("CACHE_CONTENIDO_ACTIVO", "true").lower() == "true"
+MAX_BYTES = int(float(os.getenv("CACHE_CONTENIDO_MAX_MB", "64")) * 1024 * 1024)
+TTL_SEGUNDOS = int(os.getenv("CACHE_CONTENIDO_TTL_SEGUNDOS", "3600"))
+REDIS_URL = os.getenv("CACHE_CONTENIDO_REDIS_URL", "")
+PREFIJO_REDIS = os.getenv("CACHE_CONTENIDO_PREFIJO", "techbridge:contenido")
+# Los clientes pueden guardar la respuesta pero deben revalidarla (ETag) antes de usarla
+CACHE_CONTROL = os.getenv("CACHE_CONTENIDO_CACHE_CONTROL", "no-cache")
+
+LONGITUD_ETAG = 32  # Hex de un BLAKE2b de 16 bytes
+
+_contadores = {"aciertos": 0, "fallos": 0, "escrituras": 0, "desalojos": 0, "invalidaciones": 0,
+               "no_modificados": 0}
+
+class Contenido(NamedTuple):
+    payload: bytes
+    etag: str
+
+class CacheMemoria:
+    """LRU acotado por bytes, propio de cada proceso"""
+    nombre = "memoria"
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: int = TTL_SEGUNDOS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # (curso_id, versión, clave) -> (caduca, bytes)
+        self._versiones = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _quitar(self, llave):
+        _, payload = self._entradas.pop(llave)
+        self._bytes -= len(payload)
+
+    async def version(self, curso_id) -> int:
+        with self._lock:
+            return self._versiones.get(curso_id, 0)
+
+    async def incrementar_version(self, curso_id) -> int:
+        with self._lock:
+            version = self._versiones.get(curso_id, 0) + 1
+            self._versiones[curso_id] = version
+            # Las versiones anteriores ya no se leerán: liberar su memoria ahora
+            for llave in [ll for ll in self._entradas if ll[0] == curso_id]:
+                self._quitar(llave)
+            return version
+
+    async def leer(self, curso_id, version: int, clave: str) -> Optional[bytes]:
+        llave = (curso_id, version, clave)
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.monotonic():
+                self._quitar(llave)
+                _contadores["desalojos"] += 1
+                return None
+            self._entradas.move_to_end(llave)
+            return entrada[1]
+
+    async def guardar(self, curso_id, version: int, clave: str, payload: bytes):
+        if len(payload) > self.max_bytes:
+            return
+        llave = (curso_id, version, clave)
+        with self._lock:
+            if llave in self._entradas:
+                self._quitar(llave)
+            self._entradas[llave] = (time.monotonic() + self.ttl, payload)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+                _contadores["desalojos"] += 1
+
+    def tamano(self) -> dict:
+        with self._lock:
+            return {"entradas": len(self._entradas), "bytes": self._bytes}
+
+    async def cerrar(self):
+        pass
+
+class CacheRedis:
+    """
+    Redis compartido entre workers. Las entradas caducan por TTL; el desalojo
+    LRU lo hace el servidor (maxmemory-policy allkeys-lru).
+    """
+    nombre = "redis"
+
+    def __init__(self, url: str, ttl: int = TTL_SEGUNDOS, prefijo: str = PREFIJO_REDIS):
+        from redis.asyncio import Redis
+        self._redis = Redis.from_url(url)
+        self.ttl = ttl
+        self.prefijo = prefijo
+
+    def _llave(self, curso_id, version: int, clave: str) -> str:
+        return f"{self.prefijo}:{curso_id}:{version}:{clave}"
+
+    async def version(self, curso_id) -> int:
+        return int(await self._redis.get(f"{self.prefijo}:version:{curso_id}") or 0)
+
+    async def incrementar_version(self, curso_id) -> int:
+        return int(await self._redis.incr(f"{self.prefijo}:version:{curso_id}"))
+
+    async def leer(self, curso_id, version: int, clave: str) -> Optional[bytes]:
+        return await self._redis.get(self._llave(curso_id, version, clave))
+
+    async def guardar(self, curso_id, version: int, clave: str, payload: bytes):
+        await self._redis.set(self._llave(curso_id, version, clave), payload, ex=self.ttl)
+
+    def tamano(self) -> dict:
+        return {}
+
+    async def cerrar(self):
+        await self._redis.aclose()
+
+def _crear_backend():
+    if REDIS_URL:
+        try:
+            backend = CacheRedis(REDIS_URL)
+            print("🗄️ Caché de contenido en Redis")
+            return backend
+        except Exception as e:
+            print(f"⚠️ No se pudo usar Redis para la caché de contenido ({e}); se usa memoria")
+    if CACHE_ACTIVO and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print("⚠️ Caché de contenido en memoria con varios workers: las invalidaciones no se comparten "
+              "(configura CACHE_CONTENIDO_REDIS_URL)")
+    return CacheMemoria()
+
+_backend = _crear_backend()
+
+def serializar(datos) -> Contenido:
+    """JSON compacto en UTF-8 (como ORJSONResponse), con su ETag"""
+    payload = orjson.dumps(datos, option=orjson.OPT_NON_STR_KEYS)
+    return Contenido(payload, hashlib.blake2b(payload, digest_size=LONGITUD_ETAG // 2).hexdigest())
+
+def _etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (lista separada por comas, W/ o *)"""
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*":
+            return True
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato.strip('"') == etag:
+            return True
+    return False
+
+def responder(contenido: Contenido, if_none_match: Optional[str] = None) -> Response:
+    """200 con el JSON guardado, o 304 sin cuerpo si el cliente ya tiene esa versión"""
+    cabeceras = {"ETag": f'"{contenido.etag}"', "Cache-Control": CACHE_CONTROL}
+    if _etag_coincide(if_none_match, contenido.etag):
+        _contadores["no_modificados"] += 1
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=contenido.payload, media_type="application/json", headers=cabeceras)
+
+async def _leer(curso_id, version: int, clave: str) -> Optional[Contenido]:
+    try:
+        valor = await _backend.leer(curso_id, version, clave)
+    except Exception as e:
+        print(f"⚠️ Error leyendo caché de contenido: {e}")
+        return None
+    if valor is None:
+        return None
+    # Cada valor guardado es ETag (ASCII, longitud fija) + payload
+    return Contenido(valor[LONGITUD_ETAG:], valor[:LONGITUD_ETAG].decode("ascii"))
+
+async def _guardar(curso_id, version: int, clave: str, contenido: Contenido):
+    try:
+        await _backend.guardar(curso_id, version, clave, contenido.etag.encode("ascii") + contenido.payload)
+        _contadores["escrituras"] += 1
+    except Exception as e:
+        print(f"⚠️ Error guardando en caché de contenido: {e}")
+
+async def _version(curso_id) -> Optional[int]:
+    try:
+        return await _backend.version(curso_id)
+    except Exception as e:
+        print(f"⚠️ Error leyendo versión de la caché de contenido: {e}")
+        return None
+
+async def _buscar(curso_id: int, clave: str) -> Tuple[Optional[int], Optional[Contenido]]:
+    # La versión se lee antes de cargar: si el contenido cambia mientras tanto
+    # lo cargado queda bajo la versión vieja y no se vuelve a servir
+    version = await _version(curso_id)
+    if version is not None:
+        contenido = await _leer(curso_id, version, clave)
+        if contenido is not None:
+            _contadores["aciertos"] += 1
+            return version, contenido
+    _contadores["fallos"] += 1
+    return version, None
+
+async def _cargado(curso_id: int, version: Optional[int], clave: str, datos) -> Contenido:
+    contenido = serializar(datos)
+    if version is not None:
+        await _guardar(curso_id, version, clave, contenido)
+    return contenido
+
+async def obtener_o_cargar_async(curso_id: int, clave: str,
+                                 cargar: Callable[[], Awaitable[object]]) -> Contenido:
+    """
+    Payload serializado de `clave` para el curso; si no está en caché se
+    construye con `await cargar()` (que puede lanzar HTTPException) y se guarda.
+    La ruta responde con el payload sin pasar por su response_model: `cargar()`
+    debe construirlo con ese modelo (model_dump), así se valida una vez por
+    versión del contenido y no en cada acierto.
+    """
+    if not CACHE_ACTIVO:
+        return serializar(await cargar())
+    version, contenido = await _buscar(curso_id, clave)
+    if contenido is not None:
+        return contenido
+    return await _cargado(curso_id, version, clave, await cargar())
+
+async def _buscar_leccion(leccion_id: int, clave: str):
+    """(curso_id conocido, versión, contenido) de un recurso pedido por lección"""
+    conocido = await _leer(None, 0, f"leccion:{leccion_id}")
+    curso_id = orjson.loads(conocido.payload) if conocido is not None else None
+    version = await _version(curso_id) if curso_id is not None else None
+    if version is not None:
+        contenido = await _leer(curso_id, version, clave)
+        if contenido is not None:
+            _contadores["aciertos"] += 1
+            return curso_id, version, contenido
+    _contadores["fallos"] += 1
+    return curso_id, version, None
+
+async def _cargado_leccion(leccion_id: int, curso_id, version, clave: str,
+                           cargado: Tuple[int, object]) -> Contenido:
+    curso_real, datos = cargado
+    contenido = serializar(datos)
+    if curso_real != curso_id:
+        await _guardar(None, 0, f"leccion:{leccion_id}", serializar(curso_real))
+        # Primera lectura de la lección: la versión del curso se conoce ahora, después
+        # de cargar. Solo una invalidación justo entre la carga y esta lectura dejaría
+        # guardado el contenido anterior (hasta el TTL)
+        version = await _version(curso_real) if curso_real is not None else None
+    if version is not None:
+        await _guardar(curso_real, version, clave, contenido)
+    return contenido
+
+async def obtener_o_cargar_leccion_async(leccion_id: int, clave: str,
+                                         cargar: Callable[[], Awaitable[Tuple[int, object]]]) -> Contenido:
+    """
+    Igual que obtener_o_cargar_async para recursos pedidos por lección: `cargar()`
+    devuelve (curso_id, datos). El curso de cada lección se recuerda en la caché
+    junto con el payload desde la primera lectura.
+    """
+    if not CACHE_ACTIVO:
+        return serializar((await cargar())[1])
+    curso_id, version, contenido = await _buscar_leccion(leccion_id, clave)
+    if contenido is not None:
+        return contenido
+    return await _cargado_leccion(leccion_id, curso_id, version, clave, await cargar())
+
+async def invalidar_curso(curso_id: int):
+    """Nueva versión del contenido del curso: lo guardado hasta ahora deja de servirse"""
+    if not CACHE_ACTIVO or curso_id is None:
+        return
+    try:
+        await _backend.incrementar_version(curso_id)
+        _contadores["invalidaciones"] += 1
+    except Exception as e:
+        print(f"⚠️ Error invalidando la caché de contenido del curso {curso_id}: {e}")
+
+async def cerrar():
+    """Cierra las conexiones del backend (al apagar la aplicación)"""
+    await _backend.cerrar()
+
+def estadisticas() -> dict:
+    """Contadores de la caché de contenido en este proceso"""
+    consultas = _contadores["aciertos"] + _contadores["fallos"]
+    return {
+        "activa": CACHE_ACTIVO,
+        "backend": _backend.nombre,
+        **_contadores,
+        **_backend.tamano(),
+        "tasa_aciertos": round(_contadores["aciertos"] / consultas, 3) if consultas else 0.0
+    }
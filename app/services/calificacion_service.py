@@ -0,0 +1,122 @@
+"""
+Servicio de calificación de exámenes
+Trabaja por conjuntos: una consulta para todas las preguntas y un único
+upsert para todo el progreso, sea cual sea el tamaño del examen.
+"""
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import Pregunta, Progreso
+
+def calificar_respuestas(db: Session, respuestas: Dict[int, str]) -> dict:
+    """
+    Corrige las respuestas {pregunta_id: respuesta} y devuelve puntaje, total,
+    temas fallados, consejos de estudio, detalles y las filas de progreso a guardar.
+    Las preguntas que no existen se ignoran.
+    """
+    if respuestas:
+        preguntas = {
+            p.id: p for p in db.scalars(select(Pregunta).where(Pregunta.id.in_(list(respuestas.keys()))))
+        }
+    else:
+        preguntas = {}
+
+    puntaje = 0
+    temas_fallados = []
+    consejos = []
+    detalles = []
+    resultados = []
+
+    for preg_id, resp_usuario in respuestas.items():
+        pregunta = preguntas.get(preg_id)
+        if not pregunta:
+            continue
+
+        correcta = pregunta.respuesta_correcta.lower().strip()
+        es_correcto = correcta == resp_usuario.lower().strip()
+
+        if es_correcto:
+            puntaje += 1
+        else:
+            temas_fallados.append(pregunta.texto_pregunta)
+            consejos.append(pregunta.consejo_estudio or f"Repasa el tema de la pregunta: «{pregunta.texto_pregunta}»")
+
+        detalles.append({
+            "pregunta": pregunta.texto_pregunta,
+            "respuesta_usuario": resp_usuario,
+            "respuesta_correcta": pregunta.respuesta_correcta,
+            "correcto": es_correcto,
+            "explicacion": pregunta.explicacion_feedback
+        })
+        resultados.append({"pregunta_id": preg_id, "respuesta_elegida": resp_usuario, "es_correcto": es_correcto})
+
+    return {
+        "curso_id": next(iter(preguntas.values())).curso_id if preguntas else None,
+        "puntaje": puntaje,
+        "total": len(resultados),
+        "temas_fallados": temas_fallados,
+        "consejos": consejos,
+        "detalles": detalles,
+        "resultados": resultados
+    }
+
+def _insert_con_upsert(dialecto: str):
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+def guardar_progreso(db: Session, usuario_id: int, resultados: List[dict]):
+    """
+    Inserta o actualiza el progreso de todas las preguntas del examen.
+    SQLite y PostgreSQL: un solo INSERT ... ON CONFLICT DO UPDATE.
+    Otros motores: una consulta para las filas existentes y escritura en bloque.
+    No hace commit.
+    """
+    if not resultados:
+        return
+
+    filas = [{"usuario_id": usuario_id, "intentos": 1, **r} for r in resultados]
+    insert = _insert_con_upsert(db.get_bind().dialect.name)
+
+    if insert is not None:
+        sentencia = insert(Progreso).values(filas)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[Progreso.usuario_id, Progreso.pregunta_id],
+            set_={
+                "intentos": Progreso.intentos + 1,
+                "respuesta_elegida": sentencia.excluded.respuesta_elegida,
+                "es_correcto": sentencia.excluded.es_correcto
+            }
+        )
+        db.execute(sentencia)
+        return
+
+    existentes = {
+        p.pregunta_id: p for p in db.scalars(select(Progreso).where(
+            Progreso.usuario_id == usuario_id,
+            Progreso.pregunta_id.in_([r["pregunta_id"] for r in resultados])
+        ))
+    }
+    nuevas = []
+    for fila in filas:
+        progreso = existentes.get(fila["pregunta_id"])
+        if progreso:
+            progreso.intentos += 1
+            progreso.respuesta_elegida = fila["respuesta_elegida"]
+            progreso.es_correcto = fila["es_correcto"]
+        else:
+            nuevas.append(Progreso(**fila))
+    db.add_all(nuevas)
+
+async def calificar_respuestas_async(db: AsyncSession, respuestas: Dict[int, str]) -> dict:
+    """calificar_respuestas sobre una AsyncSession"""
+    return await db.run_sync(calificar_respuestas, respuestas)
+
+async def guardar_progreso_async(db: AsyncSession, usuario_id: int, resultados: List[dict]):
+    """guardar_progreso sobre una AsyncSession; no hace commit"""
+    await db.run_sync(guardar_progreso, usuario_id, resultados)
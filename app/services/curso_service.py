@@ -0,0 +1,115 @@
+"""
+Servicio de creación de contenido de cursos (lecciones y preguntas generadas con IA)
+"""
+import asyncio
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import Leccion, Pregunta, CursoContenido, BandaFeedback
+from app.services.ai_service import generar_mensajes_bandas
+from app.services.generacion_fragmentada import generar_lecciones_fragmentadas, generar_examen_fragmentado
+from app.utils.compresion import comprimir_texto, descomprimir_texto
+
+def guardar_texto_curso(db: Session, curso_id: int, texto: str):
+    """Guarda (o reemplaza) el texto de origen del curso comprimido; no hace commit"""
+    contenido = db.get(CursoContenido, curso_id) or CursoContenido(curso_id=curso_id)
+    contenido.compresion = "zlib"
+    contenido.texto_comprimido = comprimir_texto(texto, "zlib")
+    contenido.tamano_original = len(texto)
+    db.add(contenido)
+
+def obtener_texto_curso(db: Session, curso_id: int) -> Optional[str]:
+    """Texto de origen del curso; solo lo cargan las rutas que generan contenido"""
+    contenido = db.get(CursoContenido, curso_id)
+    if not contenido or not contenido.texto_comprimido:
+        return None
+    return descomprimir_texto(contenido.texto_comprimido, contenido.compresion)
+
+async def obtener_texto_curso_async(db: AsyncSession, curso_id: int) -> Optional[str]:
+    """obtener_texto_curso sobre una AsyncSession"""
+    return await db.run_sync(obtener_texto_curso, curso_id)
+
+def leccion_desde_ia(curso_id: int, lec: dict, orden: int = None) -> Leccion:
+    """Construye una fila Leccion a partir de un objeto generado por la IA"""
+    return Leccion(
+        curso_id=curso_id,
+        titulo=lec.get("titulo", "Sin título"),
+        orden=orden if orden is not None else lec.get("orden", 1),
+        contenido_markdown=lec.get("contenido_markdown", ""),
+        ejemplos_codigo=lec.get("ejemplos_codigo", []),
+        puntos_clave=lec.get("puntos_clave", []),
+        duracion_estimada=lec.get("duracion_estimada", 5)
+    )
+
+def pregunta_desde_ia(curso_id: int, p: dict) -> Pregunta:
+    """Construye una fila Pregunta a partir de un objeto generado por la IA"""
+    return Pregunta(
+        curso_id=curso_id,
+        tipo=p.get("tipo", "multiple"),
+        texto_pregunta=p.get("pregunta", ""),
+        opciones_json=p.get("opciones", []),
+        respuesta_correcta=p.get("correcta", ""),
+        explicacion_feedback=p.get("explicacion", ""),
+        consejo_estudio=p.get("consejo") or None,
+        dificultad=p.get("dificultad", "media")
+    )
+
+def reemplazar_bandas(db: Session, curso_id: int, bandas: list) -> int:
+    """Sustituye los mensajes por rango de nota del curso (los inválidos se ignoran); no hace commit"""
+    db.query(BandaFeedback).filter(BandaFeedback.curso_id == curso_id).delete(synchronize_session=False)
+    validas = {}
+    for banda in bandas or []:
+        nota = banda.get("nota_minima")
+        mensaje = banda.get("mensaje")
+        if isinstance(nota, (int, float)) and 0 <= nota <= 100 and isinstance(mensaje, str) and mensaje.strip():
+            validas[int(nota)] = mensaje.strip()
+    for nota, mensaje in validas.items():
+        db.add(BandaFeedback(curso_id=curso_id, nota_minima=nota, mensaje=mensaje))
+    return len(validas)
+
+async def reemplazar_bandas_async(db: AsyncSession, curso_id: int, bandas: list) -> int:
+    """reemplazar_bandas sobre una AsyncSession; no hace commit"""
+    return await db.run_sync(reemplazar_bandas, curso_id, bandas)
+
+async def generar_y_guardar_lecciones(db: AsyncSession, curso_id: int, texto: str, num_lecciones: int) -> list:
+    """Genera las lecciones con IA y las añade a la sesión en cuanto llega la respuesta; no hace commit"""
+    try:
+        print(f"🤖 Generando {num_lecciones} lecciones con IA...")
+        lecciones_generadas = await generar_lecciones_fragmentadas(texto, num_lecciones=num_lecciones)
+    except Exception as e:
+        print(f"⚠️ Error generando lecciones: {str(e)}")
+        # Continuar aunque falle la generación de lecciones
+        return []
+    
+    if not lecciones_generadas:
+        print("⚠️ No se generaron lecciones")
+        return []
+    
+    lecciones_creadas = [leccion_desde_ia(curso_id, lec) for lec in lecciones_generadas]
+    db.add_all(lecciones_creadas)
+    return lecciones_creadas
+
+async def generar_y_guardar_preguntas(db: AsyncSession, curso_id: int, texto: str, num_preguntas: int) -> list:
+    """
+    Genera las preguntas de evaluación con IA y las añade a la sesión en cuanto llega la respuesta.
+    A la vez genera los mensajes de feedback por rango de nota del curso. No hace commit.
+    """
+    try:
+        print(f"🤖 Generando {num_preguntas} preguntas con IA...")
+        preguntas_generadas, bandas = await asyncio.gather(
+            generar_examen_fragmentado(texto, cantidad=num_preguntas),
+            generar_mensajes_bandas(texto)
+        )
+    except Exception as e:
+        print(f"⚠️ Error generando preguntas: {str(e)}")
+        # Continuar aunque falle la generación de preguntas
+        return []
+    
+    if not preguntas_generadas:
+        print("⚠️ No se generaron preguntas")
+        return []
+    
+    preguntas_creadas = [pregunta_desde_ia(curso_id, p) for p in preguntas_generadas]
+    db.add_all(preguntas_creadas)
+    await reemplazar_bandas_async(db, curso_id, bandas)
+    return preguntas_creadas
@@ -0,0 +1,146 @@
+"""
+Feedback de los intentos de examen
+Por defecto se compone en local con los fragmentos generados junto al examen
+(mensaje por rango de nota + consejos de las preguntas falladas). Con el
+modo IA la nota se devuelve al instante y el feedback del modelo se genera
+en segundo plano; en ambos casos queda guardado en el intento.
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import IntentoExamenGuardado, BandaFeedback
+from app.services.ai_service import generar_feedback_final, BANDAS_POR_DEFECTO
+from app.utils.database_async import AsyncSessionLocal
+
+# Feedback con llamada al modelo por intento (opt-in); si no, se compone en local
+FEEDBACK_IA = os.getenv("FEEDBACK_IA", "false").lower() == "true"
+MAX_CONSEJOS = int(os.getenv("FEEDBACK_MAX_CONSEJOS", "3"))
+
+# Un intento pendiente más antiguo que esto y sin tarea en este proceso se vuelve a lanzar
+REINTENTO_FEEDBACK_SEGUNDOS = int(os.getenv("FEEDBACK_REINTENTO_SEGUNDOS", "60"))
+
+# Tareas en curso y avisos para los clientes SSE, por intento
+_tareas = {}
+_avisos = {}
+
+def obtener_bandas(db: Session, curso_id: int) -> list:
+    """Mensajes por rango de nota del curso (de mayor a menor nota mínima)"""
+    bandas = []
+    if curso_id is not None:
+        bandas = [
+            {"nota_minima": b.nota_minima, "mensaje": b.mensaje}
+            for b in db.query(BandaFeedback.nota_minima, BandaFeedback.mensaje).filter(
+                BandaFeedback.curso_id == curso_id
+            ).order_by(BandaFeedback.nota_minima.desc())
+        ]
+    return bandas or BANDAS_POR_DEFECTO
+
+async def obtener_bandas_async(db: AsyncSession, curso_id: int) -> list:
+    """obtener_bandas sobre una AsyncSession"""
+    return await db.run_sync(obtener_bandas, curso_id)
+
+def componer_feedback(nota: int, consejos: list, bandas: list) -> str:
+    """Feedback personalizado sin llamar al modelo: mensaje de la banda + qué repasar"""
+    mensaje = next((b["mensaje"] for b in bandas if nota >= b["nota_minima"]), None)
+    if mensaje is None:
+        mensaje = BANDAS_POR_DEFECTO[-1]["mensaje"]
+    lineas = [f"Obtuviste {nota}/100. {mensaje}"]
+
+    unicos = list(dict.fromkeys(c.strip() for c in consejos if c and c.strip()))
+    if unicos:
+        lineas.append("Para mejorar:")
+        lineas.extend(f"• {consejo}" for consejo in unicos[:MAX_CONSEJOS])
+    return "\n".join(lineas)
+
+def crear_intento(db: Session, usuario_id: int, calificacion: dict, nota: int,
+                  feedback: str = None) -> IntentoExamenGuardado:
+    """
+    Registra el intento con su nota; no hace commit.
+    Sin `feedback` queda pendiente de generarse en segundo plano.
+    """
+    intento = IntentoExamenGuardado(
+        id=uuid.uuid4().hex,
+        usuario_id=usuario_id,
+        curso_id=calificacion["curso_id"],
+        nota=nota,
+        correctas=calificacion["puntaje"],
+        incorrectas=calificacion["total"] - calificacion["puntaje"],
+        temas_fallados=calificacion["temas_fallados"],
+        detalles=calificacion["detalles"],
+        estado_feedback="pendiente" if feedback is None else "completado",
+        feedback=feedback,
+        fecha_feedback=None if feedback is None else datetime.now()
+    )
+    db.add(intento)
+    return intento
+
+async def crear_intento_async(db: AsyncSession, usuario_id: int, calificacion: dict, nota: int,
+                              feedback: str = None) -> IntentoExamenGuardado:
+    """crear_intento sobre una AsyncSession; no hace commit"""
+    return await db.run_sync(crear_intento, usuario_id, calificacion, nota, feedback)
+
+async def _generar(intento_id: str, nota: int, temas_fallados: list):
+    try:
+        feedback = await generar_feedback_final(nota, temas_fallados)
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(IntentoExamenGuardado).where(IntentoExamenGuardado.id == intento_id).values(
+                feedback=feedback,
+                estado_feedback="completado",
+                fecha_feedback=datetime.now()
+            ))
+            await db.commit()
+    except Exception as e:
+        print(f"❌ Error generando feedback del intento {intento_id}: {str(e)}")
+    finally:
+        _tareas.pop(intento_id, None)
+        aviso = _avisos.pop(intento_id, None)
+        if aviso:
+            aviso.set()
+
+def programar_feedback(intento_id: str, nota: int, temas_fallados: list):
+    """Lanza la generación del feedback sin bloquear la respuesta"""
+    if intento_id in _tareas:
+        return
+    _tareas[intento_id] = asyncio.create_task(_generar(intento_id, nota, temas_fallados))
+
+def rescatar_si_huerfano(intento: IntentoExamenGuardado):
+    """
+    Si el intento sigue pendiente pero ningún worker de este proceso lo está
+    generando (p. ej. tras un reinicio), vuelve a lanzarlo.
+    """
+    if intento.estado_feedback != "pendiente" or intento.id in _tareas:
+        return
+    if intento.fecha_creacion and datetime.now() - intento.fecha_creacion < timedelta(seconds=REINTENTO_FEEDBACK_SEGUNDOS):
+        return
+    programar_feedback(intento.id, intento.nota, intento.temas_fallados or [])
+
+async def esperar_feedback(intento_id: str, timeout: float):
+    """Espera a que termine la generación en este proceso (o hasta `timeout`)"""
+    if intento_id not in _tareas:
+        await asyncio.sleep(min(timeout, 1))
+        return
+    aviso = _avisos.setdefault(intento_id, asyncio.Event())
+    try:
+        await asyncio.wait_for(aviso.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+def serializar_intento(intento: IntentoExamenGuardado) -> dict:
+    """Representación del intento para la API"""
+    return {
+        "intento_id": intento.id,
+        "usuario_id": intento.usuario_id,
+        "curso_id": intento.curso_id,
+        "nota": intento.nota,
+        "correctas": intento.correctas,
+        "incorrectas": intento.incorrectas,
+        "detalles": intento.detalles or [],
+        "estado_feedback": intento.estado_feedback,
+        "feedback": intento.feedback,
+        "fecha_creacion": intento.fecha_creacion,
+        "fecha_feedback": intento.fecha_feedback
+    }
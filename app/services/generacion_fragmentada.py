@@ -0,0 +1,157 @@
+"""
+Generación fragmentada (map-reduce) para documentos largos
+Divide el texto en fragmentos alineados a secciones, genera lecciones y
+preguntas por fragmento en paralelo y une los resultados sin duplicados.
+"""
+import os
+import re
+import asyncio
+from typing import List
+from app.services.ai_service import generar_lecciones_interactivas, generar_examen_dinamico
+
+MODO_FRAGMENTADO = os.getenv("AI_MODO_FRAGMENTADO", "true").lower() == "true"
+TAMANO_FRAGMENTO = int(os.getenv("AI_TAMANO_FRAGMENTO", "8000"))
+FRAGMENTOS_PARALELOS = int(os.getenv("AI_FRAGMENTOS_PARALELOS", "4"))
+
+# Líneas que suelen abrir una sección: "1.2 Título", "# Título", "Capítulo 3", "UNIDAD DE REDES"...
+_PATRON_TITULO = re.compile(
+    r"^\s*(#{1,6}\s+\S"
+    r"|\d+(\.\d+)*[.)]?\s+[A-ZÁÉÍÓÚÑ]"
+    r"|(cap[ií]tulo|tema|unidad|secci[oó]n|m[oó]dulo|lecci[oó]n)\b"
+    r"|[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ0-9 ,:\-]{4,}$)",
+    re.IGNORECASE
+)
+
+def _es_titulo(linea: str) -> bool:
+    return len(linea) < 120 and bool(_PATRON_TITULO.match(linea))
+
+def _partir_bloque(bloque: str, tamano_maximo: int) -> List[str]:
+    """Corta un bloque más largo que el máximo por el último fin de frase o espacio"""
+    partes = []
+    while len(bloque) > tamano_maximo:
+        corte = max(bloque.rfind(". ", 0, tamano_maximo), bloque.rfind("\n", 0, tamano_maximo))
+        if corte < tamano_maximo // 2:
+            corte = bloque.rfind(" ", 0, tamano_maximo)
+        if corte <= 0:
+            corte = tamano_maximo - 1
+        partes.append(bloque[:corte + 1])
+        bloque = bloque[corte + 1:]
+    if bloque.strip():
+        partes.append(bloque)
+    return partes
+
+def dividir_en_secciones(texto: str, tamano_maximo: int = TAMANO_FRAGMENTO) -> List[str]:
+    """
+    Divide el texto en fragmentos de como máximo `tamano_maximo` caracteres.
+    Prefiere cortar antes de un título de sección, luego entre párrafos.
+    """
+    if len(texto) <= tamano_maximo:
+        return [texto]
+
+    fragmentos = []
+    actual = []
+    longitud = 0
+
+    def cerrar():
+        nonlocal actual, longitud
+        if actual:
+            fragmentos.append("\n".join(actual))
+        actual, longitud = [], 0
+
+    for linea in texto.split("\n"):
+        # Un título abre fragmento nuevo si el actual ya tiene un tamaño razonable
+        if _es_titulo(linea) and longitud >= tamano_maximo // 2:
+            cerrar()
+        if longitud + len(linea) + 1 > tamano_maximo:
+            cerrar()
+        if len(linea) > tamano_maximo:
+            fragmentos.extend(_partir_bloque(linea, tamano_maximo))
+            continue
+        actual.append(linea)
+        longitud += len(linea) + 1
+    cerrar()
+
+    return [f for f in fragmentos if f.strip()]
+
+def repartir_cantidad(total: int, longitudes: List[int]) -> List[int]:
+    """Reparte `total` elementos entre fragmentos en proporción a su longitud"""
+    if total < len(longitudes):
+        # Menos elementos que fragmentos: uno por fragmento, espaciados a lo largo del documento
+        cuotas = [0] * len(longitudes)
+        for i in range(total):
+            cuotas[(i * len(longitudes)) // total] = 1
+        return cuotas
+
+    suma = sum(longitudes) or 1
+    cuotas = [int(total * lon / suma) for lon in longitudes]
+    # Repartir el resto a los fragmentos más largos
+    restantes = total - sum(cuotas)
+    for indice in sorted(range(len(longitudes)), key=lambda i: -longitudes[i])[:restantes]:
+        cuotas[indice] += 1
+    return cuotas
+
+def _normalizar(texto: str) -> str:
+    return re.sub(r"\W+", " ", (texto or "").lower()).strip()
+
+async def _generar_por_fragmentos(fragmentos: List[str], cuotas: List[int], generar) -> List[list]:
+    """Ejecuta `generar(fragmento, cantidad)` con paralelismo acotado, en orden de fragmento"""
+    semaforo = asyncio.Semaphore(FRAGMENTOS_PARALELOS)
+
+    async def uno(fragmento, cantidad):
+        async with semaforo:
+            return await generar(fragmento, cantidad)
+
+    return await asyncio.gather(*[
+        uno(fragmento, cantidad) for fragmento, cantidad in zip(fragmentos, cuotas) if cantidad > 0
+    ])
+
+async def generar_lecciones_fragmentadas(texto_curso: str, num_lecciones: int = 5, usar_cache: bool = True):
+    """Lecciones que cubren todo el documento; `orden` se renumera de 1 a N"""
+    fragmentos = dividir_en_secciones(texto_curso) if MODO_FRAGMENTADO else [texto_curso]
+    if len(fragmentos) == 1:
+        return await generar_lecciones_interactivas(texto_curso, num_lecciones=num_lecciones, usar_cache=usar_cache)
+
+    print(f"🧩 Generando lecciones en {len(fragmentos)} fragmentos")
+    cuotas = repartir_cantidad(num_lecciones, [len(f) for f in fragmentos])
+    resultados = await _generar_por_fragmentos(
+        fragmentos, cuotas,
+        lambda fragmento, n: generar_lecciones_interactivas(fragmento, num_lecciones=n, usar_cache=usar_cache)
+    )
+
+    lecciones = []
+    vistas = set()
+    for parciales in resultados:
+        for lec in sorted(parciales or [], key=lambda l: l.get("orden") or 0):
+            clave = _normalizar(lec.get("titulo"))
+            if clave in vistas:
+                continue
+            vistas.add(clave)
+            lecciones.append(lec)
+
+    # Copias: los dicts pueden venir de la caché de IA o de una petición compartida en curso
+    return [{**lec, "orden": orden} for orden, lec in enumerate(lecciones[:num_lecciones], start=1)]
+
+async def generar_examen_fragmentado(texto_curso: str, cantidad: int = 10, usar_cache: bool = True):
+    """Preguntas que cubren todo el documento, sin preguntas repetidas"""
+    fragmentos = dividir_en_secciones(texto_curso) if MODO_FRAGMENTADO else [texto_curso]
+    if len(fragmentos) == 1:
+        return await generar_examen_dinamico(texto_curso, cantidad=cantidad, usar_cache=usar_cache)
+
+    print(f"🧩 Generando preguntas en {len(fragmentos)} fragmentos")
+    cuotas = repartir_cantidad(cantidad, [len(f) for f in fragmentos])
+    resultados = await _generar_por_fragmentos(
+        fragmentos, cuotas,
+        lambda fragmento, n: generar_examen_dinamico(fragmento, cantidad=n, usar_cache=usar_cache)
+    )
+
+    preguntas = []
+    vistas = set()
+    for parciales in resultados:
+        for pregunta in parciales or []:
+            clave = _normalizar(pregunta.get("pregunta"))
+            if clave in vistas:
+                continue
+            vistas.add(clave)
+            preguntas.append(pregunta)
+
+    return preguntas[:cantidad]
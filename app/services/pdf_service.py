@@ -1,12 +1,114 @@
 """
 Servicio de procesamiento de archivos PDF
+Extrae el texto página a página; los documentos grandes se reparten
+por rangos de páginas entre varios procesos.
 """
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
 from PyPDF2 import PdfReader
 
-def extraer_texto_pdf(ruta_archivo: str) -> str:
-    """Lee un PDF y devuelve todo el texto como un string"""
+PROCESOS_PDF = int(os.getenv("PDF_PROCESOS", str(os.cpu_count() or 1)))
+PAGINAS_MIN_PARALELO = int(os.getenv("PDF_PAGINAS_MIN_PARALELO", "40"))
+
+# Límites por defecto para el pipeline de cursos (0 = sin límite)
+MAX_PAGINAS = int(os.getenv("PDF_MAX_PAGINAS", "0")) or None
+MAX_CARACTERES = int(os.getenv("PDF_MAX_CARACTERES", "0")) or None
+
+_pool = None
+
+def iniciar_pool():
+    """
+    Crea el pool de procesos compartido; lo llama el arranque de la app.
+    Con forkserver los procesos no se clonan desde el hilo que pida la extracción.
+    """
+    global _pool
+    if _pool is None and PROCESOS_PDF > 1:
+        metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+        _pool = ProcessPoolExecutor(max_workers=PROCESOS_PDF, mp_context=multiprocessing.get_context(metodo))
+
+def detener_pool():
+    """Cierra el pool de procesos (al apagar la app)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+def _texto_pagina(page) -> str:
+    """Texto de una página; las páginas sin texto o ilegibles devuelven "" """
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        print(f"⚠️ No se pudo extraer una página del PDF: {e}")
+        return ""
+
+def _extraer_rango(ruta_archivo: str, inicio: int, fin: int) -> List[str]:
+    """Extrae las páginas [inicio, fin) en un proceso del pool"""
     reader = PdfReader(ruta_archivo)
-    texto_completo = ""
-    for page in reader.pages:
-        texto_completo += page.extract_text()
+    return [_texto_pagina(reader.pages[i]) for i in range(inicio, fin)]
+
+def contar_paginas(ruta_archivo: str) -> int:
+    """Número de páginas del PDF"""
+    return len(PdfReader(ruta_archivo).pages)
+
+def iterar_paginas_pdf(ruta_archivo: str, max_paginas: Optional[int] = None) -> Iterator[str]:
+    """Genera el texto del PDF página a página, sin cargar todo el documento en un string"""
+    reader = PdfReader(ruta_archivo)
+    total = len(reader.pages)
+    if max_paginas:
+        total = min(total, max_paginas)
+    for indice in range(total):
+        yield _texto_pagina(reader.pages[indice])
+
+def _iterar_paginas_paralelo(ruta_archivo: str, total: int) -> Iterator[str]:
+    """Reparte rangos de páginas entre procesos y devuelve las páginas en orden"""
+    if total == 0:
+        return
+    num_rangos = min(total, PROCESOS_PDF * 2)
+    tamano = -(-total // num_rangos)
+    futuros = [
+        _pool.submit(_extraer_rango, ruta_archivo, inicio, min(inicio + tamano, total))
+        for inicio in range(0, total, tamano)
+    ]
+    try:
+        for futuro in futuros:
+            yield from futuro.result()
+    finally:
+        # Si el consumidor se detuvo antes (presupuesto agotado), no procesar el resto
+        for futuro in futuros:
+            futuro.cancel()
+
+def extraer_texto_pdf(ruta_archivo: str, max_paginas: Optional[int] = None,
+                      max_caracteres: Optional[int] = None, paralelo: Optional[bool] = None) -> str:
+    """
+    Lee un PDF y devuelve todo el texto como un string.
+    max_paginas / max_caracteres permiten dejar de leer antes de tiempo.
+    paralelo=None decide automáticamente según el número de páginas. Sin el pool
+    iniciado (scripts, fuera de la app) se lee en este proceso.
+    """
+    total = contar_paginas(ruta_archivo)
+    if max_paginas:
+        total = min(total, max_paginas)
+
+    if paralelo is None:
+        paralelo = PROCESOS_PDF > 1 and total >= PAGINAS_MIN_PARALELO
+
+    if paralelo and _pool is not None:
+        paginas = _iterar_paginas_paralelo(ruta_archivo, total)
+    else:
+        paginas = iterar_paginas_pdf(ruta_archivo, max_paginas=total)
+
+    partes = []
+    caracteres = 0
+    for texto_pagina in paginas:
+        partes.append(texto_pagina)
+        caracteres += len(texto_pagina) + 1
+        if max_caracteres and caracteres >= max_caracteres:
+            paginas.close()
+            break
+
+    texto_completo = "\n".join(partes)
+    if max_caracteres:
+        texto_completo = texto_completo[:max_caracteres]
     return texto_completo
@@ -0,0 +1,45 @@
+"""
+Servicio de progreso de los estudiantes
+Mantiene el resumen por (usuario, curso) de forma incremental para que
+las pantallas de progreso lo lean sin recorrer todas las lecciones.
+"""
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import ResumenProgresoCurso
+
+def registrar_actividad(db: Session, usuario_id: int, curso_id: int,
+                        completadas: int = 0, tiempo: int = 0):
+    """
+    Suma lecciones completadas y tiempo al resumen del usuario en el curso.
+    Incremento atómico en la BD; la fila se crea la primera vez. No hace commit.
+    """
+    valores = {
+        ResumenProgresoCurso.lecciones_completadas: ResumenProgresoCurso.lecciones_completadas + completadas,
+        ResumenProgresoCurso.tiempo_total: ResumenProgresoCurso.tiempo_total + tiempo,
+        ResumenProgresoCurso.ultima_actividad: datetime.now()
+    }
+    filtro = (ResumenProgresoCurso.usuario_id == usuario_id, ResumenProgresoCurso.curso_id == curso_id)
+
+    if db.execute(update(ResumenProgresoCurso).where(*filtro).values(valores)).rowcount:
+        return
+
+    try:
+        with db.begin_nested():
+            db.add(ResumenProgresoCurso(
+                usuario_id=usuario_id,
+                curso_id=curso_id,
+                lecciones_completadas=completadas,
+                tiempo_total=tiempo,
+                ultima_actividad=datetime.now()
+            ))
+    except IntegrityError:
+        # Otra petición creó la fila a la vez: sumar sobre ella
+        db.execute(update(ResumenProgresoCurso).where(*filtro).values(valores))
+
+async def registrar_actividad_async(db: AsyncSession, usuario_id: int, curso_id: int,
+                                    completadas: int = 0, tiempo: int = 0):
+    """registrar_actividad sobre una AsyncSession; no hace commit"""
+    await db.run_sync(registrar_actividad, usuario_id, curso_id, completadas, tiempo)
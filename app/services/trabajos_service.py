@@ -0,0 +1,340 @@
+"""
+Servicio de trabajos en segundo plano para crear cursos a partir de PDFs
+Los trabajos se guardan en la BD: sobreviven a reinicios y se reanudan
+desde la última etapa completada.
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update, delete
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import Curso, Leccion, Pregunta, TrabajoCurso, CursoContenido
+from app.services.pdf_service import extraer_texto_pdf, MAX_PAGINAS, MAX_CARACTERES
+from app.services.curso_service import (
+    generar_y_guardar_lecciones, generar_y_guardar_preguntas, guardar_texto_curso, obtener_texto_curso
+)
+from app.services.cache_contenido import invalidar_curso
+from app.utils.database_async import AsyncSessionLocal
+from app.utils.replicas import fijar_contenido
+
+NUM_WORKERS = int(os.getenv("TRABAJOS_WORKERS", "2"))
+MAX_INTENTOS = int(os.getenv("TRABAJOS_MAX_INTENTOS", "3"))
+LEASE_SEGUNDOS = int(os.getenv("TRABAJOS_LEASE_SEGUNDOS", "600"))
+INTERVALO_REVISION = int(os.getenv("TRABAJOS_INTERVALO_REVISION", "30"))
+
+ESTADOS_ACTIVOS = ("pendiente", "en_proceso")
+
+# Progreso (%) asociado a la última etapa completada
+PROGRESO_ETAPAS = {
+    "recibido": 10,
+    "extraccion": 30,
+    "generacion": 100,
+    "completado": 100
+}
+
+class ErrorTrabajo(Exception):
+    """Error definitivo: el trabajo falla sin reintentos"""
+
+class LeasePerdido(Exception):
+    """El lease venció y otro worker retomó el trabajo: este deja de escribir en él"""
+
+_cola = None
+_en_cola = set()
+_tareas = []
+
+async def crear_trabajo(db: AsyncSession, nombre: str, proveedor: str, ruta_pdf: str,
+                        num_lecciones: int = 5, num_preguntas: int = 10, hash_pdf: str = None) -> TrabajoCurso:
+    """Registra un trabajo nuevo y lo pone en la cola de procesamiento"""
+    trabajo = TrabajoCurso(
+        id=uuid.uuid4().hex,
+        nombre=nombre,
+        proveedor=proveedor,
+        ruta_pdf=ruta_pdf,
+        hash_pdf=hash_pdf,
+        num_lecciones=num_lecciones,
+        num_preguntas=num_preguntas,
+        estado="pendiente",
+        etapa="recibido",
+        progreso=PROGRESO_ETAPAS["recibido"]
+    )
+    db.add(trabajo)
+    await db.commit()
+    encolar(trabajo.id)
+    return trabajo
+
+def encolar(trabajo_id: str):
+    """Añade el trabajo a la cola local (si los workers están activos)"""
+    if _cola is None or trabajo_id in _en_cola:
+        return
+    _en_cola.add(trabajo_id)
+    _cola.put_nowait(trabajo_id)
+
+def _vencimiento() -> datetime:
+    return datetime.now() + timedelta(seconds=LEASE_SEGUNDOS)
+
+async def _reclamar(db: AsyncSession, trabajo_id: str):
+    """
+    Toma el trabajo para este worker con un lease en la BD.
+    Evita que dos procesos trabajen a la vez sobre el mismo trabajo.
+    El lease es del worker mientras `intentos` no cambie: reclamarlo lo incrementa.
+    """
+    ahora = datetime.now()
+    filas = (await db.execute(update(TrabajoCurso).where(
+        TrabajoCurso.id == trabajo_id,
+        TrabajoCurso.estado.in_(ESTADOS_ACTIVOS),
+        or_(TrabajoCurso.bloqueado_hasta.is_(None), TrabajoCurso.bloqueado_hasta < ahora)
+    ).values(
+        estado="en_proceso",
+        intentos=TrabajoCurso.intentos + 1,
+        bloqueado_hasta=_vencimiento()
+    ))).rowcount
+    trabajo = await db.get(TrabajoCurso, trabajo_id) if filas == 1 else None
+    await db.commit()
+    if trabajo is not None:
+        # Copia fuera de la sesión: un rollback no la caduca y solo se escribe con _actualizar
+        db.expunge(trabajo)
+    return trabajo
+
+async def _actualizar(db: AsyncSession, trabajo: TrabajoCurso, **valores):
+    """
+    Escribe en el trabajo solo si este worker conserva el lease; no hace commit.
+    Va en la misma transacción que lo que guarda la etapa: o se guarda todo o nada.
+    """
+    valores.setdefault("bloqueado_hasta", _vencimiento())
+    filas = (await db.execute(update(TrabajoCurso).where(
+        TrabajoCurso.id == trabajo.id,
+        TrabajoCurso.intentos == trabajo.intentos,
+        TrabajoCurso.estado == "en_proceso"
+    ).values(**valores))).rowcount
+    if filas != 1:
+        raise LeasePerdido(f"El trabajo {trabajo.id} ya no pertenece a este worker")
+
+async def _avanzar(db: AsyncSession, trabajo: TrabajoCurso, etapa: str, **valores):
+    """Marca una etapa como completada y renueva el lease"""
+    valores.update(etapa=etapa, progreso=PROGRESO_ETAPAS[etapa])
+    await _actualizar(db, trabajo, **valores)
+    await db.commit()
+    for campo, valor in valores.items():
+        setattr(trabajo, campo, valor)
+
+async def _latido(trabajo: TrabajoCurso):
+    """Renueva el lease mientras el trabajo avanza: la generación puede durar más que el lease"""
+    while True:
+        await asyncio.sleep(LEASE_SEGUNDOS / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                await _actualizar(db, trabajo)
+                await db.commit()
+        except LeasePerdido as e:
+            print(f"⚠️ {str(e)}")
+            return
+        except Exception as e:
+            print(f"⚠️ Error renovando el lease del trabajo {trabajo.id}: {str(e)}")
+
+def _texto_conocido(db: Session, hash_pdf: str):
+    """Texto ya extraído de un PDF idéntico subido antes (si existe)"""
+    if not hash_pdf:
+        return None
+    curso_id = db.query(Curso.id).join(CursoContenido, CursoContenido.curso_id == Curso.id).filter(
+        Curso.hash_pdf == hash_pdf
+    ).scalar()
+    return obtener_texto_curso(db, curso_id) if curso_id else None
+
+async def _etapa_extraccion(db: AsyncSession, trabajo: TrabajoCurso):
+    """Extrae el texto del PDF y crea el curso en la BD"""
+    texto = await db.run_sync(_texto_conocido, trabajo.hash_pdf)
+    if texto:
+        # Mismo PDF que otro curso: reutilizar su texto (y, vía la caché de IA, sus generaciones)
+        print(f"♻️ PDF ya procesado antes ({trabajo.hash_pdf[:12]}), reutilizando texto extraído")
+    else:
+        try:
+            texto = await asyncio.to_thread(
+                extraer_texto_pdf, trabajo.ruta_pdf,
+                max_paginas=MAX_PAGINAS, max_caracteres=MAX_CARACTERES
+            )
+        except Exception as e:
+            raise ErrorTrabajo(f"Error extrayendo texto del PDF: {str(e)}")
+
+    if not texto or len(texto) < 100:
+        raise ErrorTrabajo("El PDF no contiene texto suficiente o no se pudo extraer")
+    print(f"✅ Texto extraído: {len(texto)} caracteres")
+
+    # El lease se comprueba antes de crear nada: otro worker no deja un curso duplicado
+    await _actualizar(db, trabajo)
+    nuevo_curso = Curso(
+        nombre=trabajo.nombre,
+        proveedor=trabajo.proveedor,
+        hash_pdf=trabajo.hash_pdf
+    )
+    db.add(nuevo_curso)
+    await db.flush()
+    # Guardar texto completo (comprimido) para regenerar exámenes
+    await db.run_sync(guardar_texto_curso, nuevo_curso.id, texto)
+    await _avanzar(db, trabajo, "extraccion", curso_id=nuevo_curso.id)
+    print(f"✅ Curso creado con ID: {nuevo_curso.id}")
+
+async def _etapa_generacion(db: AsyncSession, trabajo: TrabajoCurso):
+    """Genera y guarda lecciones y preguntas en paralelo (solo las que falten)"""
+    curso_id = await db.scalar(select(Curso.id).where(Curso.id == trabajo.curso_id))
+    if curso_id is None:
+        raise ErrorTrabajo("El curso del trabajo ya no existe")
+    texto = await db.run_sync(obtener_texto_curso, curso_id)
+    await db.commit()
+    if not texto:
+        raise ErrorTrabajo("El curso no tiene texto de origen")
+
+    # Cada rama guarda con su propia sesión y el avance del trabajo va en la misma
+    # transacción. Lo que alcanzó a guardar un intento anterior cortado a medias se borra
+    # antes de insertar lo nuevo (autoflush=False: las filas añadidas se insertan en el commit)
+    async def lecciones():
+        async with AsyncSessionLocal() as db_rama:
+            creadas = await generar_y_guardar_lecciones(db_rama, curso_id, texto, trabajo.num_lecciones)
+            await db_rama.execute(delete(Leccion).where(Leccion.curso_id == curso_id))
+            await _actualizar(db_rama, trabajo, lecciones_generadas=len(creadas),
+                              progreso=TrabajoCurso.progreso + 35)
+            await db_rama.commit()
+            print(f"✅ {len(creadas)} lecciones guardadas")
+
+    async def preguntas():
+        async with AsyncSessionLocal() as db_rama:
+            creadas = await generar_y_guardar_preguntas(db_rama, curso_id, texto, trabajo.num_preguntas)
+            await db_rama.execute(delete(Pregunta).where(Pregunta.curso_id == curso_id))
+            await _actualizar(db_rama, trabajo, preguntas_generadas=len(creadas),
+                              progreso=TrabajoCurso.progreso + 35)
+            await db_rama.commit()
+            print(f"✅ {len(creadas)} preguntas guardadas")
+
+    ramas = []
+    if trabajo.lecciones_generadas is None:
+        ramas.append(lecciones())
+    if trabajo.preguntas_generadas is None:
+        ramas.append(preguntas())
+    try:
+        await asyncio.gather(*ramas)
+    finally:
+        # Lo leído mientras se generaba el contenido deja de servirse; las réplicas
+        # aún no lo tienen: leer del primario mientras se propaga
+        await invalidar_curso(curso_id)
+        fijar_contenido()
+
+    generadas = (await db.execute(select(
+        TrabajoCurso.lecciones_generadas, TrabajoCurso.preguntas_generadas
+    ).where(TrabajoCurso.id == trabajo.id))).one()
+    avisos = []
+    if not generadas.lecciones_generadas:
+        avisos.append("No se generaron lecciones")
+    if not generadas.preguntas_generadas:
+        avisos.append("No se generaron preguntas")
+    await _avanzar(db, trabajo, "generacion", error="; ".join(avisos) or None)
+
+async def procesar_trabajo(trabajo_id: str):
+    """Ejecuta las etapas pendientes del trabajo, reanudando desde la última completada"""
+    async with AsyncSessionLocal() as db:
+        trabajo = await _reclamar(db, trabajo_id)
+        if trabajo is None:
+            return
+        print(f"⚙️ Procesando trabajo {trabajo_id} (etapa: {trabajo.etapa}, intento {trabajo.intentos})")
+        latido = asyncio.create_task(_latido(trabajo))
+
+        try:
+            if trabajo.etapa == "recibido":
+                await _etapa_extraccion(db, trabajo)
+            if trabajo.etapa == "extraccion":
+                await _etapa_generacion(db, trabajo)
+
+            await _avanzar(db, trabajo, "completado", estado="completado", bloqueado_hasta=None)
+            print(f"✅ Trabajo {trabajo_id} completado (curso {trabajo.curso_id})")
+
+        except LeasePerdido as e:
+            # Otro worker lo está procesando: no tocar su estado
+            await db.rollback()
+            print(f"⚠️ {str(e)}")
+
+        except Exception as e:
+            await db.rollback()
+            definitivo = isinstance(e, ErrorTrabajo) or trabajo.intentos >= MAX_INTENTOS
+            try:
+                await _actualizar(db, trabajo, estado="fallido" if definitivo else "pendiente",
+                                  error=str(e), bloqueado_hasta=None)
+                await db.commit()
+            except LeasePerdido:
+                await db.rollback()
+                return
+            print(f"❌ Error en trabajo {trabajo_id}: {str(e)}")
+            if not definitivo:
+                encolar(trabajo_id)
+        finally:
+            latido.cancel()
+
+async def _recuperar_trabajos():
+    """Vuelve a encolar los trabajos activos (tras un reinicio o un lease vencido)"""
+    async with AsyncSessionLocal() as db:
+        ahora = datetime.now()
+        activos = (await db.scalars(select(TrabajoCurso.id).where(
+            TrabajoCurso.estado.in_(ESTADOS_ACTIVOS),
+            or_(TrabajoCurso.bloqueado_hasta.is_(None), TrabajoCurso.bloqueado_hasta < ahora)
+        ))).all()
+
+    for trabajo_id in activos:
+        encolar(trabajo_id)
+    return len(activos)
+
+async def _worker(numero: int):
+    while True:
+        trabajo_id = await _cola.get()
+        _en_cola.discard(trabajo_id)
+        try:
+            await procesar_trabajo(trabajo_id)
+        except Exception as e:
+            print(f"❌ Worker {numero}: error inesperado en trabajo {trabajo_id}: {str(e)}")
+        finally:
+            _cola.task_done()
+
+async def _revisor():
+    while True:
+        await asyncio.sleep(INTERVALO_REVISION)
+        try:
+            await _recuperar_trabajos()
+        except Exception as e:
+            print(f"⚠️ Error revisando trabajos pendientes: {str(e)}")
+
+async def iniciar_workers():
+    """Arranca el pool de workers y recupera los trabajos interrumpidos"""
+    global _cola
+    _cola = asyncio.Queue()
+    _en_cola.clear()
+    for numero in range(NUM_WORKERS):
+        _tareas.append(asyncio.create_task(_worker(numero)))
+    _tareas.append(asyncio.create_task(_revisor()))
+
+    recuperados = await _recuperar_trabajos()
+    print(f"⚙️ {NUM_WORKERS} workers de trabajos iniciados ({recuperados} trabajos recuperados)")
+
+async def detener_workers():
+    """Cancela los workers; los trabajos en curso se reanudan al reiniciar"""
+    global _cola
+    for tarea in _tareas:
+        tarea.cancel()
+    await asyncio.gather(*_tareas, return_exceptions=True)
+    _tareas.clear()
+    _cola = None
+
+def serializar_trabajo(trabajo: TrabajoCurso) -> dict:
+    """Representación del estado del trabajo para la API"""
+    return {
+        "trabajo_id": trabajo.id,
+        "estado": trabajo.estado,
+        "etapa": trabajo.etapa,
+        "progreso": trabajo.progreso,
+        "error": trabajo.error,
+        "intentos": trabajo.intentos,
+        "curso_id": trabajo.curso_id,
+        "estadisticas": {
+            "lecciones_generadas": trabajo.lecciones_generadas,
+            "preguntas_generadas": trabajo.preguntas_generadas
+        },
+        "fecha_creacion": trabajo.fecha_creacion,
+        "fecha_actualizacion": trabajo.fecha_actualizacion
+    }
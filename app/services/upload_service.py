@@ -0,0 +1,78 @@
+"""
+Servicio de almacenamiento de PDFs subidos
+Guarda cada archivo por su hash SHA-256 (mismo contenido = mismo archivo),
+escribiendo por bloques sin bloquear el event loop.
+"""
+import os
+import asyncio
+import hashlib
+import tempfile
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "files")
+TAMANO_MAXIMO = int(os.getenv("UPLOAD_MAX_MB", "25")) * 1024 * 1024
+TAMANO_BLOQUE = 1024 * 1024
+FIRMA_PDF = b"%PDF-"
+
+def ruta_por_hash(sha256: str) -> str:
+    """Ruta definitiva del PDF: {UPLOAD_DIR}/ab/abcdef....pdf"""
+    return os.path.join(UPLOAD_DIR, sha256[:2], f"{sha256}.pdf")
+
+def _mover_a_destino(ruta_temporal: str, ruta_final: str) -> bool:
+    """Mueve el archivo temporal a su ruta final. Devuelve True si ya existía."""
+    if os.path.exists(ruta_final):
+        os.remove(ruta_temporal)
+        return True
+    os.makedirs(os.path.dirname(ruta_final), exist_ok=True)
+    os.replace(ruta_temporal, ruta_final)
+    return False
+
+async def guardar_pdf(archivo: UploadFile) -> dict:
+    """
+    Guarda el PDF por bloques calculando su SHA-256 mientras se escribe.
+    Rechaza archivos que no empiezan con la firma %PDF- o que superan el tamaño máximo.
+    Devuelve la ruta, el hash, el tamaño y si el archivo ya estaba guardado.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    descriptor, ruta_temporal = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    sha256 = hashlib.sha256()
+    tamano = 0
+
+    try:
+        with os.fdopen(descriptor, "wb") as destino:
+            while True:
+                bloque = await archivo.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+
+                if tamano == 0 and not bloque.startswith(FIRMA_PDF):
+                    raise HTTPException(status_code=400, detail="El archivo no es un PDF válido")
+
+                tamano += len(bloque)
+                if tamano > TAMANO_MAXIMO:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"El PDF supera el tamaño máximo de {TAMANO_MAXIMO // (1024 * 1024)} MB"
+                    )
+
+                sha256.update(bloque)
+                await asyncio.to_thread(destino.write, bloque)
+
+        if tamano == 0:
+            raise HTTPException(status_code=400, detail="El archivo está vacío")
+
+        digest = sha256.hexdigest()
+        ruta_final = ruta_por_hash(digest)
+        duplicado = await asyncio.to_thread(_mover_a_destino, ruta_temporal, ruta_final)
+
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+    return {
+        "ruta": ruta_final,
+        "sha256": digest,
+        "tamano": tamano,
+        "duplicado": duplicado
+    }
@@ -2,6 +2,9 @@
 Utilidades compartidas
 """
 from .database import get_db, engine, Base, SessionLocal
+from .database_async import get_db_async, engine_async, AsyncSessionLocal
+from .replicas import get_db_lectura, get_db_lectura_async
 from .security import hash_password, verify_password
 
-__all__ = ["get_db", "engine", "Base", "SessionLocal", "hash_password", "verify_password"]
+__all__ = ["get_db", "get_db_async", "get_db_lectura", "get_db_lectura_async", "engine", "engine_async",
+           "Base", "SessionLocal", "AsyncSessionLocal", "hash_password", "verify_password"]
@@ -0,0 +1,18 @@
+"""
+Compresión de textos grandes guardados en la BD
+"""
+import zlib
+
+NIVEL_ZLIB = 6
+
+def comprimir_texto(texto: str, algoritmo: str = "zlib") -> bytes:
+    """Comprime un texto UTF-8 con el algoritmo indicado"""
+    if algoritmo != "zlib":
+        raise ValueError(f"Algoritmo de compresión no soportado: {algoritmo}")
+    return zlib.compress(texto.encode("utf-8"), NIVEL_ZLIB)
+
+def descomprimir_texto(datos: bytes, algoritmo: str = "zlib") -> str:
+    """Operación inversa de comprimir_texto"""
+    if algoritmo != "zlib":
+        raise ValueError(f"Algoritmo de compresión no soportado: {algoritmo}")
+    return zlib.decompress(datos).decode("utf-8")
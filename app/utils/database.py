@@ -3,9 +3,10 @@ Configuración de base de datos SQLAlchemy
 Detecta automáticamente si usar SQLite (local) o PostgreSQL (Render)
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from app.utils import sqlite_rendimiento
 
 # 🔧 Detectar entorno: Local (SQLite) o Render (PostgreSQL)
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -22,18 +23,36 @@ else:
     DATABASE_URL = "sqlite:///./techbridge.db"
     print("💻 Usando SQLite (Local)")
 
-# Configurar argumentos según el tipo de base de datos
-connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+ES_SQLITE = DATABASE_URL.startswith("sqlite")
+
+def crear_motor(url: str, lectura: bool = False):
+    """
+    Engine con la configuración de la app para `url`. Con lectura=True (réplicas)
+    SQLite no usa la cola de escritura ni cambia el modo del journal.
+    """
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    sqlite = url.startswith("sqlite")
+    
+    # Configurar argumentos según el tipo de base de datos
+    connect_args = {}
+    if sqlite:
+        # Con SQLITE_ALTO_RENDIMIENTO: WAL y cola FIFO de escrituras (ver sqlite_rendimiento)
+        connect_args = sqlite_rendimiento.argumentos_conexion(sqlite_rendimiento.ALTO_RENDIMIENTO and not lectura)
+    
+    motor = create_engine(
+        url, 
+        connect_args=connect_args,
+        pool_pre_ping=True,  # Verificar conexiones antes de usar
+        echo=False  # Cambiar a True para debug SQL
+    )
+    
+    if sqlite and sqlite_rendimiento.ALTO_RENDIMIENTO and not lectura:
+        event.listen(motor, "connect", sqlite_rendimiento.aplicar_pragmas)
+    return motor
 
 # Crear el motor de conexión
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args=connect_args,
-    pool_pre_ping=True,  # Verificar conexiones antes de usar
-    echo=False  # Cambiar a True para debug SQL
-)
+engine = crear_motor(DATABASE_URL)
 
 print(f"✅ Motor de BD configurado: {engine.url.drivername}")
 
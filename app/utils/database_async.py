@@ -0,0 +1,87 @@
+"""
+Acceso asíncrono a la base de datos (AsyncSession)
+Misma BD que app.utils.database con drivers asíncronos: asyncpg para PostgreSQL
+y aiosqlite para SQLite. Los endpoints async esperan a la BD en el event loop
+en vez de ocupar un hilo del threadpool.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.utils import sqlite_rendimiento
+from app.utils.database import DATABASE_URL
+
+def url_async(url: str) -> URL:
+    """La URL de la BD con el driver asíncrono correspondiente"""
+    url = make_url(url.replace("postgres://", "postgresql://", 1))
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        # asyncpg no entiende sslmode (libpq): su equivalente es ssl
+        sslmode = url.query.get("sslmode")
+        url = url.set(drivername="postgresql+asyncpg")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+        return url
+    raise ValueError(f"Sin driver asíncrono para {backend}")
+
+def crear_motor_async(url: str, lectura: bool = False):
+    """Engine asíncrono con la misma configuración que crear_motor"""
+    url = url_async(url)
+    sqlite = url.get_backend_name() == "sqlite"
+
+    connect_args = {}
+    if sqlite:
+        # aiosqlite pasa estos argumentos a sqlite3.connect: misma cola de escritura y PRAGMAs
+        connect_args = sqlite_rendimiento.argumentos_conexion(sqlite_rendimiento.ALTO_RENDIMIENTO and not lectura)
+
+    motor = create_async_engine(url, connect_args=connect_args, pool_pre_ping=True, echo=False)
+
+    if sqlite and sqlite_rendimiento.ALTO_RENDIMIENTO and not lectura:
+        event.listen(motor.sync_engine, "connect", sqlite_rendimiento.aplicar_pragmas)
+    return motor
+
+class SesionAsyncSQLite(AsyncSession):
+    """
+    AsyncSession para SQLite con cola de escritura: espera el turno en el event
+    loop antes de cada escritura (DML, flush o commit con cambios pendientes)
+    en vez de bloquear el hilo de aiosqlite. Las escrituras dentro de run_sync
+    siguen esperándolo en ese hilo.
+    """
+
+    async def _turno_escritura(self):
+        conexion = await self.connection()
+        bruta = (await conexion.get_raw_connection()).driver_connection._conn
+        if isinstance(bruta, sqlite_rendimiento.ConexionSQLite):
+            await bruta.turno_escritura_async()
+
+    def _cambios_pendientes(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+    async def execute(self, statement, *args, **kwargs):
+        if getattr(statement, "is_dml", False):
+            await self._turno_escritura()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None):
+        if self._cambios_pendientes():
+            await self._turno_escritura()
+        await super().flush(objects)
+
+    async def commit(self):
+        if self._cambios_pendientes():
+            await self._turno_escritura()
+        await super().commit()
+
+engine_async = crear_motor_async(DATABASE_URL)
+
+_COLA_ESCRITURA = engine_async.url.get_backend_name() == "sqlite" and sqlite_rendimiento.ALTO_RENDIMIENTO
+
+# expire_on_commit=False: tras el commit no se puede recargar de forma implícita en async
+AsyncSessionLocal = async_sessionmaker(engine_async, class_=SesionAsyncSQLite if _COLA_ESCRITURA else AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
+
+async def get_db_async():
+    """Dependencia: AsyncSession por request"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,130 @@
+"""
+Lectura de JSON producido por el modelo de IA
+Extrae los objetos de un array JSON en una sola pasada, conociendo el estado
+de los strings, y recupera todos los objetos completos aunque la respuesta
+venga truncada o con pequeños errores de formato.
+"""
+import re
+import json
+from typing import List
+
+# Comas sobrantes antes de un cierre: {"a": 1,} / [1, 2,]
+_COMA_FINAL = re.compile(r",(\s*[}\]])")
+
+class ObjetosRecuperados(list):
+    """
+    Lista de objetos extraídos con el informe del parseo:
+    completo    -> el array se cerró y no quedó ningún objeto a medias
+    descartados -> objetos cerrados que no se pudieron parsear ni reparar
+    """
+
+    def __init__(self, objetos=(), completo: bool = True, descartados: int = 0):
+        super().__init__(objetos)
+        self.completo = completo
+        self.descartados = descartados
+
+    @property
+    def recuperados(self) -> int:
+        return len(self)
+
+class ExtractorObjetosJSON:
+    """
+    Recibe texto por partes (feed) y devuelve cada objeto de primer nivel
+    en cuanto su llave de cierre llega. Ignora lo que haya fuera de los
+    objetos (corchetes, comas, cercas ```json).
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._posicion = 0
+        self._inicio = None
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+        self._array_cerrado = False
+        self.descartados = 0
+
+    def feed(self, texto: str) -> List[dict]:
+        """Añade texto y devuelve los objetos que quedaron completos"""
+        self._buffer += texto
+        objetos = []
+
+        i = self._posicion
+        buffer = self._buffer
+        while i < len(buffer):
+            c = buffer[i]
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_string = False
+            elif c == '"':
+                if self._profundidad > 0:
+                    self._en_string = True
+            elif c == "{":
+                if self._profundidad == 0:
+                    self._inicio = i
+                self._profundidad += 1
+            elif c == "}" and self._profundidad > 0:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    objeto = self._parsear(buffer[self._inicio:i + 1])
+                    if objeto is not None:
+                        objetos.append(objeto)
+                    self._inicio = None
+            elif c == "]" and self._profundidad == 0:
+                self._array_cerrado = True
+            i += 1
+
+        # Conservar solo el objeto en curso
+        if self._inicio is None:
+            self._buffer = ""
+            self._posicion = 0
+        else:
+            self._buffer = buffer[self._inicio:]
+            self._posicion = i - self._inicio
+            self._inicio = 0
+        return objetos
+
+    @property
+    def incompleto(self) -> bool:
+        """True si el texto recibido terminó a mitad de un objeto"""
+        return self._profundidad > 0
+
+    @property
+    def array_cerrado(self) -> bool:
+        return self._array_cerrado
+
+    def _parsear(self, fragmento: str):
+        try:
+            # strict=False admite saltos de línea y tabs literales dentro de los strings
+            objeto = json.loads(fragmento, strict=False)
+        except json.JSONDecodeError:
+            objeto = self._reparar(fragmento)
+            if objeto is None:
+                self.descartados += 1
+                return None
+        return objeto if isinstance(objeto, dict) else None
+
+    @staticmethod
+    def _reparar(fragmento: str):
+        """Último intento con los errores típicos del modelo (solo para el objeto que falló)"""
+        reparado = _COMA_FINAL.sub(r"\1", fragmento)
+        # Barras invertidas sueltas que no forman un escape JSON válido
+        reparado = re.sub(r'\\(?!["\\/bfnrtu])', r"\\\\", reparado)
+        try:
+            return json.loads(reparado, strict=False)
+        except json.JSONDecodeError:
+            return None
+
+def extraer_objetos_json(texto: str) -> ObjetosRecuperados:
+    """
+    Recorre la respuesta del modelo una sola vez y devuelve todos los objetos
+    completos que contiene, con el informe de si la respuesta estaba completa.
+    """
+    extractor = ExtractorObjetosJSON()
+    objetos = extractor.feed(texto or "")
+    completo = extractor.array_cerrado and not extractor.incompleto and extractor.descartados == 0
+    return ObjetosRecuperados(objetos, completo=completo, descartados=extractor.descartados)
@@ -0,0 +1,414 @@
+"""
+Migraciones de esquema y de datos versionadas
+MIGRACIONES se aplica en orden al arrancar (o con `python -m app.utils.migraciones`)
+y cada versión aplicada queda registrada en schema_migraciones. Las migraciones
+son además idempotentes, así que una BD creada o migrada antes del registro
+simplemente las marca como aplicadas.
+Para cambiar el esquema: modificar el modelo y añadir una migración al final.
+"""
+import os
+import json
+import time
+from contextlib import contextmanager
+from sqlalchemy import inspect, text, bindparam, select, insert, JSON, UniqueConstraint
+from sqlalchemy.engine import Engine
+from app.models.database import MigracionEsquema
+from app.utils.compresion import comprimir_texto
+from app.utils.database import Base
+
+LOTE_MIGRACION = 100
+# Clave del advisory lock de PostgreSQL: un solo proceso migra a la vez
+BLOQUEO_MIGRACIONES = 7301
+
+def crear_tablas(engine: Engine):
+    """Crea las tablas que no existan (con sus índices); no modifica las existentes"""
+    Base.metadata.create_all(bind=engine)
+
+def _agregar_columna(engine: Engine, tabla: str, columna: str, definicion: str) -> bool:
+    """ALTER TABLE ADD COLUMN si la columna no existe todavía"""
+    columnas = {c["name"] for c in inspect(engine).get_columns(tabla)}
+    if columna in columnas:
+        return False
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+    print(f"🧩 Columna {tabla}.{columna} añadida")
+    return True
+
+def asegurar_columna_hash_pdf(engine: Engine) -> bool:
+    """Añade cursos.hash_pdf (y su índice) en BDs anteriores a la deduplicación de PDFs"""
+    agregada = _agregar_columna(engine, "cursos", "hash_pdf", "VARCHAR(64)")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cursos_hash_pdf ON cursos (hash_pdf)"))
+    return agregada
+
+def migrar_contenido_cursos(engine: Engine) -> int:
+    """
+    Mueve cursos.contenido_texto a la tabla cursos_contenido (comprimido con zlib)
+    y deja la columna antigua a NULL. Devuelve el número de cursos migrados.
+    """
+    columnas = {c["name"] for c in inspect(engine).get_columns("cursos")}
+    if "contenido_texto" not in columnas:
+        return 0
+
+    migrados = 0
+    while True:
+        with engine.begin() as conn:
+            filas = conn.execute(text(
+                "SELECT c.id, c.contenido_texto FROM cursos c "
+                "LEFT JOIN cursos_contenido cc ON cc.curso_id = c.id "
+                "WHERE c.contenido_texto IS NOT NULL AND cc.curso_id IS NULL "
+                "ORDER BY c.id LIMIT :lote"
+            ), {"lote": LOTE_MIGRACION}).all()
+            if not filas:
+                break
+
+            conn.execute(text(
+                "INSERT INTO cursos_contenido (curso_id, compresion, texto_comprimido, tamano_original) "
+                "VALUES (:curso_id, 'zlib', :texto_comprimido, :tamano_original)"
+            ), [
+                {"curso_id": curso_id, "texto_comprimido": comprimir_texto(texto), "tamano_original": len(texto)}
+                for curso_id, texto in filas
+            ])
+            conn.execute(
+                text("UPDATE cursos SET contenido_texto = NULL WHERE id IN :ids").bindparams(
+                    bindparam("ids", expanding=True)
+                ),
+                {"ids": [curso_id for curso_id, _ in filas]}
+            )
+            migrados += len(filas)
+
+    # Cursos que ya tenían fila nueva: solo limpiar la columna antigua
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE cursos SET contenido_texto = NULL WHERE contenido_texto IS NOT NULL "
+            "AND id IN (SELECT curso_id FROM cursos_contenido)"
+        ))
+
+    if migrados:
+        print(f"📦 Texto de {migrados} cursos movido a cursos_contenido (comprimido)")
+    return migrados
+
+def reconstruir_resumenes_progreso(engine: Engine) -> int:
+    """
+    Calcula resumen_progreso_cursos a partir de progreso_lecciones si la tabla
+    de resúmenes está vacía (instalaciones anteriores al resumen incremental).
+    """
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM resumen_progreso_cursos LIMIT 1")).first():
+            return 0
+        resultado = conn.execute(text(
+            "INSERT INTO resumen_progreso_cursos "
+            "(usuario_id, curso_id, lecciones_completadas, tiempo_total, ultima_actividad) "
+            "SELECT p.usuario_id, l.curso_id, "
+            "COUNT(DISTINCT CASE WHEN p.completada THEN p.leccion_id END), "
+            "COALESCE(SUM(p.tiempo_dedicado), 0), MAX(COALESCE(p.fecha_completada, p.fecha_inicio)) "
+            "FROM progreso_lecciones p JOIN lecciones l ON l.id = p.leccion_id "
+            "GROUP BY p.usuario_id, l.curso_id"
+        ))
+
+    if resultado.rowcount:
+        print(f"📊 Reconstruidos {resultado.rowcount} resúmenes de progreso")
+    return max(resultado.rowcount, 0)
+
+def asegurar_indice_unico_progreso(engine: Engine) -> int:
+    """
+    Crea el índice único (usuario_id, pregunta_id) de progreso en BDs antiguas.
+    Antes fusiona los duplicados: conserva la fila más reciente y suma los intentos.
+    Devuelve el número de filas duplicadas eliminadas.
+    """
+    indices = {i["name"] for i in inspect(engine).get_indexes("progreso")}
+    if "uq_progreso_usuario_pregunta" in indices:
+        return 0
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE progreso SET intentos = ("
+            "SELECT SUM(COALESCE(p2.intentos, 1)) FROM progreso p2 "
+            "WHERE p2.usuario_id = progreso.usuario_id AND p2.pregunta_id = progreso.pregunta_id) "
+            "WHERE id IN (SELECT MAX(id) FROM progreso GROUP BY usuario_id, pregunta_id HAVING COUNT(*) > 1)"
+        ))
+        eliminadas = conn.execute(text(
+            "DELETE FROM progreso WHERE id NOT IN (SELECT MAX(id) FROM progreso GROUP BY usuario_id, pregunta_id)"
+        )).rowcount
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_progreso_usuario_pregunta ON progreso (usuario_id, pregunta_id)"
+        ))
+
+    print(f"🔑 Índice único de progreso creado ({eliminadas} duplicados fusionados)")
+    return eliminadas
+
+def eliminar_columna_contenido_texto(engine: Engine) -> bool:
+    """
+    Elimina cursos.contenido_texto (vacía desde la 0003), que ya no está en el modelo:
+    una BD migrada queda con el mismo esquema que una creada desde cero
+    """
+    columnas = {c["name"] for c in inspect(engine).get_columns("cursos")}
+    if "contenido_texto" not in columnas:
+        return False
+    # SQLite soporta DROP COLUMN desde la 3.35
+    if engine.dialect.name == "sqlite" and engine.dialect.dbapi.sqlite_version_info < (3, 35, 0):
+        print("⚠️ SQLite anterior a 3.35: cursos.contenido_texto se conserva (vacía)")
+        return False
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE cursos DROP COLUMN contenido_texto"))
+    print("🧩 Columna cursos.contenido_texto eliminada")
+    return True
+
+def asegurar_columna_consejo_estudio(engine: Engine) -> bool:
+    """Añade preguntas.consejo_estudio en BDs creadas antes de precalcular los consejos"""
+    return _agregar_columna(engine, "preguntas", "consejo_estudio", "TEXT")
+
+# Columnas que guardaban listas como texto JSON
+COLUMNAS_JSON = [("lecciones", "ejemplos_codigo"), ("lecciones", "puntos_clave"), ("preguntas", "opciones_json")]
+# Resultados de la caché de IA e intentos de examen, creados como texto JSON antes de la 0010
+COLUMNAS_JSON_RESULTADOS = [("cache_generaciones", "resultado"), ("intentos_examen", "temas_fallados"),
+                            ("intentos_examen", "detalles")]
+
+def _reparar_json(valor: str) -> str:
+    """Texto JSON válido para la columna: vacío -> [], texto suelto -> [texto]"""
+    try:
+        json.loads(valor)
+        return valor
+    except ValueError:
+        return json.dumps([valor.strip()] if valor.strip() else [], ensure_ascii=False)
+
+def _reparar_columna(engine: Engine, tabla: str, columna: str, clave: str, filas) -> int:
+    """Reescribe las filas (clave, valor) cuyo valor no es JSON válido"""
+    cambios = [
+        {"clave": fila_clave, "valor": reparado}
+        for fila_clave, valor in filas
+        if (reparado := _reparar_json(valor)) != valor
+    ]
+    if cambios:
+        with engine.begin() as conn:
+            conn.execute(text(f"UPDATE {tabla} SET {columna} = :valor WHERE {clave} = :clave"), cambios)
+    return len(cambios)
+
+def migrar_columnas_json(engine: Engine, columnas=COLUMNAS_JSON) -> int:
+    """
+    Pasa a columnas JSON los valores que se guardaban como texto JSON (COLUMNAS_JSON).
+    En PostgreSQL la columna se convierte a JSONB; en SQLite el JSON se guarda
+    como texto igualmente y solo se reparan los valores que no son JSON válido.
+    Devuelve el número de valores reparados.
+    """
+    inspector = inspect(engine)
+    reparados = 0
+    for tabla, columna in columnas:
+        tipo = next(c["type"] for c in inspector.get_columns(tabla) if c["name"] == columna)
+        clave = inspector.get_pk_constraint(tabla)["constrained_columns"][0]
+
+        if engine.dialect.name == "postgresql":
+            if isinstance(tipo, JSON):
+                continue
+            with engine.connect() as conn:
+                filas = conn.execute(text(
+                    f"SELECT {clave}, {columna} FROM {tabla} WHERE {columna} IS NOT NULL"
+                )).all()
+            reparados += _reparar_columna(engine, tabla, columna, clave, filas)
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {tabla} ALTER COLUMN {columna} TYPE JSONB USING {columna}::jsonb"
+                ))
+            print(f"🧩 Columna {tabla}.{columna} convertida a JSONB")
+            continue
+        if engine.dialect.name != "sqlite":
+            continue
+
+        with engine.connect() as conn:
+            filas = conn.execute(text(
+                f"SELECT {clave}, {columna} FROM {tabla} "
+                f"WHERE {columna} IS NOT NULL AND json_valid({columna}) = 0"
+            )).all()
+        reparados += _reparar_columna(engine, tabla, columna, clave, filas)
+
+    if reparados:
+        print(f"🧩 {reparados} valores JSON inválidos reparados")
+    return reparados
+
+def migrar_columnas_json_resultados(engine: Engine) -> int:
+    """Columnas JSON para los resultados de la caché de IA y los intentos de examen"""
+    return migrar_columnas_json(engine, COLUMNAS_JSON_RESULTADOS)
+
+# Índices de los filtros más frecuentes: (nombre, tabla, columnas, único)
+INDICES_CLAVES = [
+    ("ix_lecciones_curso_id", "lecciones", ("curso_id",), False),
+    ("ix_preguntas_curso_id", "preguntas", ("curso_id",), False),
+    ("ix_preguntas_leccion_id", "preguntas", ("leccion_id",), False),
+    ("ix_progreso_pregunta_id", "progreso", ("pregunta_id",), False),
+    ("ix_progreso_lecciones_leccion_id", "progreso_lecciones", ("leccion_id",), False),
+    ("uq_progreso_lecciones_usuario_leccion", "progreso_lecciones", ("usuario_id", "leccion_id"), True),
+]
+
+def _fusionar_progreso_lecciones(engine: Engine) -> int:
+    """
+    Deja una fila por (usuario, lección): la más reciente, con el tiempo sumado,
+    completada si alguna lo estaba y la primera fecha de finalización.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE progreso_lecciones SET "
+            "tiempo_dedicado = (SELECT SUM(COALESCE(p2.tiempo_dedicado, 0)) FROM progreso_lecciones p2 "
+            "WHERE p2.usuario_id = progreso_lecciones.usuario_id AND p2.leccion_id = progreso_lecciones.leccion_id), "
+            "completada = EXISTS (SELECT 1 FROM progreso_lecciones p2 "
+            "WHERE p2.usuario_id = progreso_lecciones.usuario_id AND p2.leccion_id = progreso_lecciones.leccion_id "
+            "AND p2.completada), "
+            "fecha_completada = (SELECT MIN(p2.fecha_completada) FROM progreso_lecciones p2 "
+            "WHERE p2.usuario_id = progreso_lecciones.usuario_id AND p2.leccion_id = progreso_lecciones.leccion_id) "
+            "WHERE id IN (SELECT MAX(id) FROM progreso_lecciones GROUP BY usuario_id, leccion_id HAVING COUNT(*) > 1)"
+        ))
+        return conn.execute(text(
+            "DELETE FROM progreso_lecciones WHERE id NOT IN "
+            "(SELECT MAX(id) FROM progreso_lecciones GROUP BY usuario_id, leccion_id)"
+        )).rowcount
+
+def crear_indices_claves(engine: Engine) -> int:
+    """Crea los índices de INDICES_CLAVES que falten (antes fusiona el progreso duplicado)"""
+    existentes = {}
+    inspector = inspect(engine)
+    for _, tabla, _, _ in INDICES_CLAVES:
+        if tabla not in existentes:
+            existentes[tabla] = {i["name"] for i in inspector.get_indexes(tabla)}
+
+    creados = 0
+    for nombre, tabla, columnas, unico in INDICES_CLAVES:
+        if nombre in existentes[tabla]:
+            continue
+        if nombre == "uq_progreso_lecciones_usuario_leccion":
+            fusionadas = _fusionar_progreso_lecciones(engine)
+            if fusionadas:
+                print(f"🔑 {fusionadas} filas duplicadas de progreso de lecciones fusionadas")
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE {'UNIQUE ' if unico else ''}INDEX IF NOT EXISTS {nombre} ON {tabla} ({', '.join(columnas)})"
+            ))
+        creados += 1
+
+    if creados:
+        print(f"🔑 {creados} índices creados")
+    return creados
+
+# Orden de aplicación; no reordenar ni renumerar las ya publicadas
+MIGRACIONES = [
+    ("0001", "Tablas iniciales", crear_tablas),
+    ("0002", "Columna cursos.hash_pdf", asegurar_columna_hash_pdf),
+    ("0003", "Texto de los cursos en cursos_contenido", migrar_contenido_cursos),
+    ("0004", "Resúmenes de progreso por curso", reconstruir_resumenes_progreso),
+    ("0005", "Índice único de progreso (usuario, pregunta)", asegurar_indice_unico_progreso),
+    ("0006", "Columna preguntas.consejo_estudio", asegurar_columna_consejo_estudio),
+    ("0007", "Columnas JSON de lecciones y preguntas", migrar_columnas_json),
+    ("0008", "Índices de claves foráneas y de progreso", crear_indices_claves),
+    ("0009", "Eliminar la columna cursos.contenido_texto", eliminar_columna_contenido_texto),
+    ("0010", "Columnas JSON de la caché de IA y de los intentos de examen", migrar_columnas_json_resultados),
+]
+
+@contextmanager
+def _bloqueo_fichero(ruta: str):
+    """Bloqueo exclusivo sobre un fichero, entre procesos de la misma máquina"""
+    with open(ruta, "a+b") as fichero:
+        if os.name == "nt":
+            import msvcrt
+            fichero.seek(0)
+            while True:
+                try:
+                    # LK_LOCK reintenta durante unos 10 s antes de fallar: seguir esperando
+                    msvcrt.locking(fichero.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(fichero.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                fichero.seek(0)
+                msvcrt.locking(fichero.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fichero.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def _bloqueo(engine: Engine):
+    """
+    Serializa las migraciones entre procesos: advisory lock en PostgreSQL y, en
+    SQLite, un fichero de bloqueo junto a la BD (una transacción abierta en otra
+    conexión bloquearía las escrituras de las propias migraciones)
+    """
+    if engine.dialect.name == "sqlite":
+        ruta = engine.url.database
+        if not ruta or ruta == ":memory:":
+            yield
+            return
+        with _bloqueo_fichero(f"{ruta}.migraciones.lock"):
+            yield
+        return
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": BLOQUEO_MIGRACIONES})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": BLOQUEO_MIGRACIONES})
+            conn.commit()
+
+def aplicar_migraciones(engine: Engine) -> list:
+    """Aplica en orden las migraciones pendientes; devuelve las versiones aplicadas"""
+    aplicadas = []
+    with _bloqueo(engine):
+        MigracionEsquema.__table__.create(bind=engine, checkfirst=True)
+        with engine.connect() as conn:
+            registradas = set(conn.execute(select(MigracionEsquema.version)).scalars())
+
+        for version, descripcion, migrar in MIGRACIONES:
+            if version in registradas:
+                continue
+            inicio = time.perf_counter()
+            migrar(engine)
+            with engine.begin() as conn:
+                conn.execute(insert(MigracionEsquema).values(
+                    version=version,
+                    descripcion=descripcion,
+                    duracion_ms=int((time.perf_counter() - inicio) * 1000)
+                ))
+            print(f"🛠️ Migración {version} aplicada: {descripcion}")
+            aplicadas.append(version)
+    return aplicadas
+
+def verificar_indices(engine: Engine) -> list:
+    """
+    Índices y restricciones únicas declarados en los modelos que no existen en la BD.
+    Se comparan por columnas, no por nombre. Solo avisa: no crea nada.
+    """
+    inspector = inspect(engine)
+    faltantes = []
+    for tabla in Base.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            faltantes.append(f"{tabla.name} (tabla completa)")
+            continue
+
+        existentes = {tuple(i["column_names"]) for i in inspector.get_indexes(tabla.name)}
+        existentes |= {tuple(u["column_names"]) for u in inspector.get_unique_constraints(tabla.name)}
+        existentes.add(tuple(inspector.get_pk_constraint(tabla.name)["constrained_columns"]))
+
+        declarados = [(i.name, tuple(c.name for c in i.columns)) for i in tabla.indexes]
+        declarados += [
+            (r.name, tuple(c.name for c in r.columns))
+            for r in tabla.constraints if isinstance(r, UniqueConstraint)
+        ]
+        for nombre, columnas in declarados:
+            if columnas not in existentes:
+                faltantes.append(f"{tabla.name}.{nombre} ({', '.join(columnas)})")
+
+    if faltantes:
+        print(f"⚠️ Faltan {len(faltantes)} índices en la BD (añade una migración): {'; '.join(faltantes)}")
+    return faltantes
+
+if __name__ == "__main__":
+    from app.utils.database import engine
+    aplicadas = aplicar_migraciones(engine)
+    print(f"✅ {len(aplicadas)} migraciones aplicadas" if aplicadas else "✅ El esquema ya estaba al día")
+    verificar_indices(engine)
@@ -0,0 +1,229 @@
+"""
+Enrutado de sesiones de lectura a réplicas
+- DATABASE_REPLICA_URLS: réplicas separadas por comas. Sin réplicas, get_db_lectura(_async)
+  usa el primario y todo funciona como antes.
+- Reparto por turnos entre las réplicas disponibles. Si una no conecta se marca
+  como caída durante REPLICA_REINTENTO_SEGUNDOS y la lectura va a la siguiente
+  o, si no queda ninguna, al primario. Si una consulta falla en la réplica, se
+  marca igual y la consulta se repite en el primario.
+- Leer lo propio: tras una escritura la respuesta lleva la hora en la cookie
+  ultima_escritura (y en la cabecera X-Ultima-Escritura, que los clientes sin
+  cookies pueden reenviar). Con ella las lecturas del cliente van al primario
+  durante REPLICA_FIJAR_SEGUNDOS (debe superar el retraso de replicación), la
+  atienda el proceso que la atienda.
+- Tras cambiar el contenido de un curso, todas las lecturas de este proceso van al
+  primario un rato, para que la caché de contenido no guarde bajo la versión
+  nueva datos de una réplica atrasada.
+
+Prueba local con dos ficheros SQLite (la "replicación" es una copia):
+    DATABASE_URL=sqlite:///./primario.db DATABASE_REPLICA_URLS=sqlite:///./replica.db
+    python -m app.utils.replicas   # copia el primario en cada réplica SQLite
+"""
+import os
+import math
+import time
+import sqlite3
+import threading
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.database import engine, crear_motor
+from app.utils.database_async import engine_async, crear_motor_async
+
+REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+FIJAR_SEGUNDOS = float(os.getenv("REPLICA_FIJAR_SEGUNDOS", "5"))
+REINTENTO_SEGUNDOS = float(os.getenv("REPLICA_REINTENTO_SEGUNDOS", "30"))
+
+COOKIE_ESCRITURA = "ultima_escritura"
+CABECERA_ESCRITURA = "X-Ultima-Escritura"
+
+_contadores = {"lecturas_replica": 0, "lecturas_primario": 0, "lecturas_fijadas": 0,
+               "respaldos_primario": 0, "fallos_replica": 0}
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = crear_motor(url, lectura=True)
+        self._engine_async = None
+        self.caida_hasta = 0.0
+
+    @property
+    def engine_async(self):
+        if self._engine_async is None:
+            self._engine_async = crear_motor_async(self.url, lectura=True)
+        return self._engine_async
+
+    def marcar_caida(self, error: Exception):
+        self.caida_hasta = time.monotonic() + REINTENTO_SEGUNDOS
+        _contadores["fallos_replica"] += 1
+        motivo = getattr(error, "orig", None) or error
+        print(f"⚠️ Réplica {self.nombre()} no disponible ({motivo}); se reintenta en {REINTENTO_SEGUNDOS:.0f}s")
+
+    def disponible(self) -> bool:
+        return self.caida_hasta <= time.monotonic()
+
+    def nombre(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+_replicas = [Replica(url) for url in REPLICA_URLS]
+_turno = 0
+_contenido_fijado_hasta = 0.0
+_lock = threading.Lock()
+
+if _replicas:
+    print(f"📚 {len(_replicas)} réplicas de lectura configuradas")
+
+def marcar_escritura(response: Response):
+    """Tras una escritura del cliente: sus lecturas van al primario un rato (cookie y cabecera)"""
+    if FIJAR_SEGUNDOS <= 0 or not _replicas:
+        return
+    instante = f"{time.time():.3f}"
+    response.set_cookie(COOKIE_ESCRITURA, instante, max_age=math.ceil(FIJAR_SEGUNDOS),
+                        httponly=True, samesite="lax")
+    response.headers[CABECERA_ESCRITURA] = instante
+
+def fijar_contenido():
+    """Tras cambiar el contenido de un curso: todas las lecturas de este proceso van al primario un rato"""
+    global _contenido_fijado_hasta
+    if FIJAR_SEGUNDOS <= 0 or not _replicas:
+        return
+    _contenido_fijado_hasta = time.monotonic() + FIJAR_SEGUNDOS
+
+def _fijado(request: Request) -> bool:
+    if _contenido_fijado_hasta > time.monotonic():
+        return True
+    valor = request.headers.get(CABECERA_ESCRITURA) or request.cookies.get(COOKIE_ESCRITURA)
+    try:
+        return time.time() - float(valor) < FIJAR_SEGUNDOS
+    except (TypeError, ValueError):
+        return False
+
+def _siguientes() -> list:
+    """Réplicas disponibles, empezando por la que toca en el reparto"""
+    global _turno
+    with _lock:
+        inicio = _turno
+        _turno = (_turno + 1) % len(_replicas)
+    orden = _replicas[inicio:] + _replicas[:inicio]
+    return [r for r in orden if r.disponible()]
+
+def _candidatas(request: Request) -> list:
+    """Réplicas a probar en orden; lista vacía = leer del primario"""
+    if not _replicas:
+        return []
+    if _fijado(request):
+        _contadores["lecturas_fijadas"] += 1
+        return []
+    return _siguientes()
+
+def _contar(conexion):
+    if conexion is None:
+        _contadores["lecturas_primario"] += 1
+    else:
+        _contadores["lecturas_replica"] += 1
+
+class SesionLectura(Session):
+    """Session de lectura; info["replica"] es la réplica a la que está ligada (o None)"""
+
+@event.listens_for(SesionLectura, "do_orm_execute")
+def _respaldo_primario(estado):
+    """Si una consulta falla en la réplica, la marca como caída y la repite en el primario"""
+    sesion = estado.session
+    replica = sesion.info.get("replica")
+    if replica is None:
+        return None
+    try:
+        return estado.invoke_statement()
+    except DBAPIError as e:
+        replica.marcar_caida(e)
+        _contadores["respaldos_primario"] += 1
+        # El resto de la petición también va al primario
+        sesion.info["replica"] = None
+        sesion.bind = sesion.info["primario"]
+        return estado.invoke_statement(bind_arguments={"bind": sesion.bind})
+
+def get_db_lectura(request: Request):
+    """
+    Dependencia para endpoints que solo leen: sesión sobre una réplica, o sobre
+    el primario si no hay réplicas disponibles o el usuario acaba de escribir.
+    """
+    candidatas = _candidatas(request)
+    conexion = None
+    for replica in candidatas:
+        try:
+            conexion = replica.engine.connect()
+            break
+        except Exception as e:
+            replica.marcar_caida(e)
+    else:
+        if candidatas:
+            _contadores["respaldos_primario"] += 1
+
+    _contar(conexion)
+    db = SesionLectura(bind=conexion if conexion is not None else engine, autoflush=False,
+                       info={"replica": replica if conexion is not None else None, "primario": engine})
+    try:
+        yield db
+    finally:
+        db.close()
+        if conexion is not None:
+            conexion.close()
+
+async def get_db_lectura_async(request: Request):
+    """Igual que get_db_lectura, con AsyncSession"""
+    candidatas = _candidatas(request)
+    conexion = None
+    for replica in candidatas:
+        try:
+            conexion = await replica.engine_async.connect()
+            break
+        except Exception as e:
+            replica.marcar_caida(e)
+    else:
+        if candidatas:
+            _contadores["respaldos_primario"] += 1
+
+    _contar(conexion)
+    db = AsyncSession(bind=conexion if conexion is not None else engine_async,
+                      sync_session_class=SesionLectura, autoflush=False, expire_on_commit=False,
+                      info={"replica": replica if conexion is not None else None,
+                            "primario": engine_async.sync_engine})
+    try:
+        yield db
+    finally:
+        await db.close()
+        if conexion is not None:
+            await conexion.close()
+
+def estadisticas() -> dict:
+    """Estado de las réplicas y reparto de lecturas en este proceso"""
+    return {
+        "replicas": [{"url": r.nombre(), "disponible": r.disponible()} for r in _replicas],
+        **_contadores
+    }
+
+def sincronizar_replicas_sqlite() -> list:
+    """Copia el primario SQLite en cada réplica SQLite (solo para pruebas locales)"""
+    if engine.url.get_backend_name() != "sqlite":
+        raise ValueError("El primario no es SQLite: usa la replicación de PostgreSQL")
+    copiadas = []
+    origen = sqlite3.connect(engine.url.database)
+    try:
+        for replica in _replicas:
+            if replica.engine.url.get_backend_name() != "sqlite":
+                continue
+            destino = sqlite3.connect(replica.engine.url.database)
+            try:
+                origen.backup(destino)
+            finally:
+                destino.close()
+            copiadas.append(replica.nombre())
+    finally:
+        origen.close()
+    return copiadas
+
+if __name__ == "__main__":
+    copiadas = sincronizar_replicas_sqlite()
+    print(f"✅ Primario copiado en: {', '.join(copiadas)}" if copiadas else "⚠️ No hay réplicas SQLite configuradas")
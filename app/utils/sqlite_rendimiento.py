@@ -0,0 +1,238 @@
+"""
+Perfil de alta concurrencia para SQLite
+- PRAGMAs al abrir cada conexión: WAL (los lectores no se bloquean con el
+  escritor), synchronous=NORMAL, busy_timeout y mmap_size.
+- Cola de escritura: SQLite admite un solo escritor; en vez de que los hilos
+  compitan reintentando hasta el busy_timeout ("database is locked"), las
+  transacciones de escritura de este proceso esperan su turno en orden FIFO.
+  Las lecturas no pasan por la cola. Entre procesos sigue actuando busy_timeout.
+  Las sesiones asíncronas esperan el turno en el event loop (adquirir_async)
+  antes de mandar la escritura al hilo del driver.
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import deque
+
+ALTO_RENDIMIENTO = os.getenv("SQLITE_ALTO_RENDIMIENTO", "true").lower() == "true"
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+# Tiempo máximo esperando turno de escritura antes de fallar como "database is locked"
+ESPERA_ESCRITURA_S = float(os.getenv("SQLITE_ESPERA_ESCRITURA_S", "30"))
+
+# Sentencias que abren (o son) una escritura
+_ESCRITURAS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER", "SAVEPOINT", "BEGIN")
+
+class _TurnoAsync:
+    """Espera de una corrutina: el turno se le concede desde cualquier hilo"""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._futuro = self._loop.create_future()
+        self._concedido = False
+
+    def set(self) -> bool:
+        self._concedido = True
+        try:
+            self._loop.call_soon_threadsafe(self._despertar)
+        except RuntimeError:
+            # Event loop cerrado: nadie recogerá el turno
+            self._concedido = False
+            return False
+        return True
+
+    def is_set(self) -> bool:
+        return self._concedido
+
+    def _despertar(self):
+        if not self._futuro.done():
+            self._futuro.set_result(True)
+
+    async def esperar(self, timeout: float):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._futuro), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+class ColaEscritura:
+    """Cerrojo FIFO: al liberar, el turno pasa directamente al primero en espera"""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._ocupado = False
+        self._espera = deque()
+        self.contadores = {"escrituras": 0, "esperas": 0, "espera_ms_total": 0.0,
+                           "espera_ms_max": 0.0, "timeouts": 0}
+
+    def adquirir(self, timeout: float = ESPERA_ESCRITURA_S) -> bool:
+        with self._mutex:
+            self.contadores["escrituras"] += 1
+            if not self._ocupado:
+                self._ocupado = True
+                return True
+            turno = threading.Event()
+            self._espera.append(turno)
+
+        inicio = time.perf_counter()
+        turno.wait(timeout)
+        return self._terminar_espera(turno, inicio)
+
+    async def adquirir_async(self, timeout: float = ESPERA_ESCRITURA_S) -> bool:
+        """Como adquirir, pero espera en el event loop sin bloquear ningún hilo"""
+        with self._mutex:
+            self.contadores["escrituras"] += 1
+            if not self._ocupado:
+                self._ocupado = True
+                return True
+            turno = _TurnoAsync()
+            self._espera.append(turno)
+
+        inicio = time.perf_counter()
+        try:
+            await turno.esperar(timeout)
+        except asyncio.CancelledError:
+            with self._mutex:
+                concedido = turno.is_set()
+                if not concedido:
+                    self._espera.remove(turno)
+            # Si el turno llegó a concederse, pasarlo al siguiente
+            if concedido:
+                self.liberar()
+            raise
+        return self._terminar_espera(turno, inicio)
+
+    def _terminar_espera(self, turno, inicio: float) -> bool:
+        with self._mutex:
+            if not turno.is_set():
+                self._espera.remove(turno)
+                self.contadores["timeouts"] += 1
+                return False
+            espera_ms = (time.perf_counter() - inicio) * 1000
+            self.contadores["esperas"] += 1
+            self.contadores["espera_ms_total"] += espera_ms
+            self.contadores["espera_ms_max"] = max(self.contadores["espera_ms_max"], espera_ms)
+            return True
+
+    def liberar(self):
+        with self._mutex:
+            while self._espera:
+                # Una corrutina cuyo event loop ya cerró no puede recibirlo: pasar al siguiente
+                if self._espera.popleft().set() is not False:
+                    return
+            self._ocupado = False
+
+    def estadisticas(self) -> dict:
+        with self._mutex:
+            esperas = self.contadores["esperas"]
+            return {
+                **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.contadores.items()},
+                "espera_ms_media": round(self.contadores["espera_ms_total"] / esperas, 2) if esperas else 0.0,
+                "en_cola": len(self._espera)
+            }
+
+cola_escritura = ColaEscritura()
+
+def _es_escritura(sql: str) -> bool:
+    return sql.lstrip().upper().startswith(_ESCRITURAS)
+
+class CursorSQLite(sqlite3.Cursor):
+    """Pide turno en la cola antes de la primera escritura de la transacción"""
+
+    def execute(self, sql, parametros=()):
+        self.connection._turno_escritura(sql)
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self.connection._fin_si_autocommit()
+
+    def executemany(self, sql, parametros):
+        self.connection._turno_escritura(sql)
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            self.connection._fin_si_autocommit()
+
+class ConexionSQLite(sqlite3.Connection):
+    """Conexión que retiene el turno de escritura hasta el commit o el rollback"""
+
+    def __init__(self, *args, cola: ColaEscritura = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cola = cola or cola_escritura
+        self._escribiendo = False
+
+    def _turno_escritura(self, sql: str):
+        if self._escribiendo or not _es_escritura(sql):
+            return
+        if not self._cola.adquirir():
+            raise sqlite3.OperationalError("database is locked (sin turno en la cola de escritura)")
+        self._escribiendo = True
+
+    async def turno_escritura_async(self):
+        """
+        Desde el event loop: reserva el turno antes de que el hilo del driver
+        (aiosqlite) ejecute la escritura, que ya no tendrá que esperarlo
+        """
+        if self._escribiendo:
+            return
+        if not await self._cola.adquirir_async():
+            raise sqlite3.OperationalError("database is locked (sin turno en la cola de escritura)")
+        self._escribiendo = True
+
+    def _liberar(self):
+        if self._escribiendo:
+            self._escribiendo = False
+            self._cola.liberar()
+
+    def _fin_si_autocommit(self):
+        # Escrituras fuera de transacción (DDL, o BEGIN fallido): el turno acaba ya
+        if self._escribiendo and not self.in_transaction:
+            self._liberar()
+
+    def cursor(self, factory=CursorSQLite):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self._liberar()
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._liberar()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._liberar()
+
+def argumentos_conexion(alto_rendimiento: bool = ALTO_RENDIMIENTO) -> dict:
+    """connect_args de create_engine para SQLite"""
+    argumentos = {"check_same_thread": False}
+    if alto_rendimiento:
+        argumentos["factory"] = ConexionSQLite
+        argumentos["timeout"] = BUSY_TIMEOUT_MS / 1000
+    return argumentos
+
+def aplicar_pragmas(dbapi_connection, connection_record=None):
+    """Listener de "connect": PRAGMAs del perfil de alto rendimiento"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={MMAP_MB * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
@@ -0,0 +1,14 @@
+"""
+Utilidades para respuestas Server-Sent Events (SSE)
+"""
+import json
+
+# Cabeceras para que proxies (Render, nginx) no acumulen el stream
+CABECERAS_SSE = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+def evento_sse(evento: str, datos) -> str:
+    """Formatea un evento SSE con datos en JSON"""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,4 @@
+"""
+Benchmarks de carga y latencia de la API
+Uso: python -m benchmarks.carga --help
+"""
@@ -0,0 +1,113 @@
+"""
+Escenarios de carga: una petición representativa por endpoint
+Cada escenario construye su petición a partir de los datos sembrados y
+de un generador aleatorio con semilla, para que las ejecuciones sean comparables.
+Los escenarios de IA usan el proveedor local; los que generan o borran contenido
+trabajan sobre cursos reservados (cursos_ia, cursos_borrables).
+"""
+import random
+from dataclasses import dataclass
+from typing import Callable, Optional
+from benchmarks.sembrar import DatosSembrados, PASSWORD_BENCH, pdf_sintetico
+
+@dataclass
+class Peticion:
+    metodo: str
+    ruta: str
+    json: Optional[dict] = None
+    data: Optional[dict] = None
+    files: Optional[dict] = None
+    # Campo de la respuesta con una URL que se pide a continuación (GET); la latencia cubre ambas
+    seguir: Optional[str] = None
+    # Repetir el GET de `seguir` hasta que el trabajo termine (estado completado o fallido)
+    sondear: bool = False
+
+@dataclass
+class Escenario:
+    nombre: str
+    router: str
+    construir: Callable[[DatosSembrados, random.Random, int], Peticion]
+    escritura: bool = False
+    # Cada petición elimina un curso de datos.cursos_borrables (hace falta uno por petición)
+    borra_cursos: bool = False
+
+def _curso(datos, aleatorio):
+    return aleatorio.choice(datos.cursos)
+
+def _leccion(datos, aleatorio):
+    return aleatorio.choice(datos.lecciones[_curso(datos, aleatorio)])
+
+def _calificar(datos, aleatorio, i):
+    preguntas = datos.preguntas[_curso(datos, aleatorio)]
+    respuestas = {
+        pregunta_id: correcta if aleatorio.random() < 0.6 else "respuesta incorrecta"
+        for pregunta_id, correcta in preguntas[:10]
+    }
+    return Peticion("POST", "/examenes/calificar",
+                    {"usuario_id": aleatorio.choice(datos.usuarios), "respuestas": respuestas})
+
+def _calificar_feedback_ia(datos, aleatorio, i):
+    # Calificar con feedback del modelo y leer su stream SSE hasta el evento final
+    peticion = _calificar(datos, aleatorio, i)
+    peticion.ruta += "?feedback_ia=true"
+    peticion.seguir = "url_feedback_stream"
+    return peticion
+
+def _crear_curso(datos, aleatorio, i):
+    # PDF distinto en cada petición: sin deduplicación por hash ni aciertos de la caché de IA
+    pdf = pdf_sintetico(aleatorio, 4000)
+    return Peticion("POST", "/cursos/", data={"nombre": f"Bench {i}", "proveedor": "bench",
+                                               "num_lecciones": "5", "num_preguntas": "10"},
+                    files={"archivo": (f"bench-{i}.pdf", pdf, "application/pdf")},
+                    seguir="url_estado", sondear=True)
+
+def _curso_ia(datos, i):
+    # Por turnos: con tantos cursos como clientes, dos peticiones simultáneas no tocan el mismo curso
+    return datos.cursos_ia[i % len(datos.cursos_ia)]
+
+ESCENARIOS = [
+    Escenario("auth_login", "auth", lambda d, a, i: Peticion(
+        "POST", "/auth/login", {"email": a.choice(d.emails), "password": PASSWORD_BENCH})),
+    Escenario("auth_login_simple", "auth", lambda d, a, i: Peticion(
+        "POST", "/auth/login-simple", {"identificador": f"bench-{i % 50}", "nombre": "Bench"}), escritura=True),
+    Escenario("cursos_listar", "cursos", lambda d, a, i: Peticion("GET", "/cursos/")),
+    Escenario("cursos_detalle", "cursos", lambda d, a, i: Peticion("GET", f"/cursos/{_curso(d, a)}")),
+    Escenario("lecciones_detalle", "lecciones", lambda d, a, i: Peticion("GET", f"/lecciones/{_leccion(d, a)}")),
+    Escenario("lecciones_curso", "lecciones", lambda d, a, i: Peticion(
+        "GET", f"/lecciones/curso/{_curso(d, a)}/lecciones")),
+    Escenario("lecciones_progreso", "lecciones", lambda d, a, i: Peticion(
+        "GET", f"/lecciones/curso/{_curso(d, a)}/progreso/{a.choice(d.usuarios)}")),
+    Escenario("lecciones_resumen", "lecciones", lambda d, a, i: Peticion(
+        "GET", f"/lecciones/curso/{_curso(d, a)}/resumen/{a.choice(d.usuarios)}")),
+    Escenario("lecciones_completar", "lecciones", lambda d, a, i: Peticion(
+        "POST", "/lecciones/completar",
+        {"usuario_id": a.choice(d.usuarios), "leccion_id": _leccion(d, a),
+         "tiempo_dedicado": a.randint(30, 600)}), escritura=True),
+    Escenario("examenes_quiz_curso", "examenes", lambda d, a, i: Peticion(
+        "GET", f"/examenes/curso/{_curso(d, a)}/quiz")),
+    Escenario("examenes_quiz_leccion", "examenes", lambda d, a, i: Peticion(
+        "GET", f"/examenes/leccion/{_leccion(d, a)}/quiz")),
+    Escenario("examenes_calificar", "examenes", _calificar, escritura=True),
+    Escenario("examenes_intento", "examenes", lambda d, a, i: Peticion(
+        "GET", f"/examenes/intentos/{a.choice(d.intentos)}")),
+    Escenario("examenes_feedback_stream", "examenes", _calificar_feedback_ia, escritura=True),
+    Escenario("examenes_regenerar", "examenes", lambda d, a, i: Peticion(
+        "POST", f"/examenes/curso/{_curso_ia(d, i)}/regenerar?cantidad=10"), escritura=True),
+    Escenario("lecciones_generar_stream", "lecciones", lambda d, a, i: Peticion(
+        "POST", f"/lecciones/curso/{_curso_ia(d, i)}/generar/stream?num_lecciones=5"), escritura=True),
+    Escenario("cursos_trabajo", "cursos", lambda d, a, i: Peticion(
+        "GET", f"/cursos/trabajos/{a.choice(d.trabajos)}")),
+    Escenario("cursos_crear", "cursos", _crear_curso, escritura=True),
+    Escenario("cursos_eliminar", "cursos", lambda d, a, i: Peticion(
+        "DELETE", f"/cursos/{d.cursos_borrables[i % len(d.cursos_borrables)]}"), escritura=True, borra_cursos=True),
+]
+
+def seleccionar(nombres: Optional[str]) -> list:
+    """Filtra por nombre de escenario o de router ("cursos,examenes_calificar")"""
+    if not nombres:
+        return ESCENARIOS
+    elegidos = {n.strip() for n in nombres.split(",") if n.strip()}
+    seleccion = [e for e in ESCENARIOS if e.nombre in elegidos or e.router in elegidos]
+    if not seleccion:
+        raise ValueError(f"Ningún escenario coincide con: {nombres}")
+    return seleccion
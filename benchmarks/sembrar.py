@@ -0,0 +1,221 @@
+"""
+Datos sintéticos para los benchmarks
+Inserta cursos, lecciones, preguntas, usuarios, progreso, trabajos e intentos de
+examen en volúmenes configurables, y genera PDFs con texto extraíble
+"""
+import random
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from app.models.database import (
+    Curso, Leccion, Pregunta, Usuario, ProgresoLeccion, Progreso, CursoContenido, TrabajoCurso,
+    IntentoExamenGuardado
+)
+from app.utils.compresion import comprimir_texto
+from app.utils.migraciones import reconstruir_resumenes_progreso
+from app.utils.security import hash_password
+
+PASSWORD_BENCH = "bench-password"
+LOTE = 1000
+
+_PALABRAS = ["datos", "red", "sistema", "proceso", "modelo", "servidor", "cliente", "protocolo",
+             "memoria", "algoritmo", "seguridad", "nube", "sensor", "latencia", "capa"]
+
+@dataclass
+class Volumenes:
+    cursos: int = 20
+    lecciones_por_curso: int = 10
+    preguntas_por_curso: int = 20
+    usuarios: int = 100
+    progreso_por_usuario: int = 20  # Lecciones completadas y respuestas de examen por usuario
+    tamano_texto: int = 20000  # Caracteres de texto de origen por curso
+    intentos: int = 200  # Intentos de examen con el feedback ya generado
+    # Cursos aparte para los escenarios que modifican el contenido (regenerar, generar lecciones)
+    # y para los que lo eliminan: no alteran los cursos que leen los demás escenarios
+    cursos_ia: int = 10
+    cursos_borrables: int = 0
+
+@dataclass
+class DatosSembrados:
+    """IDs generados, para que los escenarios pidan recursos que existen"""
+    cursos: List[int] = field(default_factory=list)
+    lecciones: Dict[int, List[int]] = field(default_factory=dict)
+    preguntas: Dict[int, List[Tuple[int, str]]] = field(default_factory=dict)  # curso -> [(id, correcta)]
+    usuarios: List[int] = field(default_factory=list)
+    emails: List[str] = field(default_factory=list)
+    trabajos: List[str] = field(default_factory=list)
+    intentos: List[str] = field(default_factory=list)
+    cursos_ia: List[int] = field(default_factory=list)
+    cursos_borrables: List[int] = field(default_factory=list)
+
+def _texto(aleatorio: random.Random, tamano: int) -> str:
+    palabras = []
+    longitud = 0
+    while longitud < tamano:
+        palabra = aleatorio.choice(_PALABRAS)
+        palabras.append(palabra)
+        longitud += len(palabra) + 1
+    return " ".join(palabras)[:tamano]
+
+def pdf_sintetico(aleatorio: random.Random, tamano: int, caracteres_linea: int = 80,
+                  lineas_pagina: int = 50) -> bytes:
+    """PDF mínimo (Helvetica, sin compresión) con `tamano` caracteres de texto extraíble"""
+    texto = _texto(aleatorio, tamano)
+    lineas = [texto[i:i + caracteres_linea] for i in range(0, len(texto), caracteres_linea)] or [""]
+    paginas = [lineas[i:i + lineas_pagina] for i in range(0, len(lineas), lineas_pagina)]
+
+    # 1 catálogo, 2 árbol de páginas, 3 fuente; luego página y contenido por cada página
+    objetos = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(paginas))), len(paginas)),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for i, pagina in enumerate(paginas):
+        flujo = "BT /F1 10 Tf 20 770 Td 12 TL " + " ".join(f"({linea}) Tj T*" for linea in pagina) + " ET"
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {5 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        objetos.append(f"<< /Length {len(flujo)} >>\nstream\n{flujo}\nendstream")
+
+    pdf = b"%PDF-1.4\n"
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(pdf))
+        pdf += f"{numero} 0 obj\n{objeto}\nendobj\n".encode("latin-1")
+    inicio_xref = len(pdf)
+    pdf += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{posicion:010d} 00000 n \n" for posicion in posiciones).encode()
+    pdf += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    return pdf
+
+def _insertar(db: Session, modelo, filas: List[dict]):
+    for inicio in range(0, len(filas), LOTE):
+        db.execute(insert(modelo), filas[inicio:inicio + LOTE])
+
+def _sembrar_cursos(db: Session, aleatorio: random.Random, volumenes: Volumenes, datos: DatosSembrados,
+                    cantidad: int, prefijo: str = "Curso") -> List[int]:
+    """Cursos con su texto, lecciones y preguntas; devuelve sus IDs"""
+    if cantidad <= 0:
+        return []
+    primero = db.scalar(select(Curso.id).order_by(Curso.id.desc()).limit(1)) or 0
+    _insertar(db, Curso, [{"nombre": f"{prefijo} {i}", "proveedor": "bench"} for i in range(cantidad)])
+    cursos = list(db.scalars(select(Curso.id).where(Curso.id > primero).order_by(Curso.id)))
+    textos = [_texto(aleatorio, volumenes.tamano_texto) for _ in cursos]
+    _insertar(db, CursoContenido, [
+        {"curso_id": curso_id, "compresion": "zlib", "texto_comprimido": comprimir_texto(texto),
+         "tamano_original": len(texto)}
+        for curso_id, texto in zip(cursos, textos)
+    ])
+
+    _insertar(db, Leccion, [
+        {
+            "curso_id": curso_id,
+            "titulo": f"Lección {orden}: {_texto(aleatorio, 30)}",
+            "orden": orden,
+            "contenido_markdown": _texto(aleatorio, 500),
+            "ejemplos_codigo": [],
+            "puntos_clave": [_texto(aleatorio, 40) for _ in range(3)],
+            "duracion_estimada": 5
+        }
+        for curso_id in cursos
+        for orden in range(1, volumenes.lecciones_por_curso + 1)
+    ])
+    for curso_id, leccion_id in db.execute(
+        select(Leccion.curso_id, Leccion.id).where(Leccion.curso_id.in_(cursos)).order_by(Leccion.id)
+    ):
+        datos.lecciones.setdefault(curso_id, []).append(leccion_id)
+
+    filas_preguntas = []
+    for curso_id in cursos:
+        for _ in range(volumenes.preguntas_por_curso):
+            opciones = [_texto(aleatorio, 12) for _ in range(4)]
+            filas_preguntas.append({
+                "curso_id": curso_id,
+                "tipo": "multiple",
+                "texto_pregunta": _texto(aleatorio, 80) + "?",
+                "opciones_json": opciones,
+                "respuesta_correcta": opciones[0],
+                "explicacion_feedback": _texto(aleatorio, 120),
+                "dificultad": "media"
+            })
+    _insertar(db, Pregunta, filas_preguntas)
+    for curso_id, pregunta_id, correcta in db.execute(
+        select(Pregunta.curso_id, Pregunta.id, Pregunta.respuesta_correcta)
+        .where(Pregunta.curso_id.in_(cursos)).order_by(Pregunta.id)
+    ):
+        datos.preguntas.setdefault(curso_id, []).append((pregunta_id, correcta))
+    return cursos
+
+def sembrar(db: Session, volumenes: Volumenes, semilla: int = 42) -> DatosSembrados:
+    """Inserta los datos en una BD vacía y devuelve sus IDs"""
+    aleatorio = random.Random(semilla)
+    datos = DatosSembrados()
+    datos.cursos = _sembrar_cursos(db, aleatorio, volumenes, datos, volumenes.cursos)
+
+    # bcrypt es lento a propósito: un solo hash compartido por todos los usuarios
+    password_hash = hash_password(PASSWORD_BENCH)
+    datos.emails = [f"usuario{i}@bench.local" for i in range(volumenes.usuarios)]
+    _insertar(db, Usuario, [
+        {"email": email, "nombre": f"Usuario {i}", "password_hash": password_hash, "tipo_auth": "password"}
+        for i, email in enumerate(datos.emails)
+    ])
+    datos.usuarios = list(db.scalars(select(Usuario.id).order_by(Usuario.id)))
+
+    todas_lecciones = [lid for ids in datos.lecciones.values() for lid in ids]
+    todas_preguntas = [p for ps in datos.preguntas.values() for p in ps]
+    filas_lecciones, filas_progreso = [], []
+    for usuario_id in datos.usuarios:
+        for leccion_id in aleatorio.sample(todas_lecciones, min(volumenes.progreso_por_usuario, len(todas_lecciones))):
+            filas_lecciones.append({"usuario_id": usuario_id, "leccion_id": leccion_id,
+                                    "completada": True, "tiempo_dedicado": aleatorio.randint(60, 900)})
+        for pregunta_id, correcta in aleatorio.sample(todas_preguntas, min(volumenes.progreso_por_usuario, len(todas_preguntas))):
+            acierto = aleatorio.random() < 0.7
+            filas_progreso.append({"usuario_id": usuario_id, "pregunta_id": pregunta_id,
+                                   "respuesta_elegida": correcta if acierto else "otra",
+                                   "es_correcto": acierto, "intentos": 1})
+    _insertar(db, ProgresoLeccion, filas_lecciones)
+    _insertar(db, Progreso, filas_progreso)
+
+    # Un trabajo de creación terminado por curso, para consultar su estado
+    datos.trabajos = [f"{aleatorio.getrandbits(128):032x}" for _ in datos.cursos]
+    _insertar(db, TrabajoCurso, [
+        {"id": trabajo_id, "nombre": f"Curso {i}", "proveedor": "bench", "ruta_pdf": "bench.pdf",
+         "estado": "completado", "etapa": "completado", "progreso": 100, "intentos": 1, "curso_id": curso_id,
+         "lecciones_generadas": volumenes.lecciones_por_curso, "preguntas_generadas": volumenes.preguntas_por_curso}
+        for i, (trabajo_id, curso_id) in enumerate(zip(datos.trabajos, datos.cursos))
+    ])
+
+    filas_intentos = []
+    for _ in range(volumenes.intentos if datos.cursos else 0):
+        curso_id = aleatorio.choice(datos.cursos)
+        preguntas = datos.preguntas.get(curso_id, [])[:10]
+        aciertos = [aleatorio.random() < 0.7 for _ in preguntas]
+        nota = int(sum(aciertos) / len(preguntas) * 100) if preguntas else 0
+        filas_intentos.append({
+            "id": f"{aleatorio.getrandbits(128):032x}", "usuario_id": aleatorio.choice(datos.usuarios),
+            "curso_id": curso_id, "nota": nota, "correctas": sum(aciertos),
+            "incorrectas": len(preguntas) - sum(aciertos), "temas_fallados": [],
+            "detalles": [{"pregunta_id": pregunta_id, "es_correcta": acierto}
+                         for (pregunta_id, _), acierto in zip(preguntas, aciertos)],
+            "estado_feedback": "completado", "feedback": _texto(aleatorio, 200),
+            "fecha_creacion": datetime.now(), "fecha_feedback": datetime.now()
+        })
+    _insertar(db, IntentoExamenGuardado, filas_intentos)
+    datos.intentos = [fila["id"] for fila in filas_intentos]
+
+    # Con su propio generador: los datos anteriores no cambian al variar estos volúmenes
+    extra = random.Random(f"{semilla}-extra")
+    datos.cursos_ia = _sembrar_cursos(db, extra, volumenes, datos, volumenes.cursos_ia, prefijo="Curso IA")
+    datos.cursos_borrables = _sembrar_cursos(db, extra, volumenes, datos, volumenes.cursos_borrables,
+                                             prefijo="Curso borrable")
+    _insertar(db, ProgresoLeccion, [
+        {"usuario_id": extra.choice(datos.usuarios), "leccion_id": leccion_id, "completada": True,
+         "tiempo_dedicado": extra.randint(60, 900)}
+        for curso_id in datos.cursos_borrables for leccion_id in datos.lecciones[curso_id][:3]
+    ] if datos.usuarios else [])
+
+    db.commit()
+    reconstruir_resumenes_progreso(db.get_bind())
+    return datos
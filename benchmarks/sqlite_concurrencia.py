@@ -0,0 +1,185 @@
+"""
+Lecturas y escrituras concurrentes sobre SQLite: perfil por defecto vs alto rendimiento
+Hilos que mezclan lecturas de progreso con las escrituras de /lecciones/completar
+y /examenes/calificar (los servicios síncronos de la app, sin HTTP), durante un
+tiempo fijo. Cada perfil corre en su propio proceso porque el engine se
+configura al importar la app.
+
+    python -m benchmarks.sqlite_concurrencia
+    python -m benchmarks.sqlite_concurrencia --hilos 32 --duracion 10 --escrituras 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+PERFILES = {"por_defecto": "false", "alto_rendimiento": "true"}
+
+def _percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    return round(ordenadas[min(len(ordenadas) - 1, int(round(p * (len(ordenadas) - 1))))], 2)
+
+def _resumir(latencias, errores, duracion):
+    ordenadas = sorted(latencias)
+    return {
+        "operaciones": len(ordenadas),
+        "por_segundo": round(len(ordenadas) / duracion, 1),
+        "p50_ms": _percentil(ordenadas, 0.50),
+        "p99_ms": _percentil(ordenadas, 0.99),
+        "errores": errores
+    }
+
+def ejecutar_perfil(args) -> dict:
+    """Siembra una BD nueva y lanza la carga mixta con la configuración del entorno"""
+    from sqlalchemy import select, update, and_
+    from sqlalchemy.exc import OperationalError
+    from app.models.database import Leccion, ProgresoLeccion
+    from app.utils.database import engine, Base, SessionLocal
+    from app.utils.sqlite_rendimiento import cola_escritura, ALTO_RENDIMIENTO
+    from app.services.calificacion_service import calificar_respuestas, guardar_progreso
+    from app.services.progreso_service import registrar_actividad
+    from benchmarks.sembrar import Volumenes, sembrar
+    import app.models.database  # noqa: F401  (registra los modelos en Base)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        datos = sembrar(db, Volumenes(usuarios=args.usuarios, tamano_texto=1000), semilla=args.semilla)
+    finally:
+        db.close()
+
+    muestras = {"lectura": [], "escritura": []}
+    errores = {"lectura": 0, "escritura": 0}
+    detalle_errores = {}
+    cerrojo = threading.Lock()
+    fin = time.perf_counter() + args.duracion
+
+    def leer(db, aleatorio):
+        # La consulta de /lecciones/curso/{id}/progreso/{usuario}
+        usuario_id = aleatorio.choice(datos.usuarios)
+        db.execute(select(
+            Leccion.id, Leccion.titulo, Leccion.orden,
+            ProgresoLeccion.completada, ProgresoLeccion.tiempo_dedicado
+        ).outerjoin(
+            ProgresoLeccion,
+            and_(ProgresoLeccion.leccion_id == Leccion.id, ProgresoLeccion.usuario_id == usuario_id)
+        ).where(Leccion.curso_id == aleatorio.choice(datos.cursos)).order_by(Leccion.orden, Leccion.id)).all()
+
+    def escribir(db, aleatorio):
+        curso_id = aleatorio.choice(datos.cursos)
+        usuario_id = aleatorio.choice(datos.usuarios)
+        if aleatorio.random() < 0.5:
+            # Lo que escribe /lecciones/completar: tiempo de la lección y resumen del curso
+            tiempo = aleatorio.randint(30, 600)
+            db.execute(update(ProgresoLeccion).where(
+                ProgresoLeccion.usuario_id == usuario_id,
+                ProgresoLeccion.leccion_id == aleatorio.choice(datos.lecciones[curso_id])
+            ).values(tiempo_dedicado=ProgresoLeccion.tiempo_dedicado + tiempo))
+            registrar_actividad(db, usuario_id, curso_id, tiempo=tiempo)
+            db.commit()
+        else:
+            respuestas = {pid: correcta for pid, correcta in datos.preguntas[curso_id][:10]}
+            calificacion = calificar_respuestas(db, respuestas)
+            guardar_progreso(db, usuario_id, calificacion["resultados"])
+            db.commit()
+
+    def hilo(numero):
+        aleatorio = random.Random(f"{args.semilla}-{numero}")
+        while time.perf_counter() < fin:
+            tipo = "escritura" if aleatorio.random() < args.escrituras else "lectura"
+            db = SessionLocal()
+            inicio = time.perf_counter()
+            try:
+                (escribir if tipo == "escritura" else leer)(db, aleatorio)
+                ok = True
+            except OperationalError as e:
+                db.rollback()
+                ok = False
+                motivo = str(e.orig)
+            finally:
+                db.close()
+            latencia = (time.perf_counter() - inicio) * 1000
+            with cerrojo:
+                if ok:
+                    muestras[tipo].append(latencia)
+                else:
+                    errores[tipo] += 1
+                    detalle_errores[motivo] = detalle_errores.get(motivo, 0) + 1
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=hilo, args=(i,)) for i in range(args.hilos)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "alto_rendimiento": ALTO_RENDIMIENTO,
+        "duracion_s": round(duracion, 2),
+        "lecturas": _resumir(muestras["lectura"], errores["lectura"], duracion),
+        "escrituras": _resumir(muestras["escritura"], errores["escritura"], duracion),
+        "errores": detalle_errores,
+        "cola_escritura": cola_escritura.estadisticas() if ALTO_RENDIMIENTO else None
+    }
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrencia de SQLite: perfil por defecto vs alto rendimiento")
+    parser.add_argument("--perfil", choices=sorted(PERFILES), default=None,
+                        help="Ejecutar solo un perfil en este proceso (uso interno)")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=5, help="Segundos de carga por perfil")
+    parser.add_argument("--escrituras", type=float, default=0.3, help="Fracción de operaciones que escriben")
+    parser.add_argument("--usuarios", type=int, default=100)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default=None, help="Fichero JSON de resultados")
+    return parser.parse_args(argv)
+
+def _fila(nombre, resumen):
+    return (f"{nombre:<18} {resumen['por_segundo']:>10} {str(resumen['p50_ms']):>9} "
+            f"{str(resumen['p99_ms']):>9} {resumen['errores']:>8}")
+
+def main(argv=None):
+    args = _argumentos(argv)
+    if args.perfil:
+        print(json.dumps(ejecutar_perfil(args), ensure_ascii=False))
+        return
+
+    resultados = {}
+    for perfil, valor in PERFILES.items():
+        with tempfile.TemporaryDirectory() as directorio:
+            entorno = {**os.environ,
+                       "DATABASE_URL": f"sqlite:///{os.path.join(directorio, 'concurrencia.db')}",
+                       "SQLITE_ALTO_RENDIMIENTO": valor, "AI_PROVEEDOR": "local"}
+            print(f"🔁 Perfil {perfil}: {args.hilos} hilos, {args.duracion}s, {args.escrituras:.0%} escrituras")
+            salida = subprocess.run(
+                [sys.executable, "-m", "benchmarks.sqlite_concurrencia", "--perfil", perfil,
+                 "--hilos", str(args.hilos), "--duracion", str(args.duracion),
+                 "--escrituras", str(args.escrituras), "--usuarios", str(args.usuarios),
+                 "--semilla", str(args.semilla)],
+                env=entorno, capture_output=True, text=True, check=True
+            ).stdout
+            resultados[perfil] = json.loads(salida.strip().splitlines()[-1])
+
+    print(f"\n{'perfil / tipo':<18} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errores':>8}")
+    for perfil, resultado in resultados.items():
+        print(_fila(f"{perfil[:9]} lect.", resultado["lecturas"]))
+        print(_fila(f"{perfil[:9]} escr.", resultado["escrituras"]))
+        if resultado["errores"]:
+            print(f"   ⚠️ {resultado['errores']}")
+        if resultado["cola_escritura"]:
+            print(f"   🚦 cola de escritura: {resultado['cola_escritura']}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados guardados en {args.salida}")
+
+if __name__ == "__main__":
+    sys.exit(main())
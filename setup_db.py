@@ -1,9 +1,10 @@
-from models import *
-from database import engine, Base
+from app.utils.database import engine
+from app.utils.migraciones import aplicar_migraciones, verificar_indices
 import sqlalchemy
 
-# Crear todas las tablas
-Base.metadata.create_all(bind=engine)
+# Crear o actualizar el esquema con las migraciones versionadas
+aplicar_migraciones(engine)
+verificar_indices(engine)
 
 print('✅ Base de datos creada con éxito')
 print('\nTablas creadas:')